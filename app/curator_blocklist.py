@@ -2,6 +2,8 @@ import json
 import logging
 import re
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from typing import Optional
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
@@ -13,6 +15,15 @@ CURATOR_ID_RE = re.compile(r"/curator/(\d+)")
 RSS_NEXT_RE = re.compile(r'<atom:link[^>]*rel="next"[^>]*href="([^"]+)"', re.IGNORECASE)
 
 
+@dataclass(frozen=True)
+class _CachedPage:
+    appids: frozenset[int]
+    next_url: str = ""
+    etag: str = ""
+    last_modified: str = ""
+    empty: bool = False
+
+
 class SteamCuratorBlocklist:
     def __init__(self, curator_url: str, refresh_seconds: int = 3600, max_pages: int = 0, timeout_seconds: int = 15):
         self.curator_url = curator_url.strip()
@@ -23,19 +34,46 @@ class SteamCuratorBlocklist:
         self.logger = logging.getLogger(self.__class__.__name__)
         self._cached_appids: set[int] = set()
         self._last_refresh_monotonic: Optional[float] = None
+        self._session = requests.Session()
+        self._pages: dict[str, _CachedPage] = {}
+        self._not_modified_count = 0
+        self._downloaded_count = 0
+
+    @property
+    def source(self) -> str:
+        curator_id = self._extract_curator_id(self.curator_url)
+        return f"curator:{curator_id or self.curator_url}"
+
+    def is_due(self, now: Optional[float] = None) -> bool:
+        if not self.curator_url:
+            return False
+        now = time.monotonic() if now is None else now
+        return self._last_refresh_monotonic is None or now - self._last_refresh_monotonic >= self.refresh_seconds
 
     def get_appids(self) -> set[int]:
         if not self.curator_url:
             return set()
 
-        now = time.monotonic()
-        if self._last_refresh_monotonic is None or now - self._last_refresh_monotonic >= self.refresh_seconds:
-            self._cached_appids = self._refresh()
-            self._last_refresh_monotonic = now
+        if self.is_due():
+            self.refresh()
+        return set(self._cached_appids)
+
+    @property
+    def has_snapshot(self) -> bool:
+        return self._last_refresh_monotonic is not None
+
+    def get_cached_appids(self) -> set[int]:
+        return set(self._cached_appids)
+
+    def refresh(self) -> set[int]:
+        self._cached_appids = self._refresh()
+        self._last_refresh_monotonic = time.monotonic()
         return set(self._cached_appids)
 
     def _refresh(self) -> set[int]:
         appids: set[int] = set()
+        self._not_modified_count = 0
+        self._downloaded_count = 0
 
         curator_id = self._extract_curator_id(self.curator_url)
         if curator_id:
@@ -53,7 +91,13 @@ class SteamCuratorBlocklist:
         if html_appids:
             self.logger.info("Curator html sync: %s appids", len(html_appids))
 
-        self.logger.info("Curator blocklist refreshed: %s appids total", len(appids))
+        self.logger.info(
+            "Curator blocklist refreshed: %s appids total (%s), pages downloaded=%s not_modified=%s",
+            len(appids),
+            self.curator_url,
+            self._downloaded_count,
+            self._not_modified_count,
+        )
         return appids
 
     def _fetch_via_ajax(self, curator_id: str) -> set[int]:
@@ -114,15 +158,14 @@ class SteamCuratorBlocklist:
                 continue
             visited.add(current)
 
-            xml = self._fetch_text(current)
-            if not xml:
+            page = self._fetch_page(current)
+            if page is None:
                 continue
 
-            appids.update(self._extract_appids(xml))
+            appids.update(page.appids)
 
-            next_url = self._extract_rss_next_link(xml)
-            if next_url and next_url not in visited:
-                pending.append(next_url)
+            if page.next_url and page.next_url not in visited:
+                pending.append(page.next_url)
 
         return appids
 
@@ -135,14 +178,14 @@ class SteamCuratorBlocklist:
         consecutive_no_new = 0
 
         for page in range(1, max_steps + 1):
-            html = self._fetch_text(self._with_page(url, page))
-            if not html:
+            cached_page = self._fetch_page(self._with_page(url, page))
+            if cached_page is None:
                 consecutive_no_new += 1
                 if page > 1 and consecutive_no_new >= 3:
                     break
                 continue
 
-            page_appids = self._extract_appids(html)
+            page_appids = set(cached_page.appids)
             new_count = len(page_appids - appids)
             appids.update(page_appids)
 
@@ -156,18 +199,43 @@ class SteamCuratorBlocklist:
 
         return appids
 
-    def _fetch_text(self, url: str) -> str:
+    def _fetch_page(self, url: str) -> Optional[_CachedPage]:
+        cached = self._pages.get(url)
+        headers: dict[str, str] = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
         try:
-            response = requests.get(url, timeout=self.timeout_seconds)
+            response = self._session.get(url, headers=headers, timeout=self.timeout_seconds)
+            if response.status_code == 304 and cached is not None:
+                self._not_modified_count += 1
+                return None if cached.empty else cached
             response.raise_for_status()
-            return response.text
+            text = response.text
         except Exception:
             self.logger.exception("Failed to fetch curator text url: %s", url)
-            return ""
+            return None
+
+        self._downloaded_count += 1
+        page = _CachedPage(
+            appids=frozenset(self._extract_appids(text)),
+            next_url=self._extract_rss_next_link(text),
+            etag=response.headers.get("ETag", ""),
+            last_modified=response.headers.get("Last-Modified", ""),
+            empty=not text,
+        )
+        if page.etag or page.last_modified:
+            self._pages[url] = page
+        else:
+            self._pages.pop(url, None)
+        return None if page.empty else page
 
     def _fetch_json(self, url: str, params: dict) -> Optional[dict]:
         try:
-            response = requests.get(url, params=params, timeout=self.timeout_seconds)
+            response = self._session.get(url, params=params, timeout=self.timeout_seconds)
             response.raise_for_status()
             return response.json()
         except Exception:
@@ -235,3 +303,86 @@ class SteamCuratorBlocklist:
         query["p"] = [str(page)]
         normalized_query = urlencode(query, doseq=True)
         return urlunparse(parsed._replace(query=normalized_query))
+
+
+class CuratorBlocklistGroup:
+    def __init__(
+        self,
+        curator_urls: list[str],
+        refresh_seconds: int = 3600,
+        max_pages: int = 0,
+        timeout_seconds: int = 15,
+        wait_seconds: float = 15.0,
+    ):
+        urls = list(dict.fromkeys(url.strip() for url in curator_urls if url and url.strip()))
+        self.curators = [
+            SteamCuratorBlocklist(
+                curator_url=url,
+                refresh_seconds=refresh_seconds,
+                max_pages=max_pages,
+                timeout_seconds=timeout_seconds,
+            )
+            for url in urls
+        ]
+        # How long get_appids waits for in-flight refreshes before answering
+        # from the previous snapshot of the slow curators. A curator without
+        # any snapshot yet is always waited for, so its games are never
+        # treated as unblocked.
+        self.wait_seconds = max(wait_seconds, 0.0)
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(self.curators), 1),
+            thread_name_prefix="curator-refresh",
+        )
+        self._in_flight: dict[int, Future] = {}
+
+    def get_appids(self) -> set[int]:
+        return set(self.get_attributed_appids())
+
+    def get_attributed_appids(self) -> dict[int, str]:
+        by_source = self.get_appids_by_source()
+        attributed: dict[int, list[str]] = {}
+        for source in sorted(by_source):
+            for appid in by_source[source]:
+                attributed.setdefault(appid, []).append(source)
+        return {appid: ",".join(sources) for appid, sources in attributed.items()}
+
+    def get_appids_by_source(self) -> dict[str, set[int]]:
+        if not self.curators:
+            return {}
+
+        now = time.monotonic()
+        for idx, curator in enumerate(self.curators):
+            if idx in self._in_flight or not curator.is_due(now):
+                continue
+            self._in_flight[idx] = self._executor.submit(curator.refresh)
+
+        first_refreshes = [
+            future for idx, future in self._in_flight.items() if not self.curators[idx].has_snapshot
+        ]
+        if first_refreshes:
+            wait(first_refreshes)
+        if self._in_flight:
+            wait(list(self._in_flight.values()), timeout=self.wait_seconds)
+
+        for idx, future in list(self._in_flight.items()):
+            if not future.done():
+                self.logger.warning(
+                    "Curator refresh still running, using previous snapshot: %s",
+                    self.curators[idx].curator_url,
+                )
+                continue
+            del self._in_flight[idx]
+            error = future.exception()
+            if error is not None:
+                self.logger.error(
+                    "Curator refresh failed: %s",
+                    self.curators[idx].curator_url,
+                    exc_info=error,
+                )
+
+        by_source: dict[str, set[int]] = {}
+        for curator in self.curators:
+            by_source.setdefault(curator.source, set()).update(curator.get_cached_appids())
+        return by_source
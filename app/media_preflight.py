@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+
+# Bot API limits for media sent by URL: photos up to 5 MB, other files up
+# to 20 MB, and sendMediaGroup only accepts mp4 for "video" items.
+PHOTO_MAX_BYTES = 5 * 1024 * 1024
+VIDEO_MAX_BYTES = 20 * 1024 * 1024
+PHOTO_CONTENT_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp"}
+VIDEO_CONTENT_TYPES = {"video/mp4"}
+
+
+@dataclass(frozen=True)
+class MediaCheck:
+    ok: bool
+    reason: str = ""
+    content_type: str = ""
+    size: int | None = None
+
+
+class MediaPreflight:
+    def __init__(
+        self,
+        timeout_seconds: float = 5.0,
+        ttl_seconds: float = 6 * 3600,
+        failure_ttl_seconds: float = 600,
+        max_workers: int = 8,
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="media-preflight")
+        self._session = requests.Session()
+        self._cache: dict[tuple[str, str], tuple[MediaCheck, float]] = {}
+        self._lock = threading.Lock()
+
+    def check_many(self, media: dict[str, str]) -> dict[str, MediaCheck]:
+        # `media` maps URL -> "photo" | "video"; all uncached URLs are
+        # checked concurrently.
+        results: dict[str, MediaCheck] = {}
+        pending = {}
+        now = time.monotonic()
+        with self._lock:
+            for url, kind in media.items():
+                cached = self._cache.get((url, kind))
+                if cached is not None and cached[1] > now:
+                    results[url] = cached[0]
+                else:
+                    pending[url] = kind
+        futures = {url: self._executor.submit(self._check, url, kind) for url, kind in pending.items()}
+        for url, future in futures.items():
+            check = future.result()
+            ttl = self.ttl_seconds if check.ok else self.failure_ttl_seconds
+            with self._lock:
+                self._cache[(url, pending[url])] = (check, time.monotonic() + ttl)
+            if not check.ok:
+                self.logger.info("Media preflight rejected %s: %s", url, check.reason)
+            results[url] = check
+        return results
+
+    def _check(self, url: str, kind: str) -> MediaCheck:
+        try:
+            response = self._session.head(url, allow_redirects=True, timeout=self.timeout_seconds)
+            if response.status_code in (403, 405, 501):
+                # Some CDNs refuse HEAD; a one-byte ranged GET returns the same headers.
+                response = self._session.get(
+                    url,
+                    headers={"Range": "bytes=0-0"},
+                    allow_redirects=True,
+                    stream=True,
+                    timeout=self.timeout_seconds,
+                )
+                response.close()
+        except Exception as exc:
+            return MediaCheck(ok=False, reason=f"request failed: {exc.__class__.__name__}")
+
+        if response.status_code >= 400:
+            return MediaCheck(ok=False, reason=f"HTTP {response.status_code}")
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        size = self._content_size(response.headers)
+        allowed_types = VIDEO_CONTENT_TYPES if kind == "video" else PHOTO_CONTENT_TYPES
+        max_bytes = VIDEO_MAX_BYTES if kind == "video" else PHOTO_MAX_BYTES
+        if content_type and content_type not in allowed_types:
+            return MediaCheck(ok=False, reason=f"content-type {content_type}", content_type=content_type, size=size)
+        if size is not None and size > max_bytes:
+            return MediaCheck(ok=False, reason=f"size {size} > {max_bytes}", content_type=content_type, size=size)
+        return MediaCheck(ok=True, content_type=content_type, size=size)
+
+    @staticmethod
+    def _content_size(headers) -> int | None:
+        content_range = headers.get("Content-Range", "")
+        if "/" in content_range:
+            total = content_range.rsplit("/", 1)[1].strip()
+            if total.isdigit():
+                return int(total)
+        length = headers.get("Content-Length", "")
+        return int(length) if length.isdigit() else None
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from app.publish_queue import TelegramPublishQueue
+from app.repository import OutboxPost, StateRepository
+from app.steam import DealMedia, SteamClient
+from app.telegram_client import TelegramPublisher
+
+
+class CircuitBreaker:
+    # closed -> open after `failure_threshold` consecutive failures; after
+    # `reset_seconds` a single trial post is let through (half-open) and its
+    # outcome closes or re-opens the breaker.
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 60.0):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = max(reset_seconds, 0.0)
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.state == "closed"
+
+    def allow_trial(self) -> bool:
+        # Half-open: true once, until the trial post has an outcome.
+        if self.state != "half-open" or self._trial:
+            return False
+        self._trial = True
+        return True
+
+    def record_trial_skipped(self) -> None:
+        self._trial = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+
+
+class OutboxPublisher:
+    def __init__(
+        self,
+        repository: StateRepository,
+        steam: SteamClient,
+        telegram: TelegramPublisher,
+        publish_queue: TelegramPublishQueue,
+        batch_size: int = 10,
+        lease_seconds: int = 300,
+        poll_seconds: float = 5.0,
+        max_attempts: int = 8,
+        backoff_base_seconds: float = 30.0,
+        backoff_max_seconds: float = 3600.0,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_seconds: float = 120.0,
+    ):
+        self.repository = repository
+        self.steam = steam
+        self.telegram = telegram
+        self.publish_queue = publish_queue
+        self.batch_size = max(batch_size, 1)
+        self.lease_seconds = max(lease_seconds, 30)
+        # Posts wait in the per-chat lanes for minutes under the rate limit;
+        # their leases are renewed well before they run out.
+        self.renew_seconds = self.lease_seconds / 3
+        self.poll_seconds = max(poll_seconds, 0.1)
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff_base_seconds = max(backoff_base_seconds, 1.0)
+        self.backoff_max_seconds = max(backoff_max_seconds, self.backoff_base_seconds)
+        self.breaker_failure_threshold = breaker_failure_threshold
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._channels = {channel.chat_id: channel for channel in telegram.channels}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._in_flight: dict[Future, OutboxPost] = {}
+        # appid -> media fetch shared by the posts of that deal in flight.
+        self._media: dict[int, Future] = {}
+        self._media_lock = threading.Lock()
+        self._renewed_at = time.monotonic()
+
+    def run_forever(self, stop_event: threading.Event | None = None) -> None:
+        stop_event = stop_event or threading.Event()
+        self.logger.info("Outbox publisher started. chats=%s", list(self._channels))
+        while not stop_event.is_set():
+            try:
+                handled = self.drain_once()
+            except Exception:
+                self.logger.exception("Outbox drain failed")
+                handled = 0
+            if not handled:
+                stop_event.wait(self.poll_seconds)
+        self.flush()
+
+    def drain_once(self) -> int:
+        # Keeps up to batch_size posts in flight and only waits for the first
+        # one to finish, so a chat held back by its rate limit or retries
+        # does not stop fresh rows for other chats from being claimed.
+        self._renew_leases()
+        claimed = self._claim(self.batch_size - len(self._in_flight))
+        if not self._in_flight:
+            return claimed
+        done, _ = wait(list(self._in_flight), timeout=self.poll_seconds, return_when=FIRST_COMPLETED)
+        for future in done:
+            post = self._in_flight.pop(future)
+            self._finish(future, post)
+            self._release_media(post.deal.appid)
+        return claimed + len(done)
+
+    def flush(self) -> None:
+        while self._in_flight and not all(future.done() for future in self._in_flight):
+            self._renew_leases()
+            wait(list(self._in_flight), timeout=self.poll_seconds)
+        while self._in_flight:
+            future, post = self._in_flight.popitem()
+            self._finish(future, post)
+            self._release_media(post.deal.appid)
+
+    def _claim(self, capacity: int) -> int:
+        if capacity <= 0:
+            return 0
+        in_flight_ids = [post.id for post in self._in_flight.values()]
+        held_chats = [chat_id for chat_id, breaker in self._breakers.items() if not breaker.allow()]
+        posts = self.repository.claim_outbox_posts(
+            limit=capacity,
+            lease_seconds=self.lease_seconds,
+            exclude_chat_ids=held_chats,
+            exclude_ids=in_flight_ids,
+        )
+        for chat_id in held_chats:
+            if len(posts) >= capacity or not self._breakers[chat_id].allow_trial():
+                continue
+            trial = self.repository.claim_outbox_posts(
+                limit=1,
+                lease_seconds=self.lease_seconds,
+                exclude_ids=in_flight_ids,
+                chat_ids=[chat_id],
+            )
+            if not trial:
+                # Nothing to try with; stay half-open for the next claim.
+                self._breakers[chat_id].record_trial_skipped()
+            posts.extend(trial)
+        for post in posts:
+            channel = self._channels.get(post.chat_id)
+            if channel is None:
+                self.logger.warning("Dropping outbox post id=%s: chat %s is not configured", post.id, post.chat_id)
+                self.repository.drop_outbox_post(post, "chat is not configured")
+                continue
+            future = self.publish_queue.submit(
+                post.deal,
+                lambda appid=post.deal.appid: self._fetch_media(appid),
+                channels=[channel],
+            )
+            self._in_flight[future] = post
+        return len(posts)
+
+    def _finish(self, future: Future, post: OutboxPost) -> None:
+        breaker = self._breaker(post.chat_id)
+        error = future.exception()
+        if error is None:
+            self.repository.complete_outbox_post(post)
+            breaker.record_success()
+            self.logger.info(
+                "Posted deal: %s (%s%%) chat=%s",
+                post.deal.name,
+                post.deal.discount_percent,
+                post.chat_id,
+            )
+            return
+
+        breaker.record_failure()
+        if post.attempts >= self.max_attempts:
+            self.repository.drop_outbox_post(post, f"gave up after {post.attempts} attempts: {error!r}")
+            self.logger.error(
+                "Dropping deal: %s (appid=%s) chat=%s after %s attempts, breaker=%s",
+                post.deal.name,
+                post.deal.appid,
+                post.chat_id,
+                post.attempts,
+                breaker.state,
+                exc_info=error,
+            )
+            return
+        retry_in = self._backoff_seconds(post.attempts)
+        self.repository.fail_outbox_post(post, repr(error), retry_in)
+        self.logger.warning(
+            "Failed to post deal: %s (appid=%s) chat=%s attempt=%s, retry in %.0fs, breaker=%s",
+            post.deal.name,
+            post.deal.appid,
+            post.chat_id,
+            post.attempts,
+            retry_in,
+            breaker.state,
+        )
+
+    def _renew_leases(self) -> None:
+        now = time.monotonic()
+        if not self._in_flight or now - self._renewed_at < self.renew_seconds:
+            return
+        self._renewed_at = now
+        try:
+            self.repository.renew_outbox_leases(
+                [post.id for post in self._in_flight.values()],
+                self.lease_seconds,
+            )
+        except Exception:
+            self.logger.exception("Failed to renew outbox leases")
+
+    def _breaker(self, chat_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(chat_id)
+        if breaker is None:
+            breaker = CircuitBreaker(self.breaker_failure_threshold, self.breaker_reset_seconds)
+            self._breakers[chat_id] = breaker
+        return breaker
+
+    def _backoff_seconds(self, attempts: int) -> float:
+        delay = min(self.backoff_base_seconds * (2 ** max(attempts - 1, 0)), self.backoff_max_seconds)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _fetch_media(self, appid: int) -> DealMedia | None:
+        # The same deal is usually in flight for several chats at once;
+        # fetch its media only once.
+        future: Future = Future()
+        with self._media_lock:
+            existing = self._media.setdefault(appid, future)
+        if existing is future:
+            try:
+                future.set_result(self.steam.fetch_deal_media(appid))
+            except Exception as exc:
+                # Posts waiting on this fetch share the error, but a later
+                # retry fetches again.
+                with self._media_lock:
+                    if self._media.get(appid) is future:
+                        del self._media[appid]
+                future.set_exception(exc)
+        return existing.result()
+
+    def _release_media(self, appid: int) -> None:
+        # Dropped once the last post of the deal has settled.
+        if any(post.deal.appid == appid for post in self._in_flight.values()):
+            return
+        with self._media_lock:
+            self._media.pop(appid, None)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from pathlib import Path
+
+
+class BuildManifest:
+    # Checkpoints of a daily video build: which segment slots are finished
+    # and under which content key. A build that crashes or is restarted
+    # picks up from here and only renders what is missing; failed slots are
+    # not recorded, so a retry gives them another chance (TrailerHealth
+    # already skips trailers that keep failing).
+    def __init__(self, build_dir: Path):
+        self.build_dir = Path(build_dir)
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.build_dir / "manifest.json"
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._segments: dict[str, dict] = self._load()
+
+    def get(self, name: str, key: str) -> dict | None:
+        with self._lock:
+            entry = self._segments.get(name)
+        # Manifests written before failures stopped being recorded can
+        # still hold "ok": false entries.
+        if entry is None or entry.get("key") != key or not entry.get("ok", True):
+            return None
+        if not (self.build_dir / entry["file"]).exists():
+            return None
+        return entry
+
+    def record(self, name: str, key: str, out_path: Path) -> None:
+        with self._lock:
+            self._segments[name] = {"key": key, "ok": True, "file": out_path.name}
+            self._save()
+
+    @property
+    def resumed(self) -> int:
+        with self._lock:
+            return sum(1 for entry in self._segments.values() if entry.get("ok", True))
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8")).get("segments", {})
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            self.logger.exception("Unreadable build manifest %s, starting over", self.path)
+            return {}
+
+    def _save(self) -> None:
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"segments": self._segments}, indent=1, sort_keys=True), encoding="utf-8")
+        tmp_path.replace(self.path)
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import json
+import logging
+import re
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+_BENCH_RE = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s")
+_STDERR_TAIL_BYTES = 64 * 1024
+
+
+@dataclass
+class FfmpegRun:
+    # What one ffmpeg invocation spent its time on. `startup_seconds` is the
+    # wait for the first progress report (opening/seeking the input, for a
+    # remote trailer mostly network); `cpu_seconds` well below
+    # `wall_seconds` means ffmpeg was waiting on I/O rather than decoding,
+    # filtering or encoding.
+    label: str
+    wall_seconds: float = 0.0
+    startup_seconds: float | None = None
+    cpu_user_seconds: float | None = None
+    cpu_system_seconds: float | None = None
+    frames: int = 0
+    fps: float = 0.0
+    speed: float | None = None
+    bitrate_kbps: float | None = None
+    total_size: int = 0
+    out_seconds: float | None = None
+    ok: bool = False
+    error: str | None = None
+    stderr: bytes = field(default=b"", repr=False)
+
+    @property
+    def cpu_seconds(self) -> float | None:
+        if self.cpu_user_seconds is None:
+            return None
+        return self.cpu_user_seconds + (self.cpu_system_seconds or 0.0)
+
+    def as_record(self) -> dict:
+        record = asdict(self)
+        record.pop("stderr")
+        record["cpu_seconds"] = self.cpu_seconds
+        return record
+
+
+def _apply_progress(run: FfmpegRun, values: dict[str, str]) -> None:
+    try:
+        run.frames = int(values.get("frame") or run.frames)
+        run.fps = float(values.get("fps") or run.fps)
+        run.total_size = int(values.get("total_size") or run.total_size)
+    except ValueError:
+        pass
+    bitrate = (values.get("bitrate") or "").removesuffix("kbits/s")
+    speed = (values.get("speed") or "").removesuffix("x")
+    out_time_us = values.get("out_time_us") or values.get("out_time_ms")  # both are microseconds
+    try:
+        run.bitrate_kbps = float(bitrate)
+    except ValueError:
+        pass
+    try:
+        run.speed = float(speed)
+    except ValueError:
+        pass
+    try:
+        if out_time_us and int(out_time_us) > 0:
+            run.out_seconds = int(out_time_us) / 1_000_000
+    except ValueError:
+        pass
+
+
+def run_ffmpeg(command: list[str], timeout: float, run: FfmpegRun, on_progress=None) -> FfmpegRun:
+    # Like subprocess.run(command, check=True, capture_output=True,
+    # timeout=timeout), raising the same exceptions, but ffmpeg reports
+    # through `-progress pipe:1` while it runs: `on_progress(run)` gets the
+    # running numbers after every report block. `run` is filled in even when
+    # ffmpeg fails, so failures can be recorded too.
+    if not command or command[0] != "ffmpeg":
+        raise ValueError("run_ffmpeg expects an ffmpeg command")
+    command = [command[0], "-nostats", "-benchmark", "-progress", "pipe:1", *command[1:]]
+    started = time.monotonic()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    stderr_chunks: list[bytes] = []
+
+    def drain_stderr() -> None:
+        size = 0
+        for chunk in iter(lambda: process.stderr.read(8192), b""):
+            stderr_chunks.append(chunk)
+            size += len(chunk)
+            while size > _STDERR_TAIL_BYTES and len(stderr_chunks) > 1:
+                size -= len(stderr_chunks.pop(0))
+
+    stderr_thread = threading.Thread(target=drain_stderr, name=f"ffmpeg-stderr-{run.label}", daemon=True)
+    stderr_thread.start()
+    timed_out = threading.Event()
+
+    def kill() -> None:
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.daemon = True
+    timer.start()
+    try:
+        values: dict[str, str] = {}
+        for raw in process.stdout:
+            key, _, value = raw.decode("utf-8", errors="replace").strip().partition("=")
+            if key != "progress":
+                values[key] = value.strip()
+                continue
+            if run.startup_seconds is None:
+                run.startup_seconds = time.monotonic() - started
+            _apply_progress(run, values)
+            values = {}
+            run.wall_seconds = time.monotonic() - started
+            if on_progress is not None:
+                on_progress(run)
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_thread.join()
+        process.stdout.close()
+        process.stderr.close()
+
+    run.wall_seconds = time.monotonic() - started
+    run.stderr = b"".join(stderr_chunks)
+    bench = _BENCH_RE.findall(run.stderr.decode("utf-8", errors="replace"))
+    if bench:
+        run.cpu_user_seconds, run.cpu_system_seconds = float(bench[-1][0]), float(bench[-1][1])
+    if timed_out.is_set():
+        run.error = "timeout"
+        raise subprocess.TimeoutExpired(command, timeout, stderr=run.stderr)
+    if returncode != 0:
+        run.error = f"exit {returncode}"
+        raise subprocess.CalledProcessError(returncode, command, stderr=run.stderr)
+    run.ok = True
+    return run
+
+
+class FfmpegMetrics:
+    # Appends one JSON line per ffmpeg run (segment or concat) to a daily
+    # file (ffmpeg_YYYY-MM-DD.jsonl) and logs the same record, so slow builds
+    # can be broken down afterwards. Files older than `keep_days` are removed.
+    def __init__(self, metrics_dir: Path, progress_log_seconds: float = 15.0, keep_days: int = 14):
+        self.metrics_dir = Path(metrics_dir)
+        self.progress_log_seconds = max(progress_log_seconds, 1.0)
+        self.keep_days = max(keep_days, 1)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._day: str | None = None
+
+    def progress_logger(self):
+        # Periodic "still running" lines for long ffmpeg jobs.
+        last = [0.0]
+
+        def log(run: FfmpegRun) -> None:
+            if run.wall_seconds - last[0] < self.progress_log_seconds:
+                return
+            last[0] = run.wall_seconds
+            self.logger.info(
+                "ffmpeg %s running: wall=%.0fs out_time=%.1fs frames=%s fps=%.1f speed=%sx",
+                run.label,
+                run.wall_seconds,
+                run.out_seconds or 0.0,
+                run.frames,
+                run.fps,
+                run.speed,
+            )
+
+        return log
+
+    def record(self, run: FfmpegRun, **extra) -> None:
+        now = time.time()
+        record = {"ts": round(now, 3), **run.as_record(), **extra}
+        line = json.dumps(record, sort_keys=True, default=str)
+        self.logger.info("ffmpeg metrics %s", line)
+        day = time.strftime("%Y-%m-%d", time.gmtime(now))
+        path = self.metrics_dir / f"ffmpeg_{day}.jsonl"
+        with self._lock:
+            if day != self._day:
+                self._day = day
+                self._cleanup(now)
+            try:
+                with path.open("a", encoding="utf-8") as fh:
+                    fh.write(line + "\n")
+            except OSError:
+                self.logger.exception("Failed to append ffmpeg metrics to %s", path)
+
+    def _cleanup(self, now: float) -> None:
+        cutoff = now - self.keep_days * 86400
+        for path in self.metrics_dir.glob("ffmpeg_*.jsonl"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from app.pipelines.shorts_design import Box, Text
+
+try:
+    from PIL import Image, ImageColor, ImageDraw, ImageFont
+except ImportError:  # Pillow is optional; TikTokPipeline falls back to drawtext chains.
+    Image = None
+
+
+def raster_available() -> bool:
+    return Image is not None
+
+
+def _rgba(color: str) -> tuple[int, int, int, int]:
+    # ffmpeg color syntax: "name" / "#RRGGBB", optionally "@alpha".
+    name, _, alpha = color.partition("@")
+    r, g, b = ImageColor.getrgb(name)[:3]
+    return r, g, b, round(255 * float(alpha or 1.0))
+
+
+def render_layers(layers: list[Box | Text], font_path: str, size: tuple[int, int], out_path: Path) -> Path:
+    # Every layer is drawn on its own transparent sheet and alpha-composited,
+    # so overlapping translucent boxes blend the way chained drawbox filters do.
+    canvas = Image.new("RGBA", size, (0, 0, 0, 0))
+    fonts: dict[int, ImageFont.FreeTypeFont] = {}
+    for layer in layers:
+        sheet = Image.new("RGBA", size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(sheet)
+        if isinstance(layer, Box):
+            draw.rectangle(
+                (layer.x, layer.y, layer.x + layer.w - 1, layer.y + layer.h - 1),
+                fill=_rgba(layer.color),
+            )
+        else:
+            font = fonts.get(layer.size)
+            if font is None:
+                font = ImageFont.truetype(font_path, layer.size)
+                fonts[layer.size] = font
+            x = layer.x
+            if x is None:
+                x = round((size[0] - draw.textlength(layer.text, font=font)) / 2)
+            # drawtext's y is the top of the line box (ascender), same as "la".
+            draw.text((x, layer.y), layer.text, font=font, fill=_rgba(layer.color), anchor="la")
+        canvas = Image.alpha_composite(canvas, sheet)
+    canvas.save(out_path, format="PNG", optimize=False)
+    return out_path
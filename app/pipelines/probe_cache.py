@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+
+def probe_duration_seconds(media_url: str, timeout_seconds: float = 20) -> float | None:
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "default=noprint_wrappers=1:nokey=1",
+        media_url,
+    ]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, text=True, timeout=timeout_seconds)
+        raw = (result.stdout or "").strip()
+        if not raw:
+            return None
+        value = float(raw)
+        if value > 0:
+            return value
+    except Exception:
+        return None
+    return None
+
+
+class ProbeCache:
+    # Durations by URL or file. Local files are keyed by path, size and
+    # mtime so a re-rendered file is never answered from a stale entry.
+    # Concurrent callers for the same media share one ffprobe run.
+    def __init__(
+        self,
+        timeout_seconds: float = 20,
+        ttl_seconds: float = 6 * 3600,
+        failure_ttl_seconds: float = 600,
+        max_workers: int = 8,
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="ffprobe")
+        self._entries: dict[tuple, tuple[Future, float]] = {}
+        self._lock = threading.Lock()
+
+    def duration(self, media: str | Path) -> float | None:
+        future, owner = self._entry(media)
+        if owner:
+            self._run(media, future)
+        return future.result()
+
+    def prefetch(self, media_list: list[str]) -> None:
+        for media in dict.fromkeys(media_list):
+            future, owner = self._entry(media)
+            if owner:
+                self._executor.submit(self._run, media, future)
+
+    def remember(self, media: str | Path, duration: float | None) -> None:
+        if duration is None:
+            return
+        future: Future = Future()
+        future.set_result(duration)
+        key = self._key(media)
+        with self._lock:
+            self._entries[key] = (future, time.monotonic() + self.ttl_seconds)
+
+    def _entry(self, media: str | Path) -> tuple[Future, bool]:
+        key = self._key(media)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[1] > now:
+                return cached[0], False
+            future: Future = Future()
+            # Placeholder expiry until the result is in.
+            self._entries[key] = (future, now + self.timeout_seconds * 2)
+            return future, True
+
+    def _run(self, media: str | Path, future: Future) -> None:
+        duration = probe_duration_seconds(str(media), timeout_seconds=self.timeout_seconds)
+        ttl = self.ttl_seconds if duration is not None else self.failure_ttl_seconds
+        with self._lock:
+            self._entries[self._key(media)] = (future, time.monotonic() + ttl)
+        future.set_result(duration)
+
+    @staticmethod
+    def _key(media: str | Path) -> tuple:
+        path = Path(media)
+        if "://" not in str(media) and path.exists():
+            stat = path.stat()
+            return str(path), stat.st_size, stat.st_mtime_ns
+        return (str(media),)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from pathlib import Path
+
+
+class RenderStats:
+    # Moving averages of measured render times ("game", "game_cached",
+    # "concat_per_second", ...), kept in a small JSON file next to the
+    # videos so the deadline-aware scheduler starts from real numbers.
+    def __init__(self, path: Path, alpha: float = 0.3):
+        self.path = Path(path)
+        self.alpha = min(max(alpha, 0.01), 1.0)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._averages: dict[str, float] = self._load()
+
+    def estimate(self, kind: str, default: float | None = None) -> float | None:
+        with self._lock:
+            return self._averages.get(kind, default)
+
+    def record(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            previous = self._averages.get(kind)
+            self._averages[kind] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def save(self) -> None:
+        tmp_path = self.path.with_suffix(".tmp")
+        with self._lock:
+            raw = json.dumps(self._averages, indent=1, sort_keys=True)
+        try:
+            tmp_path.write_text(raw, encoding="utf-8")
+            tmp_path.replace(self.path)
+        except OSError:
+            self.logger.exception("Failed to write render stats file %s", self.path)
+
+    def _load(self) -> dict[str, float]:
+        try:
+            raw = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            self.logger.exception("Failed to read render stats file %s, starting empty", self.path)
+            return {}
+        return {kind: float(value) for kind, value in raw.items() if isinstance(value, (int, float))}
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+
+class SegmentCache:
+    # Content-addressed store of rendered segments. The key is a hash of
+    # everything that affects the pixels, so an unchanged game is reused as
+    # is; files are evicted least-recently-used once the directory grows
+    # past `max_bytes` (a hit refreshes the file's mtime). The duration is
+    # kept next to each file, so a copied-out hit needs no ffprobe.
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(**parts) -> str:
+        raw = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.mp4"
+
+    def duration(self, key: str) -> float | None:
+        try:
+            return float(self.path_for(key).with_suffix(".duration").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key: str, out_path: Path) -> bool:
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+            shutil.copyfile(path, out_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: str, segment: Path, duration: float | None = None) -> None:
+        path = self.path_for(key)
+        tmp_path = path.with_suffix(".part")
+        try:
+            shutil.copyfile(segment, tmp_path)
+            if duration is not None:
+                path.with_suffix(".duration").write_text(str(duration), encoding="utf-8")
+            tmp_path.replace(path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            self.logger.exception("Failed to store segment in cache: %s", path.name)
+            return
+        self.evict()
+
+    def evict(self) -> int:
+        with self._lock:
+            entries = []
+            for path in self.cache_dir.glob("*.mp4"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                path.with_suffix(".duration").unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            if removed:
+                self.logger.info("Segment cache evicted %s files, %.1f MB left", removed, total / 1024 / 1024)
+            return removed
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 from app.steam import Deal
 
@@ -28,13 +28,54 @@ def ellipsize(s: str, n: int) -> str:
     return s[: max(0, n - 3)].rstrip() + "..."
 
 
+@dataclass(frozen=True)
+class Box:
+    x: int
+    y: int
+    w: int
+    h: int
+    color: str
+
+
+@dataclass(frozen=True)
+class Text:
+    text: str
+    x: int | None  # None = centered horizontally
+    y: int
+    size: int
+    color: str
+
+
+@dataclass(frozen=True)
+class Canvas:
+    name: str
+    w: int
+    h: int
+
+    def scaled(self, factor: int) -> Canvas:
+        # Draft renders: 1/factor of each side, kept even for yuv420p.
+        if factor <= 1:
+            return self
+        return replace(self, w=max(self.w // factor // 2 * 2, 2), h=max(self.h // factor // 2 * 2, 2))
+
+
+CANVASES = {
+    "shorts": Canvas("shorts", 1080, 1920),  # 9:16 Shorts / TikTok / Reels
+    "square": Canvas("square", 1080, 1080),  # 1:1 Instagram feed
+    "landscape": Canvas("landscape", 1920, 1080),  # 16:9 YouTube
+}
+
+
 @dataclass(frozen=True)
 class ShortsDesign:
-    # Canvas (Shorts)
+    # Canvas (Shorts); all layout below is in these coordinates
     w: int = 1080
     h: int = 1920
     fps: int = 30
 
+    # Output formats rendered from the same decode; the first one is the main file
+    canvases: tuple[Canvas, ...] = (CANVASES["shorts"],)
+
     # Safe area + layout
     safe_x: int = 60
     safe_top: int = 80
@@ -84,6 +125,9 @@ class ShortsDesign:
     seg_fade_in: float = 0.18
     seg_fade_out: float = 0.22
 
+    # Slide/fade the rasterized overlay in and out (see overlay_composite_filter)
+    animate_overlay: bool = False
+
     def _alpha_expr(self, total: float, delay: float = 0.0) -> str:
         fi = max(self.text_fade_in, 0.01)
         fo = max(self.text_fade_out, 0.01)
@@ -106,74 +150,158 @@ class ShortsDesign:
             f")))"
         )
 
-    # ---------- INTRO / OUTRO ----------
-    def intro_filter(self, date_str: str, font_path: str, segment_duration: float) -> str:
-        kicker = escape_drawtext(self.intro_kicker)
-        title = escape_drawtext(self.intro_title_template.format(date=date_str))
-        sub = escape_drawtext(self.intro_subtitle)
+    # ---------- LAYERS ----------
+    # The chrome is described once as a list of boxes and texts. It is either
+    # turned into a drawbox/drawtext chain (`layers_filter`) or rasterized
+    # once into a transparent PNG and composited with a single overlay
+    # (see overlay_raster.py), which is much cheaper per frame.
+    def scale_layers(self, layers: list[Box | Text], canvas: Canvas | None = None) -> list[Box | Text]:
+        # Boxes stretch with the canvas on each axis; text only shrinks by
+        # the smaller factor, so it is never squashed and still fits the
+        # (stretched) card or ribbon it sits on.
+        if canvas is None or (canvas.w, canvas.h) == (self.w, self.h):
+            return layers
+        sx = canvas.w / self.w
+        sy = canvas.h / self.h
+        s = min(sx, sy)
+        scaled: list[Box | Text] = []
+        for layer in layers:
+            if isinstance(layer, Box):
+                scaled.append(
+                    replace(
+                        layer,
+                        x=round(layer.x * sx),
+                        y=round(layer.y * sy),
+                        w=max(round(layer.w * sx), 1),
+                        h=max(round(layer.h * sy), 1),
+                    )
+                )
+            else:
+                scaled.append(
+                    replace(
+                        layer,
+                        x=None if layer.x is None else round(layer.x * sx),
+                        y=round(layer.y * sy),
+                        size=max(round(layer.size * s), 1),
+                    )
+                )
+        return scaled
+
+    def layers_filter(self, layers: list[Box | Text], font_path: str) -> str:
+        parts = []
+        for layer in layers:
+            if isinstance(layer, Box):
+                parts.append(
+                    f"drawbox=x={layer.x}:y={layer.y}:w={layer.w}:h={layer.h}:color={layer.color}:t=fill"
+                )
+            else:
+                x = "(w-text_w)/2" if layer.x is None else layer.x
+                parts.append(
+                    f"drawtext=fontfile={font_path}:expansion=none:text='{escape_drawtext(layer.text)}':"
+                    f"x={x}:y={layer.y}:fontsize={layer.size}:fontcolor={layer.color}"
+                )
+        return ",".join(parts)
+
+    def overlay_composite_filter(
+        self,
+        total: float,
+        animated: bool = False,
+        layer_input: str = "[1:v]",
+        tag: str = "",
+        canvas: Canvas | None = None,
+    ) -> str:
+        # [base{tag}][layer] -> [v{tag}]. Animated: the layer slides up and
+        # fades in/out with the same timing as `_slide_y` / `_alpha_expr`;
+        # the slide distance scales with the canvas height like the layers.
+        layer = f"{layer_input}format=rgba"
+        y = "0"
+        if animated:
+            fi = max(self.text_fade_in, 0.01)
+            fo = max(self.text_fade_out, 0.01)
+            out_start = max(total - fo, fi)
+            layer += f",fade=t=in:st=0:d={fi}:alpha=1,fade=t=out:st={out_start}:d={fo}:alpha=1"
+            dist = 18 if canvas is None else max(round(18 * canvas.h / self.h), 1)
+            y = f"'{self._slide_y(0, total, 0.0, dist)}'"
+        return f"{layer}[layer{tag}];[base{tag}][layer{tag}]overlay=x=0:y={y}:shortest=1,format=yuv420p[v{tag}]"
 
+    # ---------- INTRO / OUTRO ----------
+    def intro_layers(self, date_str: str) -> list[Box | Text]:
         # Clean neon gradient vibes: top-left purple haze + bottom-right cyan haze
         # (No real gradients in drawbox, so we layer translucent boxes)
-        return (
-            f"fps={self.fps},setpts=PTS-STARTPTS,format=yuv420p,"
-            f"drawbox=x=0:y=0:w=iw:h=ih:color={self.bg1}@1.0:t=fill,"
-            f"drawbox=x=-200:y=-200:w=900:h=900:color={self.neon_a}@0.20:t=fill,"
-            f"drawbox=x=500:y=1100:w=900:h=900:color={self.neon_b}@0.18:t=fill,"
-            f"drawbox=x=0:y=0:w=iw:h=ih:color=black@0.15:t=fill,"  # vignette-ish
+        slab_w = self.w - 2 * self.safe_x
+        return [
+            Box(0, 0, self.w, self.h, f"{self.bg1}@1.0"),
+            Box(-200, -200, 900, 900, f"{self.neon_a}@0.20"),
+            Box(500, 1100, 900, 900, f"{self.neon_b}@0.18"),
+            Box(0, 0, self.w, self.h, "black@0.15"),  # vignette-ish
             # Glass slab behind text
-            f"drawbox=x={self.safe_x}:y=680:w={self.w-2*self.safe_x}:h=420:color=black@0.30:t=fill,"
-            f"drawbox=x={self.safe_x}:y=680:w={self.w-2*self.safe_x}:h=4:color={self.neon_b}@0.85:t=fill,"
-            f"drawbox=x={self.safe_x}:y=1096:w={self.w-2*self.safe_x}:h=4:color={self.neon_a}@0.85:t=fill,"
+            Box(self.safe_x, 680, slab_w, 420, "black@0.30"),
+            Box(self.safe_x, 680, slab_w, 4, f"{self.neon_b}@0.85"),
+            Box(self.safe_x, 1096, slab_w, 4, f"{self.neon_a}@0.85"),
             # Kicker capsule
-            f"drawbox=x={self.safe_x}:y=610:w=360:h=56:color=black@0.35:t=fill,"
-            f"drawbox=x={self.safe_x}:y=610:w=6:h=56:color={self.neon_b}@0.90:t=fill,"
-            f"drawtext=fontfile={font_path}:text='{kicker}':"
-            f"x={self.safe_x+18}:y=620:"
-            f"fontsize=30:fontcolor={self.white},"
+            Box(self.safe_x, 610, 360, 56, "black@0.35"),
+            Box(self.safe_x, 610, 6, 56, f"{self.neon_b}@0.90"),
+            Text(self.intro_kicker, self.safe_x + 18, 620, 30, self.white),
             # Title
-            f"drawtext=fontfile={font_path}:text='{title}':"
-            f"x=(w-text_w)/2:y=760:"
-            f"fontsize=64:fontcolor={self.white},"
+            Text(self.intro_title_template.format(date=date_str), None, 760, 64, self.white),
             # Subtitle
-            f"drawtext=fontfile={font_path}:text='{sub}':"
-            f"x=(w-text_w)/2:y=850:"
-            f"fontsize=38:fontcolor=#E5E7EB"
-        )
+            Text(self.intro_subtitle, None, 850, 38, "#E5E7EB"),
+        ]
+
+    def outro_layers(self, telegram_url: str) -> list[Box | Text]:
+        card_w = self.w - 2 * self.safe_x
+        pill_x = (self.w - 820) // 2
+        return [
+            Box(0, 0, self.w, self.h, f"{self.bg2}@1.0"),
+            Box(-220, 980, 980, 980, f"{self.neon_b}@0.18"),
+            Box(420, -260, 980, 980, f"{self.neon_a}@0.18"),
+            Box(0, 0, self.w, self.h, "black@0.18"),
+            # Center card
+            Box(self.safe_x, 680, card_w, 560, "black@0.32"),
+            Box(self.safe_x, 680, 6, 560, f"{self.neon_b}@0.95"),
+            Text(self.outro_title, None, 760, 62, self.white),
+            Text(self.outro_subtitle, None, 845, 36, "#E5E7EB"),
+            # URL as pill button
+            Box(pill_x, 940, 820, 84, "black@0.40"),
+            Box(pill_x, 940, 820, 4, f"{self.neon_c}@0.90"),
+            Text(telegram_url, None, 960, 40, self.neon_b),
+        ]
 
-    def outro_filter(self, telegram_url: str, font_path: str, segment_duration: float) -> str:
-        title = escape_drawtext(self.outro_title)
-        sub = escape_drawtext(self.outro_subtitle)
-        url = escape_drawtext(telegram_url)
+    def intro_filter(self, date_str: str, font_path: str, segment_duration: float, canvas: Canvas | None = None) -> str:
+        return (
+            f"fps={self.fps},setpts=PTS-STARTPTS,format=yuv420p,"
+            + self.layers_filter(self.scale_layers(self.intro_layers(date_str), canvas), font_path)
+        )
 
+    def outro_filter(
+        self, telegram_url: str, font_path: str, segment_duration: float, canvas: Canvas | None = None
+    ) -> str:
         return (
             f"fps={self.fps},setpts=PTS-STARTPTS,format=yuv420p,"
-            f"drawbox=x=0:y=0:w=iw:h=ih:color={self.bg2}@1.0:t=fill,"
-            f"drawbox=x=-220:y=980:w=980:h=980:color={self.neon_b}@0.18:t=fill,"
-            f"drawbox=x=420:y=-260:w=980:h=980:color={self.neon_a}@0.18:t=fill,"
-            f"drawbox=x=0:y=0:w=iw:h=ih:color=black@0.18:t=fill,"
-            # Center card
-            f"drawbox=x={self.safe_x}:y=680:w={self.w-2*self.safe_x}:h=560:color=black@0.32:t=fill,"
-            f"drawbox=x={self.safe_x}:y=680:w=6:h=560:color={self.neon_b}@0.95:t=fill,"
-            f"drawtext=fontfile={font_path}:text='{title}':"
-            f"x=(w-text_w)/2:y=760:"
-            f"fontsize=62:fontcolor={self.white},"
-            f"drawtext=fontfile={font_path}:text='{sub}':"
-            f"x=(w-text_w)/2:y=845:"
-            f"fontsize=36:fontcolor=#E5E7EB,"
-            # URL as pill button
-            f"drawbox=x={(self.w-820)//2}:y=940:w=820:h=84:color=black@0.40:t=fill,"
-            f"drawbox=x={(self.w-820)//2}:y=940:w=820:h=4:color={self.neon_c}@0.90:t=fill,"
-            f"drawtext=fontfile={font_path}:text='{url}':"
-            f"x=(w-text_w)/2:y=960:"
-            f"fontsize=40:fontcolor={self.neon_b}"
+            + self.layers_filter(self.scale_layers(self.outro_layers(telegram_url), canvas), font_path)
         )
 
     # ---------- GAME OVERLAY ----------
-    def game_overlay_filter(self, deal: Deal, font_path: str, segment_duration: float) -> str:
-        title = escape_drawtext(ellipsize(deal.name, 56))
-        discount_txt = escape_drawtext(f"-{deal.discount_percent} OFF")
-        old_price = escape_drawtext(format_price(deal.original_price, deal.currency))
-        new_price = escape_drawtext(format_price(deal.final_price, deal.currency))
+    def game_background_filter(self, canvas: Canvas | None = None, tag: str = "") -> str:
+        # `tag` keeps the labels unique when several canvases share one graph.
+        w, h = (canvas.w, canvas.h) if canvas else (self.w, self.h)
+        return (
+            # Background = blurred fill, Foreground = center crop, fitted inside the canvas
+            f"split=2[bg{tag}][fg{tag}],"
+            f"[bg{tag}]scale={w}:{h}:force_original_aspect_ratio=increase,"
+            f"crop={w}:{h},boxblur=22:2,eq=contrast=1.06:saturation=1.10:brightness=-0.01[bgv{tag}],"
+            f"[fg{tag}]crop=iw*0.90:ih:iw*0.05:0,"
+            f"scale={w}:{h}:force_original_aspect_ratio=decrease:force_divisible_by=2,"
+            f"eq=contrast=1.07:saturation=1.12:brightness=0.02[fgv{tag}],"
+            f"[bgv{tag}][fgv{tag}]overlay=(W-w)/2:(H-h)/2,"
+            f"fps={self.fps},setpts=PTS-STARTPTS,format=yuv420p"
+        )
+
+    def game_layers(self, deal: Deal) -> list[Box | Text]:
+        title = ellipsize(deal.name, 56)
+        discount_txt = f"-{deal.discount_percent} OFF"
+        old_price = format_price(deal.original_price, deal.currency)
+        new_price = format_price(deal.final_price, deal.currency)
 
         cx = self.card_x
         cy = self.card_y
@@ -207,55 +335,42 @@ class ShortsDesign:
         strike_x2 = x0 + 520
         strike_y = was_y + 26
 
-        return (
-            # Background = blurred fill, Foreground = center crop
-            "split=2[bg][fg],"
-            f"[bg]scale={self.w}:{self.h}:force_original_aspect_ratio=increase,"
-            f"crop={self.w}:{self.h},boxblur=22:2,eq=contrast=1.06:saturation=1.10:brightness=-0.01[bgv],"
-            "[fg]crop=iw*0.90:ih:iw*0.05:0,"
-            f"scale={self.w}:-2,eq=contrast=1.07:saturation=1.12:brightness=0.02[fgv],"
-            "[bgv][fgv]overlay=(W-w)/2:(H-h)/2,"
-            f"fps={self.fps},setpts=PTS-STARTPTS,format=yuv420p,"
+        return [
             # subtle top scrim (improves readability)
-            f"drawbox=x=0:y=0:w=iw:h=280:color=black@0.20:t=fill,"
+            Box(0, 0, self.w, 280, "black@0.20"),
             # Top headline ribbon for guaranteed visibility
-            f"drawbox=x={top_x}:y={top_y}:w={top_w}:h={top_h}:color=black@0.45:t=fill,"
-            f"drawbox=x={top_x}:y={top_y}:w=8:h={top_h}:color={self.neon_b}@0.95:t=fill,"
-            f"drawtext=fontfile={font_path}:expansion=none:text='{title}':"
-            f"x={top_x+24}:y={top_y+26}:fontsize=44:fontcolor={self.white},"
-            f"drawtext=fontfile={font_path}:expansion=none:text='{discount_txt}':"
-            f"x={top_x+24}:y={top_y+110}:fontsize=58:fontcolor=#FDE047,"
+            Box(top_x, top_y, top_w, top_h, "black@0.45"),
+            Box(top_x, top_y, 8, top_h, f"{self.neon_b}@0.95"),
+            Text(title, top_x + 24, top_y + 26, 44, self.white),
+            Text(discount_txt, top_x + 24, top_y + 110, 58, "#FDE047"),
             # Glass card: base + highlight + neon edge
-            f"drawbox=x={cx}:y={cy}:w={cw}:h={ch}:color=black@0.38:t=fill,"
-            f"drawbox=x={cx}:y={cy}:w={cw}:h=3:color={self.neon_b}@0.88:t=fill,"
-            f"drawbox=x={cx}:y={cy+ch-3}:w={cw}:h=3:color={self.neon_a}@0.82:t=fill,"
-            f"drawbox=x={cx}:y={cy}:w=10:h={ch}:color={self.neon_b}@0.55:t=fill,"
+            Box(cx, cy, cw, ch, "black@0.38"),
+            Box(cx, cy, cw, 3, f"{self.neon_b}@0.88"),
+            Box(cx, cy + ch - 3, cw, 3, f"{self.neon_a}@0.82"),
+            Box(cx, cy, 10, ch, f"{self.neon_b}@0.55"),
             # Title
-            f"drawtext=fontfile={font_path}:expansion=none:text='{title}':"
-            f"x={x0}:y={y_title}:"
-            f"fontsize={self.title_fs}:fontcolor={self.white},"
+            Text(title, x0, y_title, self.title_fs, self.white),
             # Discount pill (capsule feel via 2 layers)
-            f"drawbox=x={pill_x}:y={pill_y}:w={pill_w}:h={pill_h}:color=black@0.45:t=fill,"
-            f"drawbox=x={pill_x}:y={pill_y}:w=8:h={pill_h}:color={self.neon_c}@0.95:t=fill,"
-            f"drawtext=fontfile={font_path}:expansion=none:text='{discount_txt}':"
-            f"x={pill_x+18}:y={pill_y+14}:"
-            f"fontsize={self.discount_fs}:fontcolor=#E5E7EB,"
+            Box(pill_x, pill_y, pill_w, pill_h, "black@0.45"),
+            Box(pill_x, pill_y, 8, pill_h, f"{self.neon_c}@0.95"),
+            Text(discount_txt, pill_x + 18, pill_y + 14, self.discount_fs, "#E5E7EB"),
             # WAS row
-            f"drawtext=fontfile={font_path}:expansion=none:text='WAS':"
-            f"x={x0}:y={was_y}:"
-            f"fontsize={self.meta_fs}:fontcolor=#9CA3AF,"
-            f"drawtext=fontfile={font_path}:expansion=none:text='{old_price}':"
-            f"x={x0+140}:y={was_y-8}:"
-            f"fontsize={self.price_fs}:fontcolor=#D1D5DB,"
+            Text("WAS", x0, was_y, self.meta_fs, "#9CA3AF"),
+            Text(old_price, x0 + 140, was_y - 8, self.price_fs, "#D1D5DB"),
             # Strike-through for old price
-            f"drawbox=x={strike_x1}:y={strike_y}:w={strike_x2-strike_x1}:h=4:color=#D1D5DB@0.65:t=fill,"
+            Box(strike_x1, strike_y, strike_x2 - strike_x1, 4, "#D1D5DB@0.65"),
             # NOW row
-            f"drawtext=fontfile={font_path}:expansion=none:text='NOW':"
-            f"x={x0}:y={now_y}:"
-            f"fontsize={self.meta_fs}:fontcolor=#86EFAC,"
-            f"drawtext=fontfile={font_path}:expansion=none:text='{new_price}':"
-            f"x={x0+140}:y={now_y-8}:"
-            f"fontsize={self.price_fs+6}:fontcolor={self.neon_c}"
+            Text("NOW", x0, now_y, self.meta_fs, "#86EFAC"),
+            Text(new_price, x0 + 140, now_y - 8, self.price_fs + 6, self.neon_c),
+        ]
+
+    def game_overlay_filter(
+        self, deal: Deal, font_path: str, segment_duration: float, canvas: Canvas | None = None, tag: str = ""
+    ) -> str:
+        return (
+            self.game_background_filter(canvas, tag)
+            + ","
+            + self.layers_filter(self.scale_layers(self.game_layers(deal), canvas), font_path)
         )
 
 
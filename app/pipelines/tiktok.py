@@ -1,16 +1,41 @@
 ﻿from __future__ import annotations
 
 import logging
+import os
 import shutil
 import subprocess
-from datetime import datetime
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict
+from datetime import datetime, timedelta
 from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
 from zoneinfo import ZoneInfo
 
-from app.pipelines.shorts_design import ShortsDesign
+from app.pipelines.build_manifest import BuildManifest
+from app.pipelines.ffmpeg_progress import FfmpegMetrics, FfmpegRun, run_ffmpeg
+from app.pipelines.overlay_raster import raster_available, render_layers
+from app.pipelines.probe_cache import ProbeCache
+from app.pipelines.render_stats import RenderStats
+from app.pipelines.segment_cache import SegmentCache
+from app.pipelines.shorts_design import CANVASES, Canvas, ShortsDesign
+from app.pipelines.trailer_cache import TrailerTranscoder
+from app.pipelines.trailer_health import TrailerHealth
 from app.steam import Deal
 
 
+SEGMENT_ENCODINGS = ("intermediate", "final")
+# Draft renders divide every canvas side by this factor.
+DRAFT_SCALES = {"off": 1, "half": 2, "quarter": 4}
+DRAFT_SEGMENT_SECONDS = 2
+
+
+class SegmentDeadlineExceeded(Exception):
+    # The build budget ran out before (or while) this segment rendered. Not
+    # a trailer failure: nothing is recorded, the game is simply left out.
+    pass
+
+
 class TikTokPipeline:
     def __init__(
         self,
@@ -22,7 +47,29 @@ class TikTokPipeline:
         trailer_fallback_start_seconds: float = 8.0,
         timezone_name: str = "Europe/Kyiv",
         font_path: str = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+        trailer_transcoder: TrailerTranscoder | None = None,
+        render_workers: int = 0,
+        ffmpeg_threads: int = 2,
+        segment_cache_mb: int = 1024,
+        segment_encoding: str = "intermediate",
+        overlay_raster: bool = True,
+        intro_prerender_days: int = 2,
+        formats: list[str] | None = None,
+        build_budget_seconds: int = 0,
+        max_video_seconds: int = 0,
+        draft: str = "off",
     ):
+        if draft not in DRAFT_SCALES:
+            raise ValueError(f"Unknown draft mode {draft!r}, expected one of {tuple(DRAFT_SCALES)}")
+        # Draft: the same layout at 1/2 or 1/4 resolution, ultrafast encodes
+        # and the shortest segments, for previews. It gets its own output
+        # directory so the segment cache, render stats, trailer health and
+        # build dirs stay separate.
+        self.draft = draft
+        self.draft_scale = DRAFT_SCALES[draft]
+        if self.draft_scale > 1:
+            output_dir = str(Path(output_dir) / "draft")
+            per_game_seconds = intro_seconds = outro_seconds = DRAFT_SEGMENT_SECONDS
         self.output_dir = Path(output_dir)
         self.telegram_url = telegram_url
         self.per_game_seconds = max(per_game_seconds, 2)
@@ -31,155 +78,256 @@ class TikTokPipeline:
         self.trailer_fallback_start_seconds = max(trailer_fallback_start_seconds, 0.0)
         self.tz = ZoneInfo(timezone_name)
         self.font_path = font_path
+        self.trailer_transcoder = trailer_transcoder
+        self.intro_prerender_days = max(intro_prerender_days, 0)
+        # Not joined by the build: next days' intros render after the video
+        # is out.
+        self._prerender_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shorts-prerender")
+        # 0 = no limit. With a budget, games are rendered in priority order
+        # only while their measured render time still fits; the video is cut
+        # to `max_video_seconds` worth of games.
+        self.build_budget_seconds = max(build_budget_seconds, 0)
+        self.max_video_seconds = max(max_video_seconds, 0)
 
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.marker_path = self.output_dir / ".last_daily_video_date"
+        self.trailer_health = TrailerHealth(self.output_dir / ".trailer_health.json")
+        self.render_stats = RenderStats(self.output_dir / ".render_stats.json")
+        self.metrics = FfmpegMetrics(self.output_dir / ".metrics")
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.design = ShortsDesign()
+        formats = list(dict.fromkeys(formats or ["shorts"]))
+        unknown = [name for name in formats if name not in CANVASES]
+        if unknown:
+            raise ValueError(f"Unknown shorts formats {unknown}, expected some of {tuple(CANVASES)}")
+        # Every segment is rendered for all canvases from one decode of its
+        # source; the first format is the main output.
+        self.design = ShortsDesign(canvases=tuple(CANVASES[name].scaled(self.draft_scale) for name in formats))
+        self.canvases = self.design.canvases
         self.ffmpeg_segment_timeout_seconds = 60
+        # Minimum; longer videos get a few times the measured concat rate.
         self.ffmpeg_concat_timeout_seconds = 90
         self.transition_seconds = 0.35
+        # Final (lossy) encode of the concat pass; see benchmarks/encoding_benchmark.py.
+        self.concat_preset = "fast" if self.draft_scale == 1 else "ultrafast"
+        self.concat_crf = 22 if self.draft_scale == 1 else 28
+        self.concat_threads = 0  # 0 = ffmpeg picks
+        # Lossless segments are 60-120MB each, so the segment cache keeps a
+        # visually lossless re-encode of them instead (a few MB per segment).
+        self.cache_preset = "veryfast"
+        self.cache_crf = 14
+        self.probes = ProbeCache()
+        # Segments are independent ffmpeg processes; run as many as the cores
+        # allow, each limited to `ffmpeg_threads` so they do not oversubscribe.
+        self.ffmpeg_threads = max(ffmpeg_threads, 1)
+        self.render_workers = render_workers if render_workers > 0 else max((os.cpu_count() or 1) // self.ffmpeg_threads, 1)
+        # "intermediate": segments are lossless (x264 qp 0, ultrafast), so the
+        # concat/xfade pass is the only lossy encode. "final": segments are
+        # normal libx264 and get re-encoded by the concat pass.
+        if segment_encoding not in SEGMENT_ENCODINGS:
+            raise ValueError(f"Unknown segment encoding {segment_encoding!r}, expected one of {SEGMENT_ENCODINGS}")
+        self.segment_encoding = segment_encoding
+        self.overlay_raster = overlay_raster and raster_available()
+        if overlay_raster and not self.overlay_raster:
+            self.logger.warning("Pillow is not installed; overlays fall back to per-frame drawtext filters")
+        self.segment_cache = (
+            SegmentCache(self.output_dir / ".segment_cache", segment_cache_mb * 1024 * 1024)
+            if segment_cache_mb > 0
+            else None
+        )
 
-    def should_generate_today(self) -> bool:
-        today = datetime.now(self.tz).strftime("%Y-%m-%d")
-        if not self.marker_path.exists():
-            return True
-        last_date = self.marker_path.read_text(encoding="utf-8").strip()
-        return last_date != today
+    def _canvas_path(self, path: Path, canvas: Canvas) -> Path:
+        # The main format keeps the plain file name, the others get a suffix.
+        if canvas == self.canvases[0]:
+            return path
+        return path.with_name(f"{path.stem}_{canvas.name}{path.suffix}")
 
-    def _mark_generated_today(self) -> None:
-        today = datetime.now(self.tz).strftime("%Y-%m-%d")
-        self.marker_path.write_text(today, encoding="utf-8")
+    def _canvas_paths(self, path: Path) -> list[Path]:
+        return [self._canvas_path(path, canvas) for canvas in self.canvases]
 
-    def _build_intro(self, out_path: Path, date_str: str) -> None:
-        vf = self.design.intro_filter(
-            date_str=date_str,
-            font_path=self.font_path,
-            segment_duration=self.intro_seconds,
-        )
-        command = [
-            "ffmpeg",
-            "-y",
-            "-f",
-            "lavfi",
-            "-i",
-            f"color=c=black:s=1080x1920:d={self.intro_seconds}",
-            "-vf",
-            vf,
+    def _segment_output_args(self, out_path: Path) -> list[str]:
+        return [
             "-r",
-            "30",
-            "-c:v",
-            "libx264",
-            "-pix_fmt",
-            "yuv420p",
+            str(self.design.fps),
+            *self._segment_codec_args(),
             "-an",
+            "-threads",
+            str(self.ffmpeg_threads),
             str(out_path),
         ]
-        subprocess.run(command, check=True, capture_output=True, timeout=self.ffmpeg_segment_timeout_seconds)
 
-    def _build_outro(self, out_path: Path) -> None:
-        vf = self.design.outro_filter(
-            telegram_url=self.telegram_url,
-            font_path=self.font_path,
-            segment_duration=self.outro_seconds,
+    def _build_still(self, out_path: Path, layers: list, seconds: int, deadline: float | None = None) -> None:
+        # Intro/outro are fully static: one rasterized frame per canvas, looped.
+        command = ["ffmpeg", "-y"]
+        for canvas in self.canvases:
+            still = render_layers(
+                self.design.scale_layers(layers, canvas),
+                self.font_path,
+                (canvas.w, canvas.h),
+                self._canvas_path(out_path, canvas).with_suffix(".png"),
+            )
+            command.extend(["-loop", "1", "-framerate", str(self.design.fps), "-t", str(seconds), "-i", str(still)])
+        outputs = self._canvas_paths(out_path)
+        for idx, path in enumerate(outputs):
+            command.extend(["-map", f"{idx}:v", "-vf", "format=yuv420p", *self._segment_output_args(path)])
+        self._run_ffmpeg(command, outputs, self._job_timeout(self.ffmpeg_segment_timeout_seconds, deadline))
+
+    def _build_drawn(self, out_path: Path, seconds: int, canvas_filter, deadline: float | None = None) -> None:
+        # Fallback without Pillow: a black lavfi source per canvas with the
+        # drawbox/drawtext chain from `canvas_filter(canvas)` on top.
+        command = ["ffmpeg", "-y"]
+        for canvas in self.canvases:
+            command.extend(["-f", "lavfi", "-i", f"color=c=black:s={canvas.w}x{canvas.h}:d={seconds}"])
+        outputs = self._canvas_paths(out_path)
+        for idx, (canvas, path) in enumerate(zip(self.canvases, outputs)):
+            command.extend(["-map", f"{idx}:v", "-vf", canvas_filter(canvas), *self._segment_output_args(path)])
+        self._run_ffmpeg(command, outputs, self._job_timeout(self.ffmpeg_segment_timeout_seconds, deadline))
+
+    def _build_intro(self, out_path: Path, date_str: str, deadline: float | None = None) -> None:
+        if self.overlay_raster:
+            self._build_still(out_path, self.design.intro_layers(date_str), self.intro_seconds, deadline)
+            return
+        self._build_drawn(
+            out_path,
+            self.intro_seconds,
+            lambda canvas: self.design.intro_filter(
+                date_str=date_str,
+                font_path=self.font_path,
+                segment_duration=self.intro_seconds,
+                canvas=canvas,
+            ),
+            deadline,
         )
-        command = [
-            "ffmpeg",
-            "-y",
-            "-f",
-            "lavfi",
-            "-i",
-            f"color=c=black:s=1080x1920:d={self.outro_seconds}",
-            "-vf",
-            vf,
-            "-r",
-            "30",
-            "-c:v",
-            "libx264",
-            "-pix_fmt",
-            "yuv420p",
-            "-an",
-            str(out_path),
-        ]
-        subprocess.run(command, check=True, capture_output=True, timeout=self.ffmpeg_segment_timeout_seconds)
 
-    def _build_overlay_filter(self, deal: Deal) -> str:
+    def _build_outro(self, out_path: Path, deadline: float | None = None) -> None:
+        if self.overlay_raster:
+            self._build_still(out_path, self.design.outro_layers(self.telegram_url), self.outro_seconds, deadline)
+            return
+        self._build_drawn(
+            out_path,
+            self.outro_seconds,
+            lambda canvas: self.design.outro_filter(
+                telegram_url=self.telegram_url,
+                font_path=self.font_path,
+                segment_duration=self.outro_seconds,
+                canvas=canvas,
+            ),
+            deadline,
+        )
+
+    def _segment_codec_args(self) -> list[str]:
+        if self.segment_encoding == "intermediate":
+            return ["-c:v", "libx264", "-preset", "ultrafast", "-qp", "0", "-pix_fmt", "yuv420p"]
+        if self.draft_scale > 1:
+            return ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p"]
+        return ["-c:v", "libx264", "-pix_fmt", "yuv420p"]
+
+    def _build_overlay_filter(self, deal: Deal, canvas: Canvas | None = None, tag: str = "") -> str:
         return self.design.game_overlay_filter(
             deal=deal,
             font_path=self.font_path,
             segment_duration=self.per_game_seconds,
+            canvas=canvas,
+            tag=tag,
         )
 
-    def _build_game_segment_from_trailer(self, trailer_url: str, deal: Deal, out_path: Path) -> None:
-        vf = self._build_overlay_filter(deal)
+    def _build_game_segment_from_trailer(
+        self, trailer_url: str, deal: Deal, out_path: Path, deadline: float | None = None
+    ) -> None:
         start_offset = self._compute_trailer_start_offset(trailer_url)
+        # -ss/-t as input options: ffmpeg seeks the demuxer to the keyframe
+        # before the offset (HTTP range request for mp4, the right segment for
+        # HLS/DASH) and only decodes from there, then trims to the exact
+        # frame. After -i it would download and decode everything up to the
+        # offset.
         command = [
             "ffmpeg",
             "-y",
-            "-i",
-            trailer_url,
             "-ss",
             f"{start_offset:.2f}",
             "-t",
             str(self.per_game_seconds),
-            "-vf",
-            vf,
-            "-r",
-            "30",
-            "-c:v",
-            "libx264",
-            "-pix_fmt",
-            "yuv420p",
-            "-an",
-            str(out_path),
+            "-i",
+            trailer_url,
         ]
-        subprocess.run(command, check=True, capture_output=True, timeout=self.ffmpeg_segment_timeout_seconds)
-        self._assert_segment_has_video(out_path)
+        # The trailer is decoded once and the frames are split into one
+        # branch per canvas; every format is encoded by this same process.
+        graph: list[str] = []
+        if len(self.canvases) == 1:
+            branches = ["[0:v]"]
+        else:
+            branches = [f"[src{idx}]" for idx in range(len(self.canvases))]
+            graph.append(f"[0:v]split={len(self.canvases)}{''.join(branches)}")
+        for idx, canvas in enumerate(self.canvases):
+            tag = str(idx)
+            if self.overlay_raster:
+                # The static card/ribbon/text chrome is one PNG, composited with a
+                # single overlay instead of ~25 drawbox/drawtext filters per frame.
+                layer = render_layers(
+                    self.design.scale_layers(self.design.game_layers(deal), canvas),
+                    self.font_path,
+                    (canvas.w, canvas.h),
+                    self._canvas_path(out_path, canvas).with_suffix(".png"),
+                )
+                command.extend(["-loop", "1", "-i", str(layer)])
+                graph.append(f"{branches[idx]}{self.design.game_background_filter(canvas, tag)}[base{tag}]")
+                graph.append(
+                    self.design.overlay_composite_filter(
+                        self.per_game_seconds,
+                        animated=self.design.animate_overlay,
+                        layer_input=f"[{idx + 1}:v]",
+                        tag=tag,
+                        canvas=canvas,
+                    )
+                )
+            else:
+                graph.append(f"{branches[idx]}{self._build_overlay_filter(deal, canvas, tag)}[v{tag}]")
+        command.extend(["-filter_complex", ";".join(graph)])
+        outputs = self._canvas_paths(out_path)
+        for idx, path in enumerate(outputs):
+            command.extend(["-map", f"[v{idx}]", *self._segment_output_args(path)])
+        self._run_ffmpeg(command, outputs, self._job_timeout(self.ffmpeg_segment_timeout_seconds, deadline))
+        for path in outputs:
+            self._assert_segment_has_video(path)
+
+    @staticmethod
+    def _job_timeout(timeout: float, deadline: float | None) -> float:
+        # A job never runs past the build deadline.
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining < 1.0:
+            raise SegmentDeadlineExceeded()
+        return min(timeout, remaining)
+
+    def _run_ffmpeg(self, command: list[str], out_paths: list[Path], timeout: float) -> None:
+        run = FfmpegRun(label=out_paths[0].name)
+        try:
+            run_ffmpeg(command, timeout, run, on_progress=self.metrics.progress_logger())
+        finally:
+            self.metrics.record(run, outputs=[path.name for path in out_paths], encoding=self.segment_encoding)
+        # The progress stream ends with the duration written, so a fresh
+        # output needs no ffprobe; all outputs of one run share it.
+        for out_path in out_paths:
+            self.probes.remember(out_path, run.out_seconds)
 
     def _compute_trailer_start_offset(self, trailer_url: str) -> float:
-        duration = self._probe_duration_seconds(trailer_url)
+        duration = self.probes.duration(trailer_url)
         if duration is None or duration <= self.per_game_seconds:
             return self.trailer_fallback_start_seconds
         return max((duration - self.per_game_seconds) / 2.0, 0.0)
 
-    @staticmethod
-    def _probe_duration_seconds(media_url: str) -> float | None:
-        command = [
-            "ffprobe",
-            "-v",
-            "error",
-            "-show_entries",
-            "format=duration",
-            "-of",
-            "default=noprint_wrappers=1:nokey=1",
-            media_url,
-        ]
-        try:
-            result = subprocess.run(command, check=True, capture_output=True, text=True, timeout=20)
-            raw = (result.stdout or "").strip()
-            if not raw:
-                return None
-            value = float(raw)
-            if value > 0:
-                return value
-        except Exception:
-            return None
-        return None
-
-    @staticmethod
-    def _assert_segment_has_video(path: Path, min_seconds: float = 0.5) -> None:
-        duration = TikTokPipeline._probe_duration_seconds(str(path))
+    def _assert_segment_has_video(self, path: Path, min_seconds: float = 0.5) -> None:
+        duration = self.probes.duration(path)
         if duration is None or duration < min_seconds:
             raise RuntimeError(f"Generated segment is empty or too short: {path} (duration={duration})")
 
-    def _concat_with_transitions(self, segments: list[Path], out_file: Path) -> None:
+    def _concat_with_transitions(self, segments: list[Path], out_file: Path, deadline: float | None = None) -> None:
         if len(segments) == 1:
             shutil.copyfile(segments[0], out_file)
             return
 
         durations: list[float] = []
         for seg in segments:
-            dur = self._probe_duration_seconds(str(seg))
+            dur = self.probes.duration(seg)
             durations.append(dur if dur and dur > 0 else 0.0)
 
         min_duration = min(durations) if durations else 0.0
@@ -208,87 +356,538 @@ class TikTokPipeline:
                 "-map",
                 current_label,
                 "-r",
-                "30",
+                str(self.design.fps),
                 "-c:v",
                 "libx264",
                 "-preset",
-                "fast",
+                self.concat_preset,
                 "-crf",
-                "22",
+                str(self.concat_crf),
                 "-pix_fmt",
                 "yuv420p",
                 "-an",
                 "-movflags",
                 "+faststart",
-                str(out_file),
             ]
         )
-        subprocess.run(command, check=True, capture_output=True, timeout=self.ffmpeg_concat_timeout_seconds)
+        if self.concat_threads:
+            command.extend(["-threads", str(self.concat_threads)])
+        command.append(str(out_file))
+        timeout = self._concat_timeout(sum(durations) - transition * (len(segments) - 1))
+        self._run_ffmpeg(command, [out_file], self._job_timeout(timeout, deadline))
 
-    def generate_daily_video(self, deals_with_trailers: list[tuple[Deal, list[str]]]) -> Path | None:
+    def _concat_plain(self, segments: list[Path], out_file: Path) -> None:
+        # No xfade graph and ultrafast: the cheapest pass that still makes
+        # one video out of the segments.
+        list_file = out_file.with_name(f".{out_file.stem}_concat.txt")
+        list_file.write_text("".join(f"file '{seg.resolve()}'\n" for seg in segments), encoding="utf-8")
+        command = [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            str(list_file),
+            "-r",
+            str(self.design.fps),
+            "-c:v",
+            "libx264",
+            "-preset",
+            "ultrafast",
+            "-crf",
+            str(self.concat_crf),
+            "-pix_fmt",
+            "yuv420p",
+            "-an",
+            "-movflags",
+            "+faststart",
+            str(out_file),
+        ]
+        video_seconds = sum(self.probes.duration(seg) or 0.0 for seg in segments)
+        try:
+            self._run_ffmpeg(command, [out_file], self._concat_timeout(video_seconds))
+        finally:
+            list_file.unlink(missing_ok=True)
+
+    def _concat_timeout(self, video_seconds: float) -> float:
+        return max(
+            self.ffmpeg_concat_timeout_seconds,
+            4 * self.render_stats.estimate("concat_per_second", 0.5) * video_seconds,
+        )
+
+    def _concat_segments(self, segments: list[Path], out_file: Path, deadline: float | None) -> None:
+        # An over-budget build still ships a video from whatever finished:
+        # if the xfade pass cannot make the deadline, the segments are
+        # joined without transitions instead.
+        try:
+            self._concat_with_transitions(segments, out_file, deadline)
+        except (SegmentDeadlineExceeded, subprocess.TimeoutExpired):
+            self.logger.warning("Daily build budget: no time for transitions, plain concat of %s", out_file.name)
+            self._concat_plain(segments, out_file)
+
+    def _render_fingerprint(self) -> dict:
+        # Everything besides the content itself that changes rendered pixels.
+        font = Path(self.font_path)
+        font_stat = font.stat() if font.exists() else None
+        design = asdict(self.design)
+        # Each canvas is cached under its own key (see _canvas_cache_key).
+        design.pop("canvases")
+        return {
+            "design": design,
+            "font": [self.font_path, font_stat.st_size if font_stat else 0, int(font_stat.st_mtime) if font_stat else 0],
+            "segment_encoding": self.segment_encoding,
+            "cache_encoding": [self.cache_preset, self.cache_crf] if self.segment_encoding == "intermediate" else None,
+            "overlay_raster": self.overlay_raster,
+        }
+
+    def _segment_cache_key(self, deal: Deal, trailer_url: str) -> str:
+        parts = urlsplit(trailer_url)
+        return SegmentCache.key(
+            kind="game",
+            appid=deal.appid,
+            trailer=urlunsplit((parts.scheme, parts.netloc, parts.path, "", "")),
+            name=deal.name,
+            original_price=deal.original_price,
+            final_price=deal.final_price,
+            currency=deal.currency,
+            discount_percent=deal.discount_percent,
+            per_game_seconds=self.per_game_seconds,
+            trailer_fallback_start_seconds=self.trailer_fallback_start_seconds,
+            **self._render_fingerprint(),
+        )
+
+    def _slot_key(self, **parts) -> str:
+        canvases = [[canvas.name, canvas.w, canvas.h] for canvas in self.canvases]
+        return SegmentCache.key(**parts, canvases=canvases, **self._render_fingerprint())
+
+    def _canvas_cache_key(self, key: str, canvas: Canvas) -> str:
+        if (canvas.w, canvas.h) == (self.design.w, self.design.h):
+            return key
+        return f"{key}_{canvas.w}x{canvas.h}"
+
+    def _cache_get(self, key: str, out_path: Path) -> bool:
+        # A hit needs every canvas; otherwise the segment is rendered again.
+        for canvas in self.canvases:
+            cache_key = self._canvas_cache_key(key, canvas)
+            path = self._canvas_path(out_path, canvas)
+            if not self.segment_cache.get(cache_key, path):
+                return False
+            # The copy is a new file to the probe cache.
+            self.probes.remember(path, self.segment_cache.duration(cache_key))
+        return True
+
+    def _cache_put(self, key: str, out_path: Path, deadline: float | None = None) -> None:
+        for canvas in self.canvases:
+            path = self._canvas_path(out_path, canvas)
+            if self.segment_encoding != "intermediate":
+                self.segment_cache.put(self._canvas_cache_key(key, canvas), path, self.probes.duration(path))
+                continue
+            mezzanine = path.with_name(f"{path.stem}.cache{path.suffix}")
+            try:
+                command = self._cache_encode_command(path, mezzanine)
+                self._run_ffmpeg(command, [mezzanine], self._job_timeout(self.ffmpeg_segment_timeout_seconds, deadline))
+                self.segment_cache.put(self._canvas_cache_key(key, canvas), mezzanine, self.probes.duration(mezzanine))
+            except Exception as exc:
+                self.logger.warning("Segment not cached, re-encode failed for %s: %s", path.name, exc)
+            finally:
+                mezzanine.unlink(missing_ok=True)
+
+    def _cache_encode_command(self, path: Path, out_path: Path) -> list[str]:
+        return [
+            "ffmpeg",
+            "-y",
+            "-i",
+            str(path),
+            "-c:v",
+            "libx264",
+            "-preset",
+            self.cache_preset,
+            "-crf",
+            str(self.cache_crf),
+            "-pix_fmt",
+            "yuv420p",
+            "-an",
+            "-threads",
+            str(self.ffmpeg_threads),
+            str(out_path),
+        ]
+
+    def _game_slot_key(self, deal: Deal, trailer_urls: list[str]) -> str:
+        return self._slot_key(
+            kind="game",
+            appid=deal.appid,
+            name=deal.name,
+            original_price=deal.original_price,
+            final_price=deal.final_price,
+            currency=deal.currency,
+            discount_percent=deal.discount_percent,
+            trailers=[TrailerHealth.normalize(url) for url in trailer_urls],
+            per_game_seconds=self.per_game_seconds,
+        )
+
+    def _checkpointed(self, manifest: BuildManifest, name: str, key: str, out_path: Path, build) -> bool:
+        entry = manifest.get(name, key)
+        if entry is not None and all(path.exists() for path in self._canvas_paths(out_path)):
+            self.logger.info("Daily build resume: %s already done", name)
+            return True
+        ok = build(out_path) is not False
+        if ok:
+            manifest.record(name, key, out_path)
+        return ok
+
+    def _cleanup_stale_builds(self, keep: Path) -> None:
+        for path in list(self.output_dir.glob(".build_*")) + list(self.output_dir.glob(".tmp_*")):
+            if path != keep and path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _has_cached_segment(self, deal: Deal, trailer_urls: list[str]) -> bool:
+        if self.segment_cache is None:
+            return False
+        return any(
+            all(
+                self.segment_cache.path_for(self._canvas_cache_key(self._segment_cache_key(deal, url), canvas)).exists()
+                for canvas in self.canvases
+            )
+            for url in trailer_urls
+        )
+
+    def _intro_segment(self, out_path: Path, date_str: str, deadline: float | None = None) -> None:
+        # Intro depends only on the date, outro on nothing that changes daily:
+        # both come from the segment cache after the first render.
+        self._cached_static_segment(
+            out_path,
+            lambda path: self._build_intro(path, date_str, deadline),
+            deadline,
+            kind="intro",
+            date=date_str,
+            seconds=self.intro_seconds,
+        )
+
+    def _outro_segment(self, out_path: Path, deadline: float | None = None) -> None:
+        self._cached_static_segment(
+            out_path,
+            lambda path: self._build_outro(path, deadline),
+            deadline,
+            kind="outro",
+            telegram_url=self.telegram_url,
+            seconds=self.outro_seconds,
+        )
+
+    def _cached_static_segment(self, out_path: Path, build, deadline: float | None, **key_parts) -> None:
+        if self.segment_cache is None:
+            build(out_path)
+            return
+        key = SegmentCache.key(**key_parts, **self._render_fingerprint())
+        if self._cache_get(key, out_path):
+            self.logger.info("Daily %s reused from cache", key_parts["kind"])
+            return
+        build(out_path)
+        self._cache_put(key, out_path, deadline)
+
+    def _prerender_intro(self, date_str: str, deadline: float | None) -> None:
+        if deadline is not None and time.monotonic() >= deadline - 1.0:
+            self.logger.info("Daily build budget: skipping intro pre-render for %s", date_str)
+            return
+        # Not a .tmp_* dir: _cleanup_stale_builds of the next build must not
+        # remove it while this runs in the background (one at a time, so the
+        # name never clashes; a leftover from a crash is reused).
+        work_dir = self.output_dir / f".prerender_intro_{date_str}"
+        try:
+            work_dir.mkdir(parents=True, exist_ok=True)
+            self._intro_segment(work_dir / "intro.mp4", date_str, deadline)
+        except Exception:
+            self.logger.exception("Failed to pre-render intro for %s", date_str)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _build_game_segment(
+        self, deal: Deal, trailer_urls: list[str], seg: Path, deadline: float | None = None
+    ) -> bool:
+        # (input, trailer URL it came from); the cache key always uses the URL.
+        ordered_urls = self.trailer_health.order(trailer_urls)
+        skipped = len(trailer_urls) - len(ordered_urls)
+        if skipped:
+            self.logger.info("Skipping %s recently failed trailers for appid=%s", skipped, deal.appid)
+        sources = [(url, url) for url in ordered_urls]
+        if self.trailer_transcoder is not None:
+            # A trailer already transcoded for Telegram is local and
+            # seekable; try it before going to the network.
+            cached = self.trailer_transcoder.cached(deal.appid, trailer_urls)
+            if cached:
+                sources.insert(0, (str(cached[1]), cached[0]))
+
+        if self.segment_cache is not None:
+            for trailer_url in trailer_urls:
+                if self._cache_get(self._segment_cache_key(deal, trailer_url), seg):
+                    self.logger.info("Daily segment reused from cache: appid=%s url=%s", deal.appid, trailer_url)
+                    return True
+
+        for trailer_url, source_url in sources:
+            self.logger.info("Daily segment build start: appid=%s url=%s", deal.appid, trailer_url)
+            try:
+                self._build_game_segment_from_trailer(trailer_url, deal, seg, deadline)
+                self.logger.info("Daily segment build ok: appid=%s", deal.appid)
+                if trailer_url == source_url:
+                    self.trailer_health.record_success(source_url)
+                if self.segment_cache is not None:
+                    self._cache_put(self._segment_cache_key(deal, source_url), seg, deadline)
+                return True
+            except subprocess.TimeoutExpired:
+                if deadline is not None and time.monotonic() >= deadline - 1.0:
+                    raise SegmentDeadlineExceeded() from None
+                self.logger.warning(
+                    "Trailer segment timeout for appid=%s url=%s",
+                    deal.appid,
+                    trailer_url,
+                )
+                failure = "timeout"
+            except subprocess.CalledProcessError as e:
+                self.logger.warning(
+                    "Trailer segment failed for appid=%s url=%s code=%s",
+                    deal.appid,
+                    trailer_url,
+                    e.returncode,
+                )
+                failure = "ffmpeg"
+            except RuntimeError as e:
+                self.logger.warning(
+                    "Trailer segment empty for appid=%s url=%s: %s",
+                    deal.appid,
+                    trailer_url,
+                    e,
+                )
+                failure = "empty"
+            # Only remote URLs are tracked; a bad local transcode is not the
+            # URL's fault.
+            if trailer_url == source_url:
+                self.trailer_health.record_failure(source_url, failure)
+        self.logger.warning("All trailers failed for appid=%s. Skipping game in daily video.", deal.appid)
+        return False
+
+    @staticmethod
+    def _deal_priority(deal: Deal) -> tuple:
+        return -deal.discount_percent, -(deal.original_price - deal.final_price), deal.appid
+
+    def _video_seconds(self, games: int) -> float:
+        clips = games + 2
+        return self.intro_seconds + self.outro_seconds + games * self.per_game_seconds - (clips - 1) * self.transition_seconds
+
+    def _max_games(self) -> int | None:
+        if not self.max_video_seconds:
+            return None
+        room = self.max_video_seconds - self._video_seconds(0)
+        return max(int(room // (self.per_game_seconds - self.transition_seconds)), 1)
+
+    def _estimate_render(
+        self, manifest: BuildManifest, deal: Deal, trailer_urls: list[str], name: str, key: str
+    ) -> tuple[float | None, str | None]:
+        # (expected seconds or None before anything was measured, stats kind
+        # to record the real time under)
+        if manifest.get(name, key) is not None:
+            return 0.0, None
+        kind = "game_cached" if self._has_cached_segment(deal, trailer_urls) else "game"
+        return self.render_stats.estimate(kind, None), kind
+
+    def _render_game(
+        self, deal: Deal, trailer_urls: list[str], seg: Path, deadline: float | None, kind: str | None
+    ) -> bool:
+        started = time.monotonic()
+        ok = self._build_game_segment(deal, trailer_urls, seg, deadline)
+        if ok and kind:
+            self.render_stats.record(kind, time.monotonic() - started)
+        return ok
+
+    def generate_daily_video(
+        self, deals_with_trailers: list[tuple[Deal, list[str]]], date_str: str | None = None
+    ) -> Path | None:
         if not deals_with_trailers:
             return None
 
-        date_obj = datetime.now(self.tz)
+        # A queued job renders under the day it was queued for, even if the
+        # worker only gets to it after midnight.
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d") if date_str else datetime.now(self.tz)
         date_str = date_obj.strftime("%Y-%m-%d")
         out_file = self.output_dir / f"steam_discounts_{date_str}.mp4"
-        temp_dir = self.output_dir / f".tmp_{date_str}_{date_obj.strftime('%H%M%S')}"
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        # One build dir per day. It survives failures and restarts, and the
+        # manifest in it lets a retry render only the missing segments, or
+        # only redo the concat.
+        temp_dir = self.output_dir / f".build_{date_str}"
+        self._cleanup_stale_builds(keep=temp_dir)
+        manifest = BuildManifest(temp_dir)
+        if manifest.resumed:
+            self.logger.info("Resuming daily build %s with %s checkpointed segments", temp_dir.name, manifest.resumed)
 
         segments: list[Path] = []
+        intro = temp_dir / "intro.mp4"
+        outro = temp_dir / "outro.mp4"
+        intro_key = self._slot_key(kind="intro", date=date_str, seconds=self.intro_seconds)
+        outro_key = self._slot_key(kind="outro", telegram_url=self.telegram_url, seconds=self.outro_seconds)
+        # Priority order is also the order in the video: when the budget or
+        # the target length cuts the list, the best deals are the ones kept.
+        slots = [
+            (deal, trailer_urls, f"game:{deal.appid}", self._game_slot_key(deal, trailer_urls))
+            for deal, trailer_urls in sorted(deals_with_trailers, key=lambda entry: self._deal_priority(entry[0]))
+        ]
+        max_games = self._max_games()
         try:
-            intro = temp_dir / "intro.mp4"
-            self._build_intro(intro, date_str)
-            segments.append(intro)
-
-            built_game_segments = 0
-            for idx, (deal, trailer_urls) in enumerate(deals_with_trailers, start=1):
-                seg = temp_dir / f"game_{idx:03d}.mp4"
-                built = False
-                for trailer_url in trailer_urls:
-                    self.logger.info("Daily segment build start: appid=%s url=%s", deal.appid, trailer_url)
-                    try:
-                        self._build_game_segment_from_trailer(trailer_url, deal, seg)
-                        built = True
-                        self.logger.info("Daily segment build ok: appid=%s", deal.appid)
-                        break
-                    except subprocess.TimeoutExpired:
-                        self.logger.warning(
-                            "Trailer segment timeout for appid=%s url=%s",
-                            deal.appid,
-                            trailer_url,
-                        )
-                    except subprocess.CalledProcessError as e:
-                        self.logger.warning(
-                            "Trailer segment failed for appid=%s url=%s code=%s",
-                            deal.appid,
-                            trailer_url,
-                            e.returncode,
+            render_started = time.monotonic()
+            build_deadline = render_started + self.build_budget_seconds if self.build_budget_seconds else None
+            # Segments have to be done early enough to leave the measured
+            # concat time (for the longest possible video, at most half the
+            # budget) before the deadline.
+            segments_deadline = None
+            concat_reserve = 0.0
+            if self.build_budget_seconds:
+                planned = len(slots) if max_games is None else min(len(slots), max_games)
+                concat_reserve = min(
+                    self.render_stats.estimate("concat_per_second", 0.5) * self._video_seconds(planned),
+                    self.build_budget_seconds / 2,
+                )
+                segments_deadline = build_deadline - concat_reserve
+            # Probe every candidate trailer that has to be rendered up front
+            # and in parallel; the render jobs then find the durations cached.
+            self.probes.prefetch(
+                [
+                    url
+                    for deal, trailer_urls, name, key in slots[: max_games or len(slots)]
+                    if manifest.get(name, key) is None and not self._has_cached_segment(deal, trailer_urls)
+                    for url in self.trailer_health.order(trailer_urls)
+                ]
+            )
+            with ThreadPoolExecutor(max_workers=self.render_workers, thread_name_prefix="shorts-render") as pool:
+                intro_job = pool.submit(
+                    self._checkpointed,
+                    manifest,
+                    "intro",
+                    intro_key,
+                    intro,
+                    lambda path: self._intro_segment(path, date_str, build_deadline),
+                )
+                outro_job = pool.submit(
+                    self._checkpointed,
+                    manifest,
+                    "outro",
+                    outro_key,
+                    outro,
+                    lambda path: self._outro_segment(path, build_deadline),
+                )
+                # Games are handed out one at a time, in priority order, while a
+                # worker is free, the target length is not reached yet and the
+                # next game's estimated render time still fits the budget.
+                # A game that fails frees its place for the next one.
+                queue = list(enumerate(slots))
+                in_flight: dict = {}
+                built: dict[int, Path] = {}
+                while queue or in_flight:
+                    while (
+                        queue
+                        and len(in_flight) < self.render_workers
+                        and (max_games is None or len(built) + len(in_flight) < max_games)
+                    ):
+                        index, (deal, trailer_urls, name, key) = queue[0]
+                        estimate, kind = self._estimate_render(manifest, deal, trailer_urls, name, key)
+                        # The first game is always tried while time is left:
+                        # a video needs one, and its timeout is clipped anyway.
+                        remaining = None if segments_deadline is None else segments_deadline - time.monotonic()
+                        if remaining is not None and (
+                            remaining < 1.0 or (estimate is not None and (built or in_flight) and estimate > remaining)
+                        ):
+                            self.logger.warning(
+                                "Daily build budget: leaving out %s games (%.0fs left, next one needs ~%.0fs)",
+                                len(queue),
+                                max(remaining, 0.0),
+                                estimate or 0.0,
+                            )
+                            queue.clear()
+                            break
+                        queue.pop(0)
+                        seg = temp_dir / f"game_{deal.appid}.mp4"
+                        job = pool.submit(
+                            self._checkpointed,
+                            manifest,
+                            name,
+                            key,
+                            seg,
+                            lambda path, deal=deal, trailer_urls=trailer_urls, kind=kind: self._render_game(
+                                deal, trailer_urls, path, segments_deadline, kind
+                            ),
                         )
-                    except RuntimeError as e:
-                        self.logger.warning(
-                            "Trailer segment empty for appid=%s url=%s: %s",
-                            deal.appid,
-                            trailer_url,
-                            e,
+                        in_flight[job] = (index, seg)
+                    if not in_flight:
+                        break
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    for job in done:
+                        index, seg = in_flight.pop(job)
+                        try:
+                            if job.result():
+                                built[index] = seg
+                        except SegmentDeadlineExceeded:
+                            self.logger.warning("Daily build budget ran out while rendering %s", seg.name)
+                        self.logger.info(
+                            "Daily build progress: %s games ready, %s rendering, %s queued, %.0fs elapsed",
+                            len(built),
+                            len(in_flight),
+                            len(queue),
+                            time.monotonic() - render_started,
                         )
-                if not built:
-                    self.logger.warning("All trailers failed for appid=%s. Skipping game in daily video.", deal.appid)
-                    continue
-                segments.append(seg)
-                built_game_segments += 1
-
-            outro = temp_dir / "outro.mp4"
-            self._build_outro(outro)
-            segments.append(outro)
+                intro_job.result()
+                segments.append(intro)
+                segments.extend(built[index] for index in sorted(built))
+                built_game_segments = len(built)
+                outro_job.result()
+                segments.append(outro)
 
             # Intro + outro only (no game segments) is not useful.
             if len(segments) <= 2:
                 return None
 
-            self._concat_with_transitions(segments, out_file)
-            self.logger.info("Daily video concat done. game_segments=%s output=%s", built_game_segments, out_file)
-            self._mark_generated_today()
+            concat_started = time.monotonic()
+            # The concat keeps at least its reserve even if the segments ran
+            # late.
+            concat_deadline = None if build_deadline is None else max(build_deadline, concat_started + concat_reserve)
+            outputs = self._canvas_paths(out_file)
+            with ThreadPoolExecutor(max_workers=len(self.canvases), thread_name_prefix="shorts-concat") as pool:
+                concat_jobs = [
+                    pool.submit(
+                        self._concat_segments,
+                        [self._canvas_path(seg, canvas) for seg in segments],
+                        self._canvas_path(out_file, canvas),
+                        concat_deadline,
+                    )
+                    for canvas in self.canvases
+                ]
+                for job in concat_jobs:
+                    job.result()
+            finished = time.monotonic()
+            self.render_stats.record(
+                "concat_per_second", (finished - concat_started) / max(self._video_seconds(built_game_segments), 1.0)
+            )
+            self.logger.info(
+                "Daily video concat done. game_segments=%s/%s output=%s",
+                built_game_segments,
+                len(slots),
+                ", ".join(str(path) for path in outputs),
+            )
+            self.logger.info(
+                "Daily video timings: encoding=%s segments=%.1fs concat=%.1fs total=%.1fs budget=%s",
+                self.segment_encoding,
+                concat_started - render_started,
+                finished - concat_started,
+                finished - render_started,
+                f"{self.build_budget_seconds}s" if self.build_budget_seconds else "none",
+            )
+            # The next days' intros go into the cache in the background, so
+            # those builds start straight with the game segments.
+            if self.segment_cache is not None:
+                for days_ahead in range(1, self.intro_prerender_days + 1):
+                    ahead = (date_obj + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
+                    self._prerender_pool.submit(self._prerender_intro, ahead, build_deadline)
+            shutil.rmtree(temp_dir, ignore_errors=True)
             return out_file
+        except Exception:
+            self.logger.warning("Daily build failed; %s is kept so the next run resumes from it", temp_dir.name)
+            raise
         finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            self.render_stats.save()
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+from app.media_preflight import VIDEO_MAX_BYTES
+
+
+class TrailerTranscoder:
+    # Steam mostly serves HLS/DASH trailers, which the Bot API does not accept
+    # by URL. Each chosen trailer is fetched once and transcoded in the
+    # background into a short, size-capped MP4 that Telegram can take as an
+    # upload and TikTokPipeline can use as a local segment source.
+    def __init__(
+        self,
+        cache_dir: str,
+        max_seconds: int = 45,
+        max_bytes: int = VIDEO_MAX_BYTES,
+        max_height: int = 720,
+        max_workers: int = 2,
+        timeout_seconds: int = 180,
+        max_age_days: int = 14,
+        retry_seconds: float = 21600.0,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_seconds = max(max_seconds, 5)
+        self.max_bytes = max_bytes
+        self.max_height = max_height
+        self.timeout_seconds = timeout_seconds
+        self.max_age_days = max_age_days
+        self.retry_seconds = max(retry_seconds, 0.0)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="trailer-transcode")
+        self._in_flight: dict[Path, Future] = {}
+        # path -> monotonic time of the last failed transcode.
+        self._failed: dict[Path, float] = {}
+        self._lock = threading.Lock()
+        self._cleaned_at = 0.0
+
+    def path_for(self, appid: int, trailer_url: str) -> Path:
+        # Query tokens on Steam CDN URLs change between requests; the key is
+        # the stable part of the URL.
+        parts = urlsplit(trailer_url)
+        stable_url = urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+        digest = hashlib.sha1(stable_url.encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir / f"{appid}_{digest}.mp4"
+
+    def cached(self, appid: int, trailer_urls: list[str]) -> tuple[str, Path] | None:
+        for url in trailer_urls:
+            path = self.path_for(appid, url)
+            if path.exists():
+                return url, path
+        return None
+
+    def submit(self, appid: int, trailer_url: str) -> Future:
+        if time.monotonic() - self._cleaned_at > 3600:
+            self._cleaned_at = time.monotonic()
+            removed = self.cleanup()
+            if removed:
+                self.logger.info("Removed %s stale transcoded trailers", removed)
+        path = self.path_for(appid, trailer_url)
+        with self._lock:
+            future = self._in_flight.get(path)
+            if future is not None:
+                return future
+            future = Future()
+            if path.exists():
+                future.set_result(path)
+                return future
+            if self._recently_failed(path):
+                future.set_exception(RuntimeError(f"Trailer transcode failed recently: {trailer_url}"))
+                return future
+            future = self._executor.submit(self._transcode, trailer_url, path)
+            self._in_flight[path] = future
+        future.add_done_callback(lambda done: self._settle(appid, trailer_url, path, done))
+        return future
+
+    def prefetch(self, appid: int, trailer_urls: list[str]) -> None:
+        # Never waits. Starts the first trailer that has not failed recently;
+        # the next one is tried on a later call, once this one has failed.
+        if self.cached(appid, trailer_urls):
+            return
+        with self._lock:
+            pending = [url for url in trailer_urls if not self._recently_failed(self.path_for(appid, url))]
+        if pending:
+            self.submit(appid, pending[0])
+
+    def cleanup(self) -> int:
+        # Deals rarely last more than two weeks; older files are dead weight.
+        cutoff = time.time() - self.max_age_days * 86400
+        removed = 0
+        for path in self.cache_dir.glob("*.mp4"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        with self._lock:
+            for path in [path for path in self._failed if not self._recently_failed(path)]:
+                del self._failed[path]
+        return removed
+
+    def _recently_failed(self, path: Path) -> bool:
+        failed_at = self._failed.get(path)
+        return failed_at is not None and time.monotonic() - failed_at < self.retry_seconds
+
+    def _settle(self, appid: int, trailer_url: str, path: Path, future: Future) -> None:
+        exc = future.exception()
+        with self._lock:
+            self._in_flight.pop(path, None)
+            if exc is not None:
+                self._failed[path] = time.monotonic()
+        if exc is not None:
+            self.logger.warning("Trailer transcode failed for appid=%s url=%s: %s", appid, trailer_url, exc)
+
+    def _transcode(self, trailer_url: str, out_path: Path) -> Path:
+        # Bitrate is capped so the whole clip fits into max_bytes with some
+        # room for the container and the audio track.
+        audio_kbps = 96
+        video_kbps = max(int(self.max_bytes * 8 * 0.9 / self.max_seconds / 1000) - audio_kbps, 300)
+        tmp_path = out_path.with_suffix(".part.mp4")
+        command = [
+            "ffmpeg",
+            "-y",
+            "-i",
+            trailer_url,
+            "-t",
+            str(self.max_seconds),
+            "-vf",
+            f"scale=-2:'min({self.max_height},ih)'",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-crf",
+            "23",
+            "-maxrate",
+            f"{video_kbps}k",
+            "-bufsize",
+            f"{video_kbps * 2}k",
+            "-pix_fmt",
+            "yuv420p",
+            "-c:a",
+            "aac",
+            "-b:a",
+            f"{audio_kbps}k",
+            "-ac",
+            "2",
+            "-movflags",
+            "+faststart",
+            str(tmp_path),
+        ]
+        started = time.monotonic()
+        try:
+            subprocess.run(command, check=True, capture_output=True, timeout=self.timeout_seconds)
+            size = tmp_path.stat().st_size
+            if size > self.max_bytes:
+                raise RuntimeError(f"Transcoded trailer is too large: {size} > {self.max_bytes}")
+            tmp_path.replace(out_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self.logger.info(
+            "Trailer transcoded: %s -> %s (%s bytes, %.1fs)",
+            trailer_url,
+            out_path.name,
+            out_path.stat().st_size,
+            time.monotonic() - started,
+        )
+        return out_path
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+
+class TrailerHealth:
+    # Remembers which trailer URLs failed to render (timeout, ffmpeg error,
+    # empty output) with an exponential backoff, and which ones worked, in
+    # a small JSON file next to the videos. Dead URLs are skipped until their
+    # backoff runs out; known-good ones are tried first.
+    def __init__(
+        self,
+        path: Path,
+        base_backoff_seconds: float = 3600,
+        max_backoff_seconds: float = 7 * 86400,
+        max_age_seconds: float = 30 * 86400,
+    ):
+        self.path = Path(path)
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_age_seconds = max_age_seconds
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = self._load()
+
+    @staticmethod
+    def normalize(url: str) -> str:
+        parts = urlsplit(url)
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+    def is_blocked(self, url: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(self.normalize(url))
+        return bool(entry and entry.get("retry_at", 0) > time.time())
+
+    def order(self, urls: list[str]) -> list[str]:
+        # Known-good first, then untried, then ones whose backoff expired
+        # (fewest failures first); URLs still backing off are dropped.
+        now = time.time()
+        ranked = []
+        with self._lock:
+            for position, url in enumerate(urls):
+                entry = self._entries.get(self.normalize(url)) or {}
+                if entry.get("retry_at", 0) > now:
+                    continue
+                failures = entry.get("failures", 0)
+                rank = 0 if entry.get("last_ok") and not failures else (1 if not failures else 2)
+                ranked.append((rank, failures, position, url))
+        return [url for *_, url in sorted(ranked)]
+
+    def record_success(self, url: str) -> None:
+        with self._lock:
+            self._entries[self.normalize(url)] = {"last_ok": time.time(), "failures": 0}
+            self._save()
+
+    def record_failure(self, url: str, kind: str) -> None:
+        now = time.time()
+        with self._lock:
+            key = self.normalize(url)
+            entry = self._entries.get(key) or {}
+            failures = entry.get("failures", 0) + 1
+            backoff = min(self.base_backoff_seconds * (2 ** (failures - 1)), self.max_backoff_seconds)
+            self._entries[key] = {
+                "failures": failures,
+                "kind": kind,
+                "failed_at": now,
+                "retry_at": now + backoff,
+                "last_ok": entry.get("last_ok"),
+            }
+            self._save()
+        self.logger.info("Trailer %s failed (%s, %s in a row), retry in %.0fs", key, kind, failures, backoff)
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            self.logger.exception("Failed to read trailer health file %s, starting empty", self.path)
+            return {}
+        cutoff = time.time() - self.max_age_seconds
+        return {
+            url: entry
+            for url, entry in entries.items()
+            if max(entry.get("failed_at") or 0, entry.get("last_ok") or 0) >= cutoff
+        }
+
+    def _save(self) -> None:
+        tmp_path = self.path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(self._entries, indent=1, sort_keys=True), encoding="utf-8")
+            tmp_path.replace(self.path)
+        except OSError:
+            self.logger.exception("Failed to write trailer health file %s", self.path)
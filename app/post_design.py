@@ -42,33 +42,76 @@ def _fmt_uah(cents: int, currency: str, usd_to_uah_rate: float) -> str:
     return f"{_to_uah(cents, currency, usd_to_uah_rate):,.0f} ₴"
 
 
-def _format_time_left(expires_at: datetime) -> str:
+# Per-locale copy. Currencies are the price columns shown in the caption,
+# in order; only USD and UAH conversions are supported.
+LOCALES: dict[str, dict] = {
+    "uk": {
+        "currencies": ("USD", "UAH"),
+        "ends_now": "закінчується зараз",
+        "days": "д",
+        "hours": "г",
+        "minutes": "хв",
+        "badges": ("🧨 МЕГА", "🔥 HOT", "⚡ ТОП", "💎 ВАРТО", "💸 SALE"),
+        "new_price": "НОВА ЦІНА",
+        "price": "ЦІНА",
+        "was": "Було",
+        "save": "Ти економиш",
+        "left": "ЗАЛИШИЛОСЬ",
+        "until": "ДО",
+        "cta": "🕹️ Забирай, поки діє знижка 👇",
+        # Kept as the original English link text of the default channel.
+        "open_in": "Open in",
+    },
+    "en": {
+        "currencies": ("USD",),
+        "ends_now": "ending now",
+        "days": "d",
+        "hours": "h",
+        "minutes": "m",
+        "badges": ("🧨 MEGA", "🔥 HOT", "⚡ TOP", "💎 WORTH IT", "💸 SALE"),
+        "new_price": "NEW PRICE",
+        "price": "PRICE",
+        "was": "Was",
+        "save": "You save",
+        "left": "TIME LEFT",
+        "until": "UNTIL",
+        "cta": "🕹️ Grab it while the discount lasts 👇",
+        "open_in": "Open in",
+    },
+}
+DEFAULT_LOCALE = "uk"
+
+
+def _format_time_left(expires_at: datetime, copy: dict | None = None) -> str:
+    copy = copy or LOCALES[DEFAULT_LOCALE]
     now = datetime.now(timezone.utc)
     delta = expires_at - now
     if delta.total_seconds() <= 0:
-        return "закінчується зараз"
+        return copy["ends_now"]
 
     total_minutes = int(delta.total_seconds() // 60)
     days, rem_minutes = divmod(total_minutes, 60 * 24)
     hours, minutes = divmod(rem_minutes, 60)
 
+    d, h, m = copy["days"], copy["hours"], copy["minutes"]
     if days:
-        return f"{days}д {hours}г"
+        return f"{days}{d} {hours}{h}"
     if hours:
-        return f"{hours}г {minutes}хв"
-    return f"{minutes}хв"
+        return f"{hours}{h} {minutes}{m}"
+    return f"{minutes}{m}"
 
 
-def _badge(discount_percent: int) -> str:
+def _badge(discount_percent: int, copy: dict | None = None) -> str:
+    mega, hot, top, worth, sale = (copy or LOCALES[DEFAULT_LOCALE])["badges"]
     if discount_percent >= 90:
-        return "🧨 МЕГА"
+        return mega
     if discount_percent >= 80:
-        return "🔥 HOT"
+        return hot
     if discount_percent >= 60:
-        return "⚡ ТОП"
+        return top
     if discount_percent >= 40:
-        return "💎 ВАРТО"
-    return "💸 SALE"
+        return worth
+    return sale
 
 
 def _hype_emoji(discount_percent: int) -> str:
@@ -83,42 +126,57 @@ def _hype_emoji(discount_percent: int) -> str:
     return "🛒"
 
 
+_PRICE_FORMATTERS = {
+    "USD": _fmt_usd,
+    "UAH": _fmt_uah,
+}
+
+
 class DealPostFormatter:
-    def __init__(self, usd_to_uah_rate: float = 41.0):
+    def __init__(self, usd_to_uah_rate: float = 41.0, locale: str = DEFAULT_LOCALE, currencies: tuple[str, ...] = ()):
+        if locale not in LOCALES:
+            raise ValueError(f"Unsupported caption locale: {locale}")
         self.usd_to_uah_rate = usd_to_uah_rate
+        self.locale = locale
+        self.copy = LOCALES[locale]
+        self.currencies = tuple(code.upper() for code in currencies) or self.copy["currencies"]
+        unsupported = [code for code in self.currencies if code not in _PRICE_FORMATTERS]
+        if unsupported:
+            raise ValueError(f"Unsupported caption currencies: {unsupported}")
+
+    def _prices(self, cents: int, currency: str) -> str:
+        return " • ".join(_PRICE_FORMATTERS[code](cents, currency, self.usd_to_uah_rate) for code in self.currencies)
 
     def build_caption(self, deal: Deal) -> str:
+        copy = self.copy
         raw_title = (deal.name or "").strip()
         title = escape(raw_title)
 
         expires_at = datetime.fromtimestamp(deal.discount_expiration, tz=timezone.utc)
         ends_at = expires_at.strftime("%d.%m.%Y %H:%M UTC")
-        left = _format_time_left(expires_at)
+        left = _format_time_left(expires_at, copy)
 
-        old_usd = _fmt_usd(deal.original_price, deal.currency, self.usd_to_uah_rate)
-        new_usd = _fmt_usd(deal.final_price, deal.currency, self.usd_to_uah_rate)
-        old_uah = _fmt_uah(deal.original_price, deal.currency, self.usd_to_uah_rate)
-        new_uah = _fmt_uah(deal.final_price, deal.currency, self.usd_to_uah_rate)
+        old_prices = self._prices(deal.original_price, deal.currency)
+        new_prices = self._prices(deal.final_price, deal.currency)
 
         saved_cents = max(deal.original_price - deal.final_price, 0)
-        saved_usd = _fmt_usd(saved_cents, deal.currency, self.usd_to_uah_rate)
-        saved_uah = _fmt_uah(saved_cents, deal.currency, self.usd_to_uah_rate)
+        saved_prices = self._prices(saved_cents, deal.currency)
 
-        badge = _badge(deal.discount_percent)
+        badge = _badge(deal.discount_percent, copy)
         hype = _hype_emoji(deal.discount_percent)
 
         # Супер-акцент: “НОВА ЦІНА” окремим жирним рядком
         if deal.original_price > 0 and deal.discount_percent > 0:
-            header_price = f"{hype} <b>НОВА ЦІНА: {new_usd} • {new_uah}</b>"
-            was_line = f"Було: <s>{old_usd} • {old_uah}</s>"
-            save_line = f"Ти економиш: <b>{saved_usd} • {saved_uah}</b>"
+            header_price = f"{hype} <b>{copy['new_price']}: {new_prices}</b>"
+            was_line = f"{copy['was']}: <s>{old_prices}</s>"
+            save_line = f"{copy['save']}: <b>{saved_prices}</b>"
         else:
-            header_price = f"{hype} <b>ЦІНА: {new_usd} • {new_uah}</b>"
+            header_price = f"{hype} <b>{copy['price']}: {new_prices}</b>"
             was_line = ""
-            save_line = "Ти економиш: —"
+            save_line = f"{copy['save']}: —"
 
         # Невеликий CTA без спаму
-        cta = "🕹️ Забирай, поки діє знижка 👇"
+        cta = copy["cta"]
 
         return (
             f"{badge} <b>-{deal.discount_percent}%</b>\n"
@@ -128,14 +186,14 @@ class DealPostFormatter:
             + (f"{was_line}\n" if was_line else "")
             + f"{save_line}\n"
             "\n"
-            f"⏳ <b>ЗАЛИШИЛОСЬ:</b> <b>{left}</b>\n"
-            f"🕒 <b>ДО:</b> <b>{ends_at}</b>\n"
+            f"⏳ <b>{copy['left']}:</b> <b>{left}</b>\n"
+            f"🕒 <b>{copy['until']}:</b> <b>{ends_at}</b>\n"
             "\n"
             f"{cta}"
         )
 
-    @staticmethod
-    def links_line(deal: Deal) -> str:
+    def links_line(self, deal: Deal) -> str:
         steam = deal.store_url
         steamdb = f"https://steamdb.info/app/{deal.appid}/"
-        return f'<a href="{steam}">Open in Steam</a> | <a href="{steamdb}">Open in SteamDB</a>'
+        open_in = self.copy["open_in"]
+        return f'<a href="{steam}">{open_in} Steam</a> | <a href="{steamdb}">{open_in} SteamDB</a>'
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from app.steam import Deal, DealMedia
+from app.telegram_client import TelegramChannel, TelegramPublisher
+
+
+class TelegramPublishQueue:
+    # Media and captions for upcoming deals are prepared on a small prefetch
+    # pool while the current post is in flight. Sends go through one
+    # single-worker lane per chat, so each chat keeps its post order, a
+    # throttled chat only delays its own lane, and the rate limiter inside
+    # TelegramPublisher decides how fast each lane may go.
+    def __init__(self, publisher: TelegramPublisher, prefetch_workers: int = 2):
+        self.publisher = publisher
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._prefetch = ThreadPoolExecutor(
+            max_workers=max(prefetch_workers, 1),
+            thread_name_prefix="telegram-prefetch",
+        )
+        self._lanes: dict[str, ThreadPoolExecutor] = {}
+        self._lanes_lock = threading.Lock()
+
+    def submit(
+        self,
+        deal: Deal,
+        load_media: Callable[[], DealMedia | None] | None = None,
+        channels: list[TelegramChannel] | None = None,
+    ) -> Future:
+        # The returned future resolves to {chat_id: error or None} once every
+        # chat has finished, and fails only if no chat got the post.
+        channels = list(channels) if channels is not None else self.publisher.channels
+        prepared = self._prefetch.submit(self._prepare, deal, load_media, channels)
+        result: Future = Future()
+        if not channels:
+            result.set_exception(RuntimeError("No Telegram channels configured"))
+            return result
+
+        outcomes: dict[str, Exception | None] = {}
+        lock = threading.Lock()
+
+        def on_done(chat_id: str, future: Future) -> None:
+            error = future.exception()
+            if error is not None:
+                self.logger.error("Failed to post appid=%s to chat=%s", deal.appid, chat_id, exc_info=error)
+            with lock:
+                outcomes[chat_id] = error
+                if len(outcomes) < len(channels):
+                    return
+            if all(item is not None for item in outcomes.values()):
+                result.set_exception(next(iter(outcomes.values())))
+            else:
+                result.set_result(dict(outcomes))
+
+        for channel in channels:
+            send = self._lane(channel.chat_id).submit(self._send, channel, deal, prepared)
+            send.add_done_callback(lambda future, chat_id=channel.chat_id: on_done(chat_id, future))
+        return result
+
+    def close(self) -> None:
+        with self._lanes_lock:
+            lanes = list(self._lanes.values())
+            self._lanes.clear()
+        for lane in lanes:
+            lane.shutdown(wait=True)
+        self._prefetch.shutdown(wait=True)
+
+    def _lane(self, chat_id: str) -> ThreadPoolExecutor:
+        with self._lanes_lock:
+            lane = self._lanes.get(chat_id)
+            if lane is None:
+                lane = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"telegram-chat-{chat_id}")
+                self._lanes[chat_id] = lane
+            return lane
+
+    def _prepare(
+        self,
+        deal: Deal,
+        load_media: Callable[[], DealMedia | None] | None,
+        channels: list[TelegramChannel],
+    ) -> tuple[DealMedia | None, dict[tuple[str, tuple[str, ...]], str]]:
+        media = None
+        if load_media is not None:
+            try:
+                media = load_media()
+            except Exception:
+                self.logger.exception("Failed to fetch media for appid=%s", deal.appid)
+        try:
+            self.publisher.preflight_media(deal, media)
+        except Exception:
+            self.logger.exception("Media preflight failed for appid=%s", deal.appid)
+        return media, self.publisher.compose_captions(deal, channels)
+
+    def _send(self, channel: TelegramChannel, deal: Deal, prepared: Future) -> None:
+        media, captions = prepared.result()
+        self.publisher.publish_to_channel(channel, deal, media, captions[channel.caption_key])
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import threading
+import time
+
+
+class TokenBucket:
+    # GCRA form of a token bucket: instead of counting tokens we track the
+    # theoretical time at which the bucket will be full again. That makes
+    # reservations exact and lets several buckets be checked together.
+    def __init__(self, rate_per_second: float, capacity: float):
+        if rate_per_second <= 0:
+            raise ValueError("rate_per_second must be positive")
+        self.interval = 1.0 / rate_per_second
+        self.capacity = max(capacity, 1.0)
+        self._full_at = 0.0
+
+    def available_at(self, cost: float, now: float) -> float:
+        return max(self._full_at, now) + cost * self.interval - self.capacity * self.interval
+
+    def consume(self, cost: float, at: float) -> None:
+        self._full_at = max(self._full_at, at) + cost * self.interval
+
+
+class TelegramRateLimiter:
+    # Bot API limits (https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this):
+    # ~30 messages per second overall, ~1 message per second per chat and
+    # 20 messages per minute per group/channel. Every item of a media group
+    # is billed as a separate message, so albums use `cost=len(media)`.
+    def __init__(
+        self,
+        global_per_second: float = 30.0,
+        chat_per_second: float = 1.0,
+        chat_per_minute: float = 20.0,
+    ):
+        self.global_per_second = global_per_second
+        self.chat_per_second = chat_per_second
+        self.chat_per_minute = chat_per_minute
+
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_per_second, capacity=global_per_second)
+        self._chat_second: dict[str, TokenBucket] = {}
+        self._chat_minute: dict[str, TokenBucket] = {}
+        self._blocked_until: dict[str, float] = {}
+
+    def reserve(self, chat_id: str, cost: int = 1) -> float:
+        cost = max(cost, 1)
+        with self._lock:
+            now = time.monotonic()
+            per_second, per_minute = self._chat_buckets(chat_id)
+            at = max(
+                now,
+                self._blocked_until.get(chat_id, 0.0),
+                self._global.available_at(cost, now),
+                per_second.available_at(1, now),
+                per_minute.available_at(cost, now),
+            )
+            self._global.consume(cost, at)
+            per_second.consume(1, at)
+            per_minute.consume(cost, at)
+            return at - now
+
+    def acquire(self, chat_id: str, cost: int = 1) -> float:
+        delay = self.reserve(chat_id, cost)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def penalize(self, chat_id: str, retry_after: float) -> None:
+        if retry_after <= 0:
+            return
+        with self._lock:
+            until = time.monotonic() + retry_after
+            self._blocked_until[chat_id] = max(self._blocked_until.get(chat_id, 0.0), until)
+
+    def _chat_buckets(self, chat_id: str) -> tuple[TokenBucket, TokenBucket]:
+        per_second = self._chat_second.get(chat_id)
+        if per_second is None:
+            per_second = TokenBucket(self.chat_per_second, capacity=1)
+            self._chat_second[chat_id] = per_second
+        per_minute = self._chat_minute.get(chat_id)
+        if per_minute is None:
+            per_minute = TokenBucket(self.chat_per_minute / 60.0, capacity=self.chat_per_minute)
+            self._chat_minute[chat_id] = per_minute
+        return per_second, per_minute
@@ -1,9 +1,37 @@
 ﻿from __future__ import annotations
 
+import json
 from contextlib import contextmanager
+from dataclasses import asdict, dataclass
 
 import psycopg
 
+from app.steam import Deal
+
+# Draft video jobs get their own job_date so they never take the slot of
+# the real render for that day.
+DRAFT_JOB_SUFFIX = "-draft"
+
+
+@dataclass(frozen=True)
+class OutboxPost:
+    id: int
+    chat_id: str
+    deal: Deal
+    attempts: int
+
+
+@dataclass(frozen=True)
+class VideoJob:
+    id: int
+    job_date: str
+    deals: list[Deal]
+    attempts: int
+
+    @property
+    def render_date(self) -> str:
+        return self.job_date.removesuffix(DRAFT_JOB_SUFFIX)
+
 
 class StateRepository:
     def __init__(self, database_url: str, retention_days: int = 30):
@@ -40,9 +68,67 @@ class StateRepository:
                     )
                     """
                 )
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS post_outbox (
+                        id BIGSERIAL PRIMARY KEY,
+                        appid INTEGER NOT NULL,
+                        discount_expiration BIGINT NOT NULL,
+                        final_price INTEGER NOT NULL,
+                        chat_id TEXT NOT NULL,
+                        deal JSONB NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                        locked_until TIMESTAMPTZ,
+                        last_error TEXT,
+                        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                        sent_at TIMESTAMPTZ,
+                        UNIQUE (appid, discount_expiration, final_price, chat_id)
+                    )
+                    """
+                )
+                cur.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS post_outbox_ready_idx
+                    ON post_outbox (next_attempt_at)
+                    WHERE status IN ('pending', 'sending')
+                    """
+                )
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS telegram_file_ids (
+                        source_url TEXT PRIMARY KEY,
+                        media_type TEXT NOT NULL,
+                        file_id TEXT NOT NULL,
+                        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    )
+                    """
+                )
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS video_jobs (
+                        id BIGSERIAL PRIMARY KEY,
+                        job_date TEXT NOT NULL UNIQUE,
+                        deals JSONB NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        stage TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                        locked_until TIMESTAMPTZ,
+                        worker TEXT,
+                        heartbeat_at TIMESTAMPTZ,
+                        output_path TEXT,
+                        last_error TEXT,
+                        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                        started_at TIMESTAMPTZ,
+                        finished_at TIMESTAMPTZ
+                    )
+                    """
+                )
             conn.commit()
 
-    def cleanup_expired_records(self) -> tuple[int, int]:
+    def cleanup_expired_records(self) -> tuple[int, int, int, int, int]:
         with self._connect() as conn:
             with conn.cursor() as cur:
                 cur.execute(
@@ -62,8 +148,38 @@ class StateRepository:
                     (self.retention_days,),
                 )
                 blocked_deleted = cur.rowcount
+
+                cur.execute(
+                    """
+                    DELETE FROM post_outbox
+                    WHERE status IN ('sent', 'expired', 'dropped')
+                      AND created_at < NOW() - (%s || ' days')::INTERVAL
+                    """,
+                    (self.retention_days,),
+                )
+                outbox_deleted = cur.rowcount
+
+                cur.execute(
+                    """
+                    DELETE FROM video_jobs
+                    WHERE status IN ('done', 'skipped', 'failed', 'expired')
+                      AND created_at < NOW() - (%s || ' days')::INTERVAL
+                    """,
+                    (self.retention_days,),
+                )
+                video_jobs_deleted = cur.rowcount
+
+                # Unused file_ids are uploaded again on the next send.
+                cur.execute(
+                    """
+                    DELETE FROM telegram_file_ids
+                    WHERE updated_at < NOW() - (%s || ' days')::INTERVAL
+                    """,
+                    (self.retention_days,),
+                )
+                file_ids_deleted = cur.rowcount
             conn.commit()
-        return posted_deleted, blocked_deleted
+        return posted_deleted, blocked_deleted, outbox_deleted, video_jobs_deleted, file_ids_deleted
 
     def was_posted(self, appid: int, discount_expiration: int, final_price: int) -> bool:
         with self._connect() as conn:
@@ -129,3 +245,315 @@ class StateRepository:
                 cur.execute("SELECT appid FROM blocked_appids")
                 rows = cur.fetchall()
                 return {int(row[0]) for row in rows}
+
+    def get_telegram_file_ids(self, source_urls: list[str]) -> dict[str, str]:
+        if not source_urls:
+            return {}
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT source_url, file_id FROM telegram_file_ids WHERE source_url = ANY(%s)",
+                    (list(source_urls),),
+                )
+                return {str(row[0]): str(row[1]) for row in cur.fetchall()}
+
+    def save_telegram_file_ids(self, file_ids: dict[str, tuple[str, str]]) -> None:
+        if not file_ids:
+            return
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                for source_url, (media_type, file_id) in file_ids.items():
+                    cur.execute(
+                        """
+                        INSERT INTO telegram_file_ids(source_url, media_type, file_id)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (source_url) DO UPDATE
+                        SET media_type = EXCLUDED.media_type,
+                            file_id = EXCLUDED.file_id,
+                            updated_at = NOW()
+                        """,
+                        (source_url, media_type, file_id),
+                    )
+            conn.commit()
+
+    def delete_telegram_file_ids(self, source_urls: list[str]) -> None:
+        if not source_urls:
+            return
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM telegram_file_ids WHERE source_url = ANY(%s)",
+                    (list(source_urls),),
+                )
+            conn.commit()
+
+    def enqueue_post(self, deal: Deal, chat_ids: list[str]) -> int:
+        if not chat_ids:
+            return 0
+        payload = json.dumps(asdict(deal), ensure_ascii=True)
+        queued = 0
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                for chat_id in chat_ids:
+                    cur.execute(
+                        """
+                        INSERT INTO post_outbox(appid, discount_expiration, final_price, chat_id, deal)
+                        VALUES (%s, %s, %s, %s, %s::jsonb)
+                        ON CONFLICT (appid, discount_expiration, final_price, chat_id) DO NOTHING
+                        RETURNING id
+                        """,
+                        (deal.appid, deal.discount_expiration, deal.final_price, chat_id, payload),
+                    )
+                    if cur.fetchone() is not None:
+                        queued += 1
+            conn.commit()
+        return queued
+
+    def claim_outbox_posts(
+        self,
+        limit: int,
+        lease_seconds: int,
+        exclude_chat_ids: list[str] | None = None,
+        exclude_ids: list[int] | None = None,
+        chat_ids: list[str] | None = None,
+    ) -> list[OutboxPost]:
+        # Rows stay 'sending' for the lease; a worker that dies mid-send
+        # leaves them to be reclaimed once the lease runs out. A live worker
+        # keeps renewing it (renew_outbox_leases) and passes the rows it
+        # still has in flight as `exclude_ids`. `chat_ids` limits the claim
+        # to those chats.
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE post_outbox
+                    SET status = 'expired', locked_until = NULL
+                    WHERE status IN ('pending', 'sending')
+                      AND discount_expiration < EXTRACT(EPOCH FROM NOW())
+                    """
+                )
+                cur.execute(
+                    """
+                    UPDATE post_outbox
+                    SET status = 'sending',
+                        locked_until = NOW() + (%s || ' seconds')::INTERVAL,
+                        attempts = attempts + 1
+                    WHERE id IN (
+                        SELECT id
+                        FROM post_outbox
+                        WHERE ((status = 'pending' AND next_attempt_at <= NOW())
+                               OR (status = 'sending' AND locked_until < NOW()))
+                          AND chat_id <> ALL(%s)
+                          AND id <> ALL(%s)
+                          AND (%s::text[] IS NULL OR chat_id = ANY(%s::text[]))
+                        ORDER BY next_attempt_at, id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, chat_id, deal, attempts
+                    """,
+                    (
+                        lease_seconds,
+                        list(exclude_chat_ids or []),
+                        list(exclude_ids or []),
+                        chat_ids,
+                        chat_ids,
+                        limit,
+                    ),
+                )
+                rows = cur.fetchall()
+            conn.commit()
+        posts = [
+            OutboxPost(id=int(row[0]), chat_id=str(row[1]), deal=Deal(**row[2]), attempts=int(row[3]))
+            for row in rows
+        ]
+        return sorted(posts, key=lambda post: post.id)
+
+    def renew_outbox_leases(self, post_ids: list[int], lease_seconds: int) -> None:
+        if not post_ids:
+            return
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE post_outbox
+                    SET locked_until = NOW() + (%s || ' seconds')::INTERVAL
+                    WHERE id = ANY(%s) AND status = 'sending'
+                    """,
+                    (lease_seconds, list(post_ids)),
+                )
+            conn.commit()
+
+    def complete_outbox_post(self, post: OutboxPost) -> None:
+        deal = post.deal
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE post_outbox
+                    SET status = 'sent', sent_at = NOW(), locked_until = NULL, last_error = NULL
+                    WHERE id = %s
+                    """,
+                    (post.id,),
+                )
+                cur.execute(
+                    """
+                    INSERT INTO posted_deals(appid, discount_expiration, final_price)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (appid, discount_expiration, final_price) DO NOTHING
+                    """,
+                    (deal.appid, deal.discount_expiration, deal.final_price),
+                )
+            conn.commit()
+
+    def fail_outbox_post(self, post: OutboxPost, error: str, retry_in_seconds: float) -> None:
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE post_outbox
+                    SET status = 'pending',
+                        next_attempt_at = NOW() + (%s || ' seconds')::INTERVAL,
+                        locked_until = NULL,
+                        last_error = %s
+                    WHERE id = %s
+                    """,
+                    (f"{max(retry_in_seconds, 0.0):.3f}", error[:2000], post.id),
+                )
+            conn.commit()
+
+    def drop_outbox_post(self, post: OutboxPost, reason: str) -> None:
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE post_outbox
+                    SET status = 'dropped', locked_until = NULL, last_error = %s
+                    WHERE id = %s
+                    """,
+                    (reason[:2000], post.id),
+                )
+            conn.commit()
+
+    def enqueue_video_job(self, job_date: str, deals: list[Deal]) -> bool:
+        payload = json.dumps([asdict(deal) for deal in deals], ensure_ascii=True)
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO video_jobs(job_date, deals)
+                    VALUES (%s, %s::jsonb)
+                    ON CONFLICT (job_date) DO NOTHING
+                    RETURNING id
+                    """,
+                    (job_date, payload),
+                )
+                queued = cur.fetchone() is not None
+            conn.commit()
+        return queued
+
+    def claim_video_job(self, lease_seconds: int, worker: str, max_age_seconds: int) -> VideoJob | None:
+        # Same lease scheme as the outbox: a worker that dies mid-render
+        # leaves the job 'rendering' until the lease runs out, then another
+        # worker picks it up (and resumes from the build dir).
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE video_jobs
+                    SET status = 'expired', locked_until = NULL
+                    WHERE status IN ('pending', 'rendering')
+                      AND created_at < NOW() - (%s || ' seconds')::INTERVAL
+                    """,
+                    (max_age_seconds,),
+                )
+                cur.execute(
+                    """
+                    UPDATE video_jobs
+                    SET status = 'rendering',
+                        stage = 'claimed',
+                        locked_until = NOW() + (%s || ' seconds')::INTERVAL,
+                        attempts = attempts + 1,
+                        worker = %s,
+                        heartbeat_at = NOW(),
+                        started_at = NOW()
+                    WHERE id IN (
+                        SELECT id
+                        FROM video_jobs
+                        WHERE (status = 'pending' AND next_attempt_at <= NOW())
+                           OR (status = 'rendering' AND locked_until < NOW())
+                        ORDER BY job_date DESC
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, job_date, deals, attempts
+                    """,
+                    (lease_seconds, worker),
+                )
+                row = cur.fetchone()
+            conn.commit()
+        if row is None:
+            return None
+        return VideoJob(
+            id=int(row[0]),
+            job_date=str(row[1]),
+            deals=[Deal(**item) for item in row[2]],
+            attempts=int(row[3]),
+        )
+
+    def heartbeat_video_job(self, job: VideoJob, lease_seconds: int, stage: str) -> None:
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE video_jobs
+                    SET stage = %s,
+                        heartbeat_at = NOW(),
+                        locked_until = NOW() + (%s || ' seconds')::INTERVAL
+                    WHERE id = %s AND status = 'rendering'
+                    """,
+                    (stage, lease_seconds, job.id),
+                )
+            conn.commit()
+
+    def complete_video_job(self, job: VideoJob, output_path: str | None) -> None:
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE video_jobs
+                    SET status = %s,
+                        stage = NULL,
+                        output_path = %s,
+                        locked_until = NULL,
+                        last_error = NULL,
+                        finished_at = NOW()
+                    WHERE id = %s
+                    """,
+                    ("done" if output_path else "skipped", output_path, job.id),
+                )
+            conn.commit()
+
+    def fail_video_job(self, job: VideoJob, error: str, retry_in_seconds: float | None) -> None:
+        # retry_in_seconds=None: out of attempts, the job stays 'failed'.
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE video_jobs
+                    SET status = %s,
+                        next_attempt_at = NOW() + (%s || ' seconds')::INTERVAL,
+                        locked_until = NULL,
+                        last_error = %s,
+                        finished_at = CASE WHEN %s THEN NOW() ELSE NULL END
+                    WHERE id = %s
+                    """,
+                    (
+                        "failed" if retry_in_seconds is None else "pending",
+                        f"{max(retry_in_seconds or 0.0, 0.0):.3f}",
+                        error[:2000],
+                        retry_in_seconds is None,
+                        job.id,
+                    ),
+                )
+            conn.commit()
@@ -1,11 +1,11 @@
+import asyncio
 import logging
-import time
+from datetime import datetime
 from typing import List
-from urllib.parse import urlsplit, urlunsplit
+from zoneinfo import ZoneInfo
 
-from app.curator_blocklist import SteamCuratorBlocklist
-from app.pipelines.tiktok import TikTokPipeline
-from app.repository import StateRepository
+from app.curator_blocklist import CuratorBlocklistGroup
+from app.repository import DRAFT_JOB_SUFFIX, StateRepository
 from app.steam import Deal, SteamClient
 from app.telegram_client import TelegramPublisher
 
@@ -18,10 +18,10 @@ class DiscountWatcherService:
         telegram: TelegramPublisher,
         min_discount_percent: int,
         max_posts_per_run: int,
-        post_delay_seconds: float = 0.0,
-        shorts_pipeline: TikTokPipeline | None = None,
         shorts_enabled: bool = False,
-        curator_blocklist: SteamCuratorBlocklist | None = None,
+        shorts_timezone: str = "Europe/Kyiv",
+        shorts_draft: bool = False,
+        curator_blocklist: CuratorBlocklistGroup | None = None,
         manual_blocklist_appids: set[int] | None = None,
         dry_run: bool = False,
     ):
@@ -30,45 +30,72 @@ class DiscountWatcherService:
         self.telegram = telegram
         self.min_discount_percent = min_discount_percent
         self.max_posts_per_run = max_posts_per_run
-        self.post_delay_seconds = max(post_delay_seconds, 0.0)
-        self.shorts_pipeline = shorts_pipeline
         self.shorts_enabled = shorts_enabled
+        self.shorts_tz = ZoneInfo(shorts_timezone)
+        self.shorts_draft = shorts_draft
+        self._video_job_date: str | None = None
         self.curator_blocklist = curator_blocklist
         self.manual_blocklist_appids = manual_blocklist_appids or set()
         self.dry_run = dry_run
         self.logger = logging.getLogger(self.__class__.__name__)
 
-    @staticmethod
-    def _normalize_trailer_url(url: str) -> str:
-        # Steam often appends short-lived query tokens. Remove query/fragment
-        # so ffmpeg can fetch stable HLS/DASH manifest URLs.
-        parts = urlsplit(url)
-        return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
-
     def run_once(self) -> int:
-        posted_deleted, blocked_deleted = self.repository.cleanup_expired_records()
-        if posted_deleted or blocked_deleted:
+        self._cleanup()
+        blocked_appids = self._repository_blocked_appids()
+        blocked_appids.update(self._curator_blocked_appids())
+        eligible_deals = self._eligible_deals(self._fetch_deals(), blocked_appids)
+
+        # Posting is done by OutboxPublisher; here deals are only queued, so a
+        # slow or unavailable Telegram never holds up the poll loop.
+        posted = 0
+        chat_ids = [channel.chat_id for channel in self.telegram.channels]
+        for deal in eligible_deals:
+            if posted >= self.max_posts_per_run:
+                break
+            if self.repository.was_posted(deal.appid, deal.discount_expiration, deal.final_price):
+                continue
+            if self._queue_deal(deal, chat_ids):
+                posted += 1
+
+        self._queue_daily_video(eligible_deals)
+        self.logger.info("Run completed. Queued: %s", posted)
+        return posted
+
+    def _cleanup(self) -> None:
+        deleted = self.repository.cleanup_expired_records()
+        if any(deleted):
             self.logger.info(
-                "Retention cleanup deleted posted=%s blocked=%s",
-                posted_deleted,
-                blocked_deleted,
+                "Retention cleanup deleted posted=%s blocked=%s outbox=%s video_jobs=%s file_ids=%s",
+                *deleted,
             )
 
+    def _repository_blocked_appids(self) -> set[int]:
         blocked_appids = set(self.repository.get_blocked_appids())
         blocked_appids.update(self.manual_blocklist_appids)
-        if self.curator_blocklist is not None:
-            curator_appids = self.curator_blocklist.get_appids()
-            new_items = self.repository.upsert_blocked_appids(curator_appids, source="curator")
-            if new_items:
-                self.logger.info("Added %s new blocked appids from curator", new_items)
-            blocked_appids.update(curator_appids)
-
-        deals: List[Deal] = sorted(
+        return blocked_appids
+
+    def _curator_blocked_appids(self) -> set[int]:
+        if self.curator_blocklist is None:
+            return set()
+        attributed = self.curator_blocklist.get_attributed_appids()
+        by_source: dict[str, set[int]] = {}
+        for appid, source in attributed.items():
+            by_source.setdefault(source, set()).add(appid)
+        new_items = 0
+        for source, appids in by_source.items():
+            new_items += self.repository.upsert_blocked_appids(appids, source=source)
+        if new_items:
+            self.logger.info("Added %s new blocked appids from %s curators", new_items, len(by_source))
+        return set(attributed)
+
+    def _fetch_deals(self) -> List[Deal]:
+        return sorted(
             self.steam.fetch_special_deals(),
             key=lambda d: d.discount_percent,
             reverse=True,
         )
 
+    def _eligible_deals(self, deals: List[Deal], blocked_appids: set[int]) -> list[Deal]:
         eligible_deals: list[Deal] = []
         seen_appids: set[int] = set()
         for deal in deals:
@@ -80,72 +107,87 @@ class DiscountWatcherService:
                 continue
             seen_appids.add(deal.appid)
             eligible_deals.append(deal)
+        return eligible_deals
 
-        posted = 0
-        trailer_cache: dict[int, list[str]] = {}
-        for deal in eligible_deals:
-            if self.repository.was_posted(deal.appid, deal.discount_expiration, deal.final_price):
-                continue
+    def _queue_deal(self, deal: Deal, chat_ids: list[str]) -> bool:
+        if self.dry_run:
+            for (locale, _), caption in self.telegram.compose_captions(deal).items():
+                self.logger.info("DRY RUN post for appid=%s locale=%s\n%s", deal.appid, locale, caption)
+            self.repository.mark_posted(deal.appid, deal.discount_expiration, deal.final_price)
+            return True
+        if self.repository.enqueue_post(deal, chat_ids):
+            self.logger.info("Queued deal: %s (%s%%)", deal.name, deal.discount_percent)
+            return True
+        return False
 
-            caption = self.telegram.compose_caption(deal)
-            if self.dry_run:
-                self.logger.info("DRY RUN post for appid=%s\n%s", deal.appid, caption)
-            else:
-                media = None
-                try:
-                    media = self.steam.fetch_deal_media(deal.appid)
-                    trailer_urls = []
-                    if media:
-                        trailer_urls = media.trailer_urls or ([] if not media.trailer_url else [media.trailer_url])
-                    normalized = [self._normalize_trailer_url(u) for u in trailer_urls if u]
-                    if normalized:
-                        trailer_cache[deal.appid] = list(dict.fromkeys(normalized))
-                except Exception:
-                    self.logger.exception("Failed to fetch media for appid=%s", deal.appid)
+    def _queue_daily_video(self, eligible_deals: list[Deal]) -> None:
+        # The daily video is only queued here; VideoWorker renders it in the
+        # background, so ffmpeg never holds up polling or posting. Draft
+        # videos are previews and are queued in dry runs as well.
+        if (not self.dry_run or self.shorts_draft) and self.shorts_enabled and eligible_deals:
+            today = datetime.now(self.shorts_tz).strftime("%Y-%m-%d")
+            job_date = f"{today}{DRAFT_JOB_SUFFIX}" if self.shorts_draft else today
+            if self._video_job_date != job_date:
                 try:
-                    self.telegram.publish_deal(deal, media=media)
+                    if self.repository.enqueue_video_job(job_date, eligible_deals):
+                        self.logger.info("Queued daily video job for %s with %s deals", job_date, len(eligible_deals))
+                    self._video_job_date = job_date
                 except Exception:
-                    self.logger.exception("Failed to post deal: %s (appid=%s)", deal.name, deal.appid)
+                    self.logger.exception("Failed to queue daily video job")
+
+
+class AsyncDiscountWatcherService(DiscountWatcherService):
+    # Same stages as DiscountWatcherService.run_once, but every blocking
+    # call runs in a worker thread (asyncio.to_thread) so independent ones
+    # overlap: cleanup, the blocklist reads and the curator refresh run
+    # while the featured deals are fetched, the daily video job is queued
+    # alongside the posts, and the was_posted lookups for the next
+    # `lookahead` deals run while the current one is being queued. Deals
+    # are still queued one at a time and in discount order.
+    def __init__(self, *args, lookahead: int = 8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookahead = max(lookahead, 1)
+
+    def run_once(self) -> int:
+        return asyncio.run(self.run_once_async())
+
+    async def run_once_async(self) -> int:
+        _, blocked_appids, curator_appids, deals = await asyncio.gather(
+            asyncio.to_thread(self._cleanup),
+            asyncio.to_thread(self._repository_blocked_appids),
+            asyncio.to_thread(self._curator_blocked_appids),
+            asyncio.to_thread(self._fetch_deals),
+        )
+        eligible_deals = self._eligible_deals(deals, blocked_appids | curator_appids)
+        video = asyncio.create_task(asyncio.to_thread(self._queue_daily_video, eligible_deals))
+
+        posted = 0
+        chat_ids = [channel.chat_id for channel in self.telegram.channels]
+        checks: list[asyncio.Task] = []
+        try:
+            for idx, deal in enumerate(eligible_deals):
+                if posted >= self.max_posts_per_run:
+                    break
+                while len(checks) < min(idx + self.lookahead, len(eligible_deals)):
+                    ahead = eligible_deals[len(checks)]
+                    checks.append(
+                        asyncio.create_task(
+                            asyncio.to_thread(
+                                self.repository.was_posted, ahead.appid, ahead.discount_expiration, ahead.final_price
+                            )
+                        )
+                    )
+                if await checks[idx]:
                     continue
-                self.logger.info("Posted deal: %s (%s%%)", deal.name, deal.discount_percent)
+                if await asyncio.to_thread(self._queue_deal, deal, chat_ids):
+                    posted += 1
+        finally:
+            # Lookups past max_posts_per_run are not needed; let them finish
+            # quietly instead of leaving pending tasks behind.
+            leftovers = [task for task in checks if not task.done()]
+            if leftovers:
+                await asyncio.gather(*leftovers, return_exceptions=True)
+            await video
 
-            self.repository.mark_posted(deal.appid, deal.discount_expiration, deal.final_price)
-            posted += 1
-            if posted >= self.max_posts_per_run:
-                break
-            if not self.dry_run and self.post_delay_seconds > 0:
-                time.sleep(self.post_delay_seconds)
-
-        if not self.dry_run and self.shorts_enabled and self.shorts_pipeline is not None:
-            try:
-                if self.shorts_pipeline.should_generate_today():
-                    daily_entries: list[tuple[Deal, list[str]]] = []
-                    for deal in eligible_deals:
-                        trailer_urls = trailer_cache.get(deal.appid, [])
-                        if not trailer_urls:
-                            try:
-                                media = self.steam.fetch_deal_media(deal.appid)
-                                fetched = []
-                                if media:
-                                    fetched = media.trailer_urls or ([] if not media.trailer_url else [media.trailer_url])
-                                normalized = [self._normalize_trailer_url(u) for u in fetched if u]
-                                if normalized:
-                                    trailer_urls = list(dict.fromkeys(normalized))
-                                    trailer_cache[deal.appid] = trailer_urls
-                            except Exception:
-                                self.logger.exception("Failed to fetch media for daily video appid=%s", deal.appid)
-                        if trailer_urls:
-                            daily_entries.append((deal, trailer_urls))
-                        else:
-                            self.logger.info("No trailers found for daily video appid=%s", deal.appid)
-
-                    output = self.shorts_pipeline.generate_daily_video(daily_entries)
-                    if output:
-                        self.logger.info("Generated daily short video: %s", output)
-                    else:
-                        self.logger.info("Daily short skipped: no trailer media available")
-            except Exception:
-                self.logger.exception("Failed to generate daily short video")
-
-        self.logger.info("Run completed. Posted: %s", posted)
+        self.logger.info("Run completed. Queued: %s", posted)
         return posted
@@ -3,57 +3,152 @@
 import logging
 import json
 import time
+from dataclasses import dataclass
+from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
 
-from app.post_design import DealPostFormatter
+from app.media_preflight import MediaPreflight
+from app.pipelines.trailer_cache import TrailerTranscoder
+from app.post_design import DEFAULT_LOCALE, DealPostFormatter
+from app.rate_limit import TelegramRateLimiter
+from app.repository import StateRepository
 from app.steam import Deal, DealMedia
 
 
+class NoUsableImageError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class TelegramChannel:
+    chat_id: str
+    locale: str = DEFAULT_LOCALE
+    currencies: tuple[str, ...] = ()
+
+    @property
+    def caption_key(self) -> tuple[str, tuple[str, ...]]:
+        return self.locale, self.currencies
+
+
+def parse_channels(value: str) -> list[TelegramChannel]:
+    # "chat_id[:locale[:USD+UAH]]" entries separated by commas, e.g.
+    # "@deals_ua:uk,-1001234567890:en:USD".
+    channels: list[TelegramChannel] = []
+    for part in (value or "").split(","):
+        token = part.strip()
+        if not token:
+            continue
+        chat_id, _, rest = token.partition(":")
+        locale, _, currencies = rest.partition(":")
+        channels.append(
+            TelegramChannel(
+                chat_id=chat_id.strip(),
+                locale=locale.strip() or DEFAULT_LOCALE,
+                currencies=tuple(code.strip().upper() for code in currencies.split("+") if code.strip()),
+            )
+        )
+    return channels
+
+
 class TelegramPublisher:
     def __init__(
         self,
         bot_token: str,
-        chat_id: str,
+        chat_id: str = "",
         parse_mode: str = "HTML",
         timeout_seconds: int = 15,
         usd_to_uah_rate: float = 41.0,
         include_trailer: bool = True,
         extra_images_count: int = 3,
         max_retries: int = 3,
+        rate_limiter: TelegramRateLimiter | None = None,
+        file_id_store: StateRepository | None = None,
+        channels: list[TelegramChannel] | None = None,
+        media_preflight: MediaPreflight | None = None,
+        api_base_url: str = "https://api.telegram.org",
+        trailer_transcoder: TrailerTranscoder | None = None,
     ):
         self.bot_token = bot_token
-        self.chat_id = chat_id
+        self.channels = list(channels) if channels else ([TelegramChannel(chat_id=chat_id)] if chat_id else [])
         self.parse_mode = parse_mode
         self.timeout_seconds = timeout_seconds
         self.include_trailer = include_trailer
         self.extra_images_count = max(extra_images_count, 0)
         self.max_retries = max(max_retries, 0)
+        self.rate_limiter = rate_limiter or TelegramRateLimiter()
+        self.file_id_store = file_id_store
+        self.media_preflight = media_preflight
+        self.api_base_url = api_base_url.rstrip("/")
+        self.trailer_transcoder = trailer_transcoder
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.usd_to_uah_rate = usd_to_uah_rate
         self.post_formatter = DealPostFormatter(usd_to_uah_rate=usd_to_uah_rate)
+        self._formatters: dict[tuple[str, tuple[str, ...]], DealPostFormatter] = {}
+        for channel in self.channels:
+            self._formatter_for(channel)
 
     @property
     def _send_photo_url(self) -> str:
-        return f"https://api.telegram.org/bot{self.bot_token}/sendPhoto"
+        return f"{self.api_base_url}/bot{self.bot_token}/sendPhoto"
+
+    @property
+    def _send_message_url(self) -> str:
+        return f"{self.api_base_url}/bot{self.bot_token}/sendMessage"
 
     @property
     def _send_media_group_url(self) -> str:
-        return f"https://api.telegram.org/bot{self.bot_token}/sendMediaGroup"
+        return f"{self.api_base_url}/bot{self.bot_token}/sendMediaGroup"
+
+    def _formatter_for(self, channel: TelegramChannel) -> DealPostFormatter:
+        formatter = self._formatters.get(channel.caption_key)
+        if formatter is None:
+            formatter = DealPostFormatter(
+                usd_to_uah_rate=self.usd_to_uah_rate,
+                locale=channel.locale,
+                currencies=channel.currencies,
+            )
+            self._formatters[channel.caption_key] = formatter
+        return formatter
 
-    def compose_caption(self, deal: Deal) -> str:
+    def compose_caption(self, deal: Deal, channel: TelegramChannel | None = None) -> str:
+        formatter = self._formatter_for(channel) if channel else self.post_formatter
         try:
-            return self.post_formatter.build_caption(deal)
+            return formatter.build_caption(deal)
         except Exception:
             self.logger.exception("Post formatter failed for appid=%s", deal.appid)
             return f"<b>{deal.name}</b>\nDiscount: -{deal.discount_percent}%\n{deal.store_url}"
 
-    def _post(self, url: str, payload: dict) -> dict:
+    def compose_captions(
+        self,
+        deal: Deal,
+        channels: list[TelegramChannel] | None = None,
+    ) -> dict[tuple[str, tuple[str, ...]], str]:
+        # Rendered once per locale/currency set, shared by every chat using it.
+        captions: dict[tuple[str, tuple[str, ...]], str] = {}
+        for channel in (self.channels if channels is None else channels) or [TelegramChannel(chat_id="")]:
+            if channel.caption_key not in captions:
+                links = self._formatter_for(channel).links_line(deal)
+                captions[channel.caption_key] = f"{self.compose_caption(deal, channel)}\n{links}"
+        return captions
+
+    def _post(self, url: str, payload: dict, cost: int = 1, files: dict[str, Path] | None = None) -> dict:
+        chat_id = str(payload.get("chat_id", ""))
         last_error: Exception | None = None
+        # Uploads (attach://) take longer than sends by URL or file_id.
+        timeout = max(self.timeout_seconds, 120) if files else self.timeout_seconds
         for attempt in range(self.max_retries + 1):
-            response = requests.post(url, data=payload, timeout=self.timeout_seconds)
+            self.rate_limiter.acquire(chat_id, cost)
+            handles = {name: path.open("rb") for name, path in (files or {}).items()}
+            try:
+                response = requests.post(url, data=payload, files=handles or None, timeout=timeout)
+            finally:
+                for handle in handles.values():
+                    handle.close()
 
-            # Telegram flood control: honor retry_after and retry request.
+            # Telegram flood control: block the chat for retry_after, the
+            # limiter holds the retry (and any queued sends) until then.
             if response.status_code == 429:
                 retry_after = 0
                 try:
@@ -62,15 +157,15 @@ class TelegramPublisher:
                 except Exception:
                     retry_after = 0
 
+                sleep_seconds = retry_after if retry_after > 0 else 2
+                self.rate_limiter.penalize(chat_id, sleep_seconds)
                 if attempt < self.max_retries:
-                    sleep_seconds = retry_after if retry_after > 0 else 2
                     self.logger.warning(
                         "Telegram rate limit hit. Retrying in %ss (attempt %s/%s)",
                         sleep_seconds,
                         attempt + 1,
                         self.max_retries,
                     )
-                    time.sleep(sleep_seconds)
                     continue
 
             try:
@@ -90,41 +185,168 @@ class TelegramPublisher:
             raise last_error
         raise RuntimeError("Telegram API request failed")
 
-    def _build_media_group(self, deal: Deal, media: DealMedia | None, caption: str) -> list[dict]:
-        group: list[dict] = []
-        cover_photo = deal.header_image or ((media.image_urls[0] if media and media.image_urls else ""))
-        if not cover_photo:
-            raise RuntimeError(f"No cover image for appid={deal.appid}")
+    def _build_media_group(
+        self,
+        deal: Deal,
+        media: DealMedia | None,
+        caption: str,
+        use_file_ids: bool = True,
+    ) -> tuple[list[dict], list[str], dict[str, Path]]:
+        # Returns the group, the source URL of every item (so file_ids from
+        # the response can be stored against the URL they were fetched from)
+        # and the local files to upload for attach:// items.
+        photos: list[str] = []
+        for url in [deal.header_image] + (media.image_urls if media else []):
+            if url and url not in photos:
+                photos.append(url)
+        if not photos:
+            raise NoUsableImageError(f"No cover image for appid={deal.appid}")
+
+        trailer_urls = self._trailer_urls(media)
+        file_ids = self._lookup_file_ids(photos + trailer_urls) if use_file_ids else {}
+        trailer_url, trailer_file = self._pick_trailer(deal, trailer_urls, file_ids)
+        if self.media_preflight is not None:
+            candidates = {url: "photo" for url in photos}
+            if trailer_url and trailer_file is None:
+                candidates[trailer_url] = "video"
+            checks = self.media_preflight.check_many(
+                {url: kind for url, kind in candidates.items() if url not in file_ids}
+            )
+            rejected = {url for url, check in checks.items() if not check.ok}
+            photos = [url for url in photos if url not in rejected]
+            if trailer_url in rejected:
+                trailer_url = ""
+            if not photos:
+                raise NoUsableImageError(f"No usable cover image for appid={deal.appid}")
+
+        # The cover is the header image unless Telegram could not take it, in
+        # which case the first usable screenshot stands in.
+        cover_photo = photos[0]
+        extras = photos[1 : self.extra_images_count + 1] if self.extra_images_count > 0 else []
+        sources = [cover_photo] + ([trailer_url] if trailer_url else []) + extras
 
-        group.append(
+        group: list[dict] = [
             {
                 "type": "photo",
-                "media": cover_photo,
+                "media": file_ids.get(cover_photo, cover_photo),
                 "caption": caption,
                 "parse_mode": self.parse_mode,
             }
-        )
-
-        if self.include_trailer and media and media.trailer_url and self._is_telegram_video_url(media.trailer_url):
+        ]
+        files: dict[str, Path] = {}
+        if trailer_url:
+            video = file_ids.get(trailer_url)
+            if video is None and trailer_file is not None:
+                files["trailer"] = trailer_file
+                video = "attach://trailer"
             group.append(
                 {
                     "type": "video",
-                    "media": media.trailer_url,
+                    "media": video or trailer_url,
                     "supports_streaming": True,
                 }
             )
+        for url in extras:
+            group.append({"type": "photo", "media": file_ids.get(url, url)})
+
+        return group, sources, files
+
+    def _trailer_urls(self, media: DealMedia | None) -> list[str]:
+        if not self.include_trailer or not media:
+            return []
+        return media.trailer_urls or ([media.trailer_url] if media.trailer_url else [])
+
+    def _pick_trailer(
+        self, deal: Deal, trailer_urls: list[str], file_ids: dict[str, str]
+    ) -> tuple[str, Path | None]:
+        # A direct mp4 trailer goes by URL; HLS/DASH ones only once the
+        # transcoder has an MP4 for them, which is then uploaded. An upload
+        # Telegram already has is sent by file_id, even after the local
+        # file has been cleaned up.
+        if not trailer_urls:
+            return "", None
+        if self._is_telegram_video_url(trailer_urls[0]):
+            return trailer_urls[0], None
+        for url in trailer_urls:
+            if url in file_ids:
+                return url, None
+        if self.trailer_transcoder is None:
+            return "", None
+        cached = self.trailer_transcoder.cached(deal.appid, trailer_urls)
+        return cached if cached else ("", None)
+
+    def preflight_media(self, deal: Deal, media: DealMedia | None) -> None:
+        # Warms the preflight cache ahead of the send (called from the publish
+        # queue's prefetch step). A missing transcoded trailer is only started
+        # here: the post goes out with whatever is cached by then.
+        candidates = {url: "photo" for url in ([deal.header_image] + (media.image_urls if media else [])) if url}
+        trailer_urls = self._trailer_urls(media)
+        direct_trailer = bool(trailer_urls) and self._is_telegram_video_url(trailer_urls[0])
+        if direct_trailer:
+            candidates[trailer_urls[0]] = "video"
+        cached = self._lookup_file_ids(list(candidates) + ([] if direct_trailer else trailer_urls))
+        if self.trailer_transcoder is not None and trailer_urls and not direct_trailer:
+            if not any(url in cached for url in trailer_urls):
+                self.trailer_transcoder.prefetch(deal.appid, trailer_urls)
+        if self.media_preflight is not None:
+            self.media_preflight.check_many({url: kind for url, kind in candidates.items() if url not in cached})
+
+    def _lookup_file_ids(self, source_urls: list[str]) -> dict[str, str]:
+        if self.file_id_store is None or not source_urls:
+            return {}
+        try:
+            return self.file_id_store.get_telegram_file_ids(source_urls)
+        except Exception:
+            self.logger.exception("Failed to load cached Telegram file_ids")
+            return {}
+
+    def _remember_file_ids(self, sources: list[str], messages: list[dict]) -> None:
+        if self.file_id_store is None:
+            return
+        file_ids: dict[str, tuple[str, str]] = {}
+        for source, message in zip(sources, messages):
+            extracted = self._extract_file_id(message)
+            if extracted is not None:
+                file_ids[source] = extracted
+        if not file_ids:
+            return
+        try:
+            self.file_id_store.save_telegram_file_ids(file_ids)
+        except Exception:
+            self.logger.exception("Failed to store Telegram file_ids")
+
+    def _forget_file_ids(self, source_urls: list[str]) -> None:
+        if self.file_id_store is None or not source_urls:
+            return
+        try:
+            self.file_id_store.delete_telegram_file_ids(source_urls)
+        except Exception:
+            self.logger.exception("Failed to drop cached Telegram file_ids")
 
-        if media and media.image_urls and self.extra_images_count > 0:
-            extras: list[str] = []
-            for url in media.image_urls:
-                if url and url != cover_photo and url not in extras:
-                    extras.append(url)
-                if len(extras) >= self.extra_images_count:
-                    break
-            for url in extras:
-                group.append({"type": "photo", "media": url})
+    @staticmethod
+    def _extract_file_id(message: dict) -> tuple[str, str] | None:
+        photos = message.get("photo") or []
+        if photos:
+            # PhotoSize list is ordered by size; the largest one is what we sent.
+            return "photo", photos[-1]["file_id"]
+        video = message.get("video") or {}
+        if video.get("file_id"):
+            return "video", video["file_id"]
+        return None
 
-        return group
+    @staticmethod
+    def _is_bad_file_id_error(exc: Exception) -> bool:
+        # Telegram answers a stale or foreign file_id with a 400 such as
+        # "Bad Request: wrong file identifier/HTTP URL specified".
+        response = getattr(exc, "response", None)
+        if response is None or response.status_code != 400:
+            return False
+        try:
+            description = str(response.json().get("description", ""))
+        except Exception:
+            description = response.text or ""
+        description = description.lower()
+        return "file identifier" in description or "file_id" in description or "file reference" in description
 
     @staticmethod
     def _is_telegram_video_url(url: str) -> bool:
@@ -133,22 +355,80 @@ class TelegramPublisher:
         path = urlparse(url).path.lower()
         return path.endswith(".mp4")
 
-    def publish_deal(self, deal: Deal, media: DealMedia | None = None) -> None:
-        caption = f"{self.compose_caption(deal)}\n{self.post_formatter.links_line(deal)}"
-        media_group = self._build_media_group(deal, media, caption)
+    def publish_to_channel(self, channel: TelegramChannel, deal: Deal, media: DealMedia | None, caption: str) -> None:
+        chat_id = channel.chat_id
+        try:
+            media_group, sources, files = self._build_media_group(deal, media, caption)
+        except NoUsableImageError:
+            self.logger.warning("No usable image for appid=%s chat=%s, posting text only", deal.appid, chat_id)
+            self._send_message(chat_id, caption)
+            return
+        # The first image that passed preflight, for the sendPhoto fallback.
+        cover = sources[0]
+        if len(media_group) < 2:
+            # sendMediaGroup needs at least two items.
+            self._send_photo(chat_id, sources[0], media_group[0]["media"], caption)
+            return
+        cached_sources = [
+            src
+            for src, item in zip(sources, media_group)
+            if item["media"] != src and not item["media"].startswith("attach://")
+        ]
+        try:
+            data = self._send_media_group(chat_id, media_group, files)
+        except Exception as exc:
+            # Only a rejected file_id is worth a resend with URLs; after a
+            # 5xx or a timeout Telegram may already have posted the album.
+            if not cached_sources or not self._is_bad_file_id_error(exc):
+                self._send_photo_fallback(chat_id, deal, cover, caption)
+                return
+            # A stale file_id fails the whole album; retry once with plain URLs.
+            self.logger.warning("sendMediaGroup with cached file_ids failed for appid=%s, retrying with URLs", deal.appid)
+            self._forget_file_ids(cached_sources)
+            media_group, sources, files = self._build_media_group(deal, media, caption, use_file_ids=False)
+            try:
+                data = self._send_media_group(chat_id, media_group, files)
+            except Exception:
+                self._send_photo_fallback(chat_id, deal, cover, caption)
+                return
+        self._remember_file_ids(sources, data.get("result") or [])
+
+    def _send_media_group(self, chat_id: str, media_group: list[dict], files: dict[str, Path] | None = None) -> dict:
         payload = {
-            "chat_id": self.chat_id,
+            "chat_id": chat_id,
             "media": json.dumps(media_group, ensure_ascii=True),
         }
+        return self._post(self._send_media_group_url, payload, cost=len(media_group), files=files)
+
+    def _send_photo_fallback(self, chat_id: str, deal: Deal, cover: str, caption: str) -> None:
+        self.logger.exception("sendMediaGroup failed for appid=%s chat=%s, fallback to sendPhoto", deal.appid, chat_id)
+        cached = self._lookup_file_ids([cover])
+        self._send_photo(chat_id, cover, cached.get(cover, cover), caption)
+
+    def _send_message(self, chat_id: str, text: str) -> None:
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": self.parse_mode,
+            "disable_web_page_preview": True,
+        }
+        self._post(self._send_message_url, payload)
+
+    def _send_photo(self, chat_id: str, source_url: str, photo: str, caption: str) -> None:
+        payload = {
+            "chat_id": chat_id,
+            "photo": photo,
+            "caption": caption,
+            "parse_mode": self.parse_mode,
+            "disable_web_page_preview": True,
+        }
         try:
-            self._post(self._send_media_group_url, payload)
-        except Exception:
-            self.logger.exception("sendMediaGroup failed for appid=%s, fallback to sendPhoto", deal.appid)
-            fallback_payload = {
-                "chat_id": self.chat_id,
-                "photo": deal.header_image,
-                "caption": caption,
-                "parse_mode": self.parse_mode,
-                "disable_web_page_preview": True,
-            }
-            self._post(self._send_photo_url, fallback_payload)
+            data = self._post(self._send_photo_url, payload)
+        except Exception as exc:
+            if photo == source_url or not self._is_bad_file_id_error(exc):
+                raise
+            self._forget_file_ids([source_url])
+            payload["photo"] = source_url
+            data = self._post(self._send_photo_url, payload)
+        if source_url:
+            self._remember_file_ids([source_url], [data.get("result") or {}])
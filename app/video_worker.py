@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+from app.pipelines.tiktok import TikTokPipeline
+from app.repository import StateRepository, VideoJob
+from app.steam import Deal, SteamClient
+
+
+class VideoWorker:
+    # Renders the daily videos queued by DiscountWatcherService in the
+    # `video_jobs` table, so the poll loop never waits for ffmpeg. It runs in
+    # its own process (role "video") or as a background thread of "all";
+    # either way it lowers its own CPU priority, and ffmpeg processes and
+    # render threads inherit it.
+    def __init__(
+        self,
+        repository: StateRepository,
+        steam: SteamClient,
+        pipeline: TikTokPipeline,
+        poll_seconds: float = 30.0,
+        lease_seconds: int = 900,
+        heartbeat_seconds: float = 60.0,
+        max_attempts: int = 3,
+        retry_seconds: float = 600.0,
+        max_age_seconds: int = 86400,
+        nice: int = 10,
+    ):
+        self.repository = repository
+        self.steam = steam
+        self.pipeline = pipeline
+        self.poll_seconds = max(poll_seconds, 1.0)
+        self.lease_seconds = max(lease_seconds, 60)
+        self.heartbeat_seconds = min(max(heartbeat_seconds, 1.0), self.lease_seconds / 3)
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_seconds = max(retry_seconds, 0.0)
+        self.max_age_seconds = max(max_age_seconds, 3600)
+        self.nice = nice
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @staticmethod
+    def _normalize_trailer_url(url: str) -> str:
+        # Steam often appends short-lived query tokens. Remove query/fragment
+        # so ffmpeg can fetch stable HLS/DASH manifest URLs.
+        parts = urlsplit(url)
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+    def run_forever(self, stop_event: threading.Event | None = None) -> None:
+        stop_event = stop_event or threading.Event()
+        self._lower_priority()
+        self.logger.info(
+            "Video worker started. worker=%s render_workers=%s ffmpeg_threads=%s nice=%s",
+            self.worker_name,
+            self.pipeline.render_workers,
+            self.pipeline.ffmpeg_threads,
+            self.nice,
+        )
+        while not stop_event.is_set():
+            try:
+                handled = self.run_once()
+            except Exception:
+                self.logger.exception("Video job poll failed")
+                handled = False
+            if not handled:
+                stop_event.wait(self.poll_seconds)
+
+    def run_once(self) -> bool:
+        job = self.repository.claim_video_job(self.lease_seconds, self.worker_name, self.max_age_seconds)
+        if job is None:
+            return False
+        self.logger.info("Video job %s (%s) claimed: deals=%s attempt=%s", job.id, job.job_date, len(job.deals), job.attempts)
+        stage = ["media"]
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat,
+            args=(job, stage, stop_heartbeat),
+            name=f"video-job-{job.id}-heartbeat",
+            daemon=True,
+        )
+        heartbeat.start()
+        try:
+            self.repository.heartbeat_video_job(job, self.lease_seconds, stage[0])
+            entries = self._collect_trailers(job.deals)
+            stage[0] = "rendering"
+            self.repository.heartbeat_video_job(job, self.lease_seconds, stage[0])
+            output = self.pipeline.generate_daily_video(entries, date_str=job.render_date) if entries else None
+        except Exception as exc:
+            stop_heartbeat.set()
+            heartbeat.join()
+            retry_in = self.retry_seconds if job.attempts < self.max_attempts else None
+            self.repository.fail_video_job(job, repr(exc), retry_in)
+            self.logger.exception(
+                "Video job %s (%s) failed at stage=%s attempt=%s/%s%s",
+                job.id,
+                job.job_date,
+                stage[0],
+                job.attempts,
+                self.max_attempts,
+                f", retry in {retry_in:.0f}s" if retry_in is not None else "",
+            )
+            return True
+        stop_heartbeat.set()
+        heartbeat.join()
+        self.repository.complete_video_job(job, str(output) if output else None)
+        if output:
+            self.logger.info("Video job %s (%s) done: %s", job.id, job.job_date, output)
+        else:
+            self.logger.info("Video job %s (%s) skipped: no trailer media available", job.id, job.job_date)
+        return True
+
+    def _heartbeat(self, job: VideoJob, stage: list[str], stop_event: threading.Event) -> None:
+        # Keeps the lease alive while ffmpeg runs and reports the stage.
+        while not stop_event.wait(self.heartbeat_seconds):
+            try:
+                self.repository.heartbeat_video_job(job, self.lease_seconds, stage[0])
+            except Exception:
+                self.logger.exception("Video job %s heartbeat failed", job.id)
+
+    def _collect_trailers(self, deals: list[Deal]) -> list[tuple[Deal, list[str]]]:
+        entries: list[tuple[Deal, list[str]]] = []
+        for deal in deals:
+            try:
+                media = self.steam.fetch_deal_media(deal.appid)
+            except Exception:
+                self.logger.exception("Failed to fetch media for daily video appid=%s", deal.appid)
+                continue
+            fetched = []
+            if media:
+                fetched = media.trailer_urls or ([] if not media.trailer_url else [media.trailer_url])
+            trailer_urls = list(dict.fromkeys(self._normalize_trailer_url(u) for u in fetched if u))
+            if trailer_urls:
+                entries.append((deal, trailer_urls))
+            else:
+                self.logger.info("No trailers found for daily video appid=%s", deal.appid)
+        return entries
+
+    def _lower_priority(self) -> None:
+        # On Linux the nice value is per thread and inherited by threads and
+        # processes started from it, so this only affects rendering even when
+        # the worker shares a process with the poll loop.
+        if self.nice <= 0:
+            return
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (AttributeError, OSError):
+            self.logger.warning("Could not lower video worker priority (nice=%s)", self.nice)
@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from app.pipelines.ffmpeg_progress import FfmpegMetrics, FfmpegRun
+from app.pipelines.tiktok import TikTokPipeline
+from app.steam import Deal
+
+_SSIM_RE = re.compile(r"SSIM .*All:([\d.]+)")
+_PSNR_RE = re.compile(r"PSNR .*average:([\d.]+|inf)")
+
+# Local stand-ins for trailers: busy motion plus film grain, which is harder
+# on x264 than flat test patterns, and a fractal zoom with fine detail.
+SAMPLE_SOURCES = {
+    "motion": "testsrc2=size=1920x1080:rate=30,noise=alls=12:allf=t",
+    "detail": "mandelbrot=size=1920x1080:rate=30",
+}
+
+
+class CollectingMetrics(FfmpegMetrics):
+    # Keeps FfmpegRun records in memory instead of writing JSONL.
+    def __init__(self, metrics_dir: Path):
+        super().__init__(metrics_dir)
+        self.runs: list[FfmpegRun] = []
+
+    def progress_logger(self):
+        return None
+
+    def record(self, run: FfmpegRun, **extra) -> None:
+        self.runs.append(run)
+
+
+class BenchPipeline(TikTokPipeline):
+    # TikTokPipeline with the segment encoder settings under test.
+    def __init__(self, *args, preset: str, crf: int, **kwargs):
+        super().__init__(*args, segment_cache_mb=0, **kwargs)
+        self.preset = preset
+        self.crf = crf
+        self.metrics = CollectingMetrics(self.output_dir / ".metrics")
+
+    def _segment_codec_args(self) -> list[str]:
+        if self.preset == "lossless":
+            return ["-c:v", "libx264", "-preset", "ultrafast", "-qp", "0", "-pix_fmt", "yuv420p"]
+        return ["-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf), "-pix_fmt", "yuv420p"]
+
+    def last_run(self) -> FfmpegRun:
+        return self.metrics.runs[-1]
+
+
+@dataclass
+class Result:
+    stage: str
+    overlay: str
+    preset: str
+    crf: int | None
+    threads: int
+    fps: int
+    wall_seconds: float
+    encode_fps: float
+    cpu_seconds: float | None
+    size_bytes: int
+    ssim: float | None = None
+    psnr: float | None = None
+
+
+def sample_deal(appid: int) -> Deal:
+    return Deal(
+        appid=appid,
+        name=f"Benchmark Game {appid}: Definitive Edition",
+        header_image="",
+        original_price=5999,
+        final_price=1499,
+        currency="USD",
+        discount_percent=75,
+        discount_expiration=0,
+    )
+
+
+def generate_samples(work_dir: Path, seconds: int) -> list[Path]:
+    clips = []
+    for name, source in SAMPLE_SOURCES.items():
+        clip = work_dir / f"sample_{name}.mp4"
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-f",
+                "lavfi",
+                "-i",
+                source,
+                "-t",
+                str(seconds),
+                "-c:v",
+                "libx264",
+                "-preset",
+                "ultrafast",
+                "-qp",
+                "0",
+                "-pix_fmt",
+                "yuv420p",
+                str(clip),
+            ],
+            check=True,
+            capture_output=True,
+        )
+        clips.append(clip)
+    return clips
+
+
+def compare(distorted: Path, reference: Path) -> tuple[float | None, float | None]:
+    result = subprocess.run(
+        [
+            "ffmpeg",
+            "-i",
+            str(distorted),
+            "-i",
+            str(reference),
+            "-lavfi",
+            "[0:v]split[a][b];[1:v]split[c][d];[a][c]ssim;[b][d]psnr",
+            "-f",
+            "null",
+            "-",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    ssim = _SSIM_RE.findall(result.stderr)
+    psnr = _PSNR_RE.findall(result.stderr)
+    return (
+        float(ssim[-1]) if ssim else None,
+        (float("inf") if psnr[-1] == "inf" else float(psnr[-1])) if psnr else None,
+    )
+
+
+def make_pipeline(args, work_dir: Path, overlay: str, preset: str, crf: int, threads: int, fps: int) -> BenchPipeline:
+    pipeline = BenchPipeline(
+        output_dir=str(work_dir),
+        telegram_url="https://t.me/benchmark",
+        per_game_seconds=args.seconds,
+        font_path=args.font,
+        ffmpeg_threads=threads,
+        overlay_raster=overlay != "drawtext",
+        formats=args.formats,
+        preset=preset,
+        crf=crf,
+    )
+    pipeline.design = replace(pipeline.design, fps=fps, animate_overlay=overlay == "animated")
+    # Slow presets on a small machine must not trip the production timeouts.
+    pipeline.ffmpeg_segment_timeout_seconds = 1800
+    pipeline.ffmpeg_concat_timeout_seconds = 3600
+    return pipeline
+
+
+def result_for(stage: str, run: FfmpegRun, out: Path, overlay: str, preset: str, crf, threads: int, fps: int) -> Result:
+    return Result(
+        stage=stage,
+        overlay=overlay,
+        preset=preset,
+        crf=crf,
+        threads=threads,
+        fps=fps,
+        wall_seconds=run.wall_seconds,
+        encode_fps=run.frames / run.wall_seconds if run.wall_seconds else 0.0,
+        cpu_seconds=run.cpu_seconds,
+        size_bytes=out.stat().st_size,
+    )
+
+
+def bench_segments(args, work_dir: Path, clips: list[Path]) -> list[Result]:
+    # Game segments (background + game_overlay_filter / raster overlay), each
+    # compared against a lossless render of the same graph.
+    results = []
+    deal = sample_deal(1)
+    for overlay in args.overlays:
+        for fps in args.fps:
+            for clip in clips:
+                reference = work_dir / f"ref_{overlay}_{fps}_{clip.stem}.mp4"
+                make_pipeline(args, work_dir, overlay, "lossless", 0, 0, fps)._build_game_segment_from_trailer(
+                    str(clip), deal, reference
+                )
+                for preset in args.presets:
+                    for crf in args.crfs:
+                        for threads in args.threads:
+                            pipeline = make_pipeline(args, work_dir, overlay, preset, crf, threads, fps)
+                            out = work_dir / f"seg_{overlay}_{fps}_{preset}_{crf}_{threads}_{clip.stem}.mp4"
+                            pipeline._build_game_segment_from_trailer(str(clip), deal, out)
+                            result = result_for(f"game:{clip.stem.removeprefix('sample_')}", pipeline.last_run(), out, overlay, preset, crf, threads, fps)
+                            result.ssim, result.psnr = compare(out, reference)
+                            results.append(result)
+                            out.unlink()
+    return results
+
+
+def bench_intro_outro(args, work_dir: Path) -> list[Result]:
+    results = []
+    for overlay in args.overlays:
+        if overlay == "animated":
+            continue  # intro/outro are static either way
+        for preset in args.presets:
+            for threads in args.threads:
+                pipeline = make_pipeline(args, work_dir, overlay, preset, args.crfs[0], threads, args.fps[0])
+                for stage, build in (
+                    ("intro", lambda path: pipeline._build_intro(path, "2024-01-01")),
+                    ("outro", pipeline._build_outro),
+                ):
+                    out = work_dir / f"{stage}_{overlay}_{preset}_{threads}.mp4"
+                    build(out)
+                    results.append(
+                        result_for(stage, pipeline.last_run(), out, overlay, preset, args.crfs[0], threads, args.fps[0])
+                    )
+                    out.unlink()
+    return results
+
+
+def bench_concat(args, work_dir: Path, clips: list[Path]) -> list[Result]:
+    # The final lossy pass over lossless intermediates, which is what
+    # production does with SHORTS_SEGMENT_ENCODING=intermediate.
+    overlay = args.overlays[0]
+    fps = args.fps[0]
+    source = make_pipeline(args, work_dir, overlay, "lossless", 0, 0, fps)
+    segments = [work_dir / "concat_intro.mp4"]
+    source._build_intro(segments[0], "2024-01-01")
+    for idx in range(args.games):
+        seg = work_dir / f"concat_game_{idx}.mp4"
+        source._build_game_segment_from_trailer(str(clips[idx % len(clips)]), sample_deal(idx + 1), seg)
+        segments.append(seg)
+    segments.append(work_dir / "concat_outro.mp4")
+    source._build_outro(segments[-1])
+
+    reference = work_dir / "concat_reference.mp4"
+    source.concat_preset = "ultrafast"
+    source.concat_crf = 0
+    source._concat_with_transitions(segments, reference)
+
+    results = []
+    for preset in args.presets:
+        for crf in args.crfs:
+            for threads in args.threads:
+                pipeline = make_pipeline(args, work_dir, overlay, preset, crf, threads, fps)
+                pipeline.concat_preset = preset
+                pipeline.concat_crf = crf
+                pipeline.concat_threads = threads
+                out = work_dir / f"concat_{preset}_{crf}_{threads}.mp4"
+                pipeline._concat_with_transitions(segments, out)
+                result = result_for("concat", pipeline.last_run(), out, overlay, preset, crf, threads, fps)
+                result.ssim, result.psnr = compare(out, reference)
+                results.append(result)
+                out.unlink()
+    return results
+
+
+def print_table(results: list[Result]) -> None:
+    header = f"{'stage':<14} {'overlay':<9} {'preset':<10} {'crf':>3} {'thr':>3} {'fps':>3} {'wall s':>7} {'enc fps':>8} {'cpu s':>7} {'size KB':>8} {'SSIM':>7} {'PSNR':>6}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cpu = f"{r.cpu_seconds:.2f}" if r.cpu_seconds is not None else "-"
+        ssim = f"{r.ssim:.4f}" if r.ssim is not None else "-"
+        psnr = f"{r.psnr:.2f}" if r.psnr is not None else "-"
+        print(
+            f"{r.stage:<14} {r.overlay:<9} {r.preset:<10} {r.crf if r.crf is not None else '-':>3} {r.threads:>3} {r.fps:>3} "
+            f"{r.wall_seconds:>7.2f} {r.encode_fps:>8.1f} {cpu:>7} {r.size_bytes / 1024:>8.0f} {ssim:>7} {psnr:>6}"
+        )
+
+
+def _csv(cast):
+    return lambda value: [cast(part) for part in value.split(",") if part.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Render lavfi sample clips through the ShortsDesign filters and the concat pass "
+        "across x264 presets, CRF values, thread counts and overlay modes."
+    )
+    parser.add_argument("--presets", type=_csv(str), default=["ultrafast", "veryfast", "fast"])
+    parser.add_argument("--crfs", type=_csv(int), default=[20, 23])
+    parser.add_argument("--threads", type=_csv(int), default=[2])
+    parser.add_argument("--fps", type=_csv(int), default=[30])
+    parser.add_argument(
+        "--overlays",
+        type=_csv(str),
+        default=["raster", "drawtext"],
+        help="raster (PNG overlay), animated (raster with slide/fade), drawtext (per-frame filters)",
+    )
+    parser.add_argument("--formats", type=_csv(str), default=["shorts"])
+    parser.add_argument("--seconds", type=int, default=4, help="length of one game segment")
+    parser.add_argument("--games", type=int, default=3, help="game segments in the concat scenario")
+    parser.add_argument("--font", default="/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf")
+    parser.add_argument("--scenario", choices=("all", "segments", "intro", "concat"), default="all")
+    parser.add_argument("--json", type=Path, help="also write the results here, one JSON object per line")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        raise SystemExit("ffmpeg and ffprobe are required")
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="encbench_"))
+    try:
+        clips = generate_samples(work_dir, args.seconds * 3)
+        results: list[Result] = []
+        if args.scenario in ("all", "segments"):
+            results += bench_segments(args, work_dir, clips)
+        if args.scenario in ("all", "intro"):
+            results += bench_intro_outro(args, work_dir)
+        if args.scenario in ("all", "concat"):
+            results += bench_concat(args, work_dir, clips)
+        print_table(results)
+        if args.json:
+            with args.json.open("w", encoding="utf-8") as fh:
+                for result in results:
+                    fh.write(json.dumps(result.__dict__) + "\n")
+    finally:
+        if args.keep:
+            print(f"work dir: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+@dataclass
+class FakeBotApiConfig:
+    latency_seconds: float = 0.05
+    latency_jitter_seconds: float = 0.02
+    # Chance that a request gets an injected 429 / 500, regardless of pace.
+    rate_429: float = 0.0
+    retry_after_seconds: int = 1
+    failure_rate: float = 0.0
+    # Flood control the server enforces on its own, like the real Bot API.
+    # Media group items are billed as separate messages.
+    global_per_second: float = 30.0
+    chat_per_second: float = 1.0
+    chat_per_minute: float = 20.0
+    # Slack for request arrival jitter (connection setup, thread wake-ups).
+    flood_tolerance_seconds: float = 0.02
+
+
+@dataclass
+class FakeBotApiStats:
+    requests: dict[str, int] = field(default_factory=dict)
+    ok: int = 0
+    messages: int = 0
+    injected_429: int = 0
+    flood_429: int = 0
+    failures: int = 0
+    first_request_at: float | None = None
+    last_request_at: float | None = None
+
+
+class _LeakyBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.level = 0.0
+        self.updated_at = time.monotonic()
+
+    def try_add(self, cost: float, tolerance_seconds: float) -> float:
+        # Returns 0 when accepted, otherwise seconds until `cost` would fit.
+        now = time.monotonic()
+        self.level = max(self.level - (now - self.updated_at) * self.rate, 0.0)
+        self.updated_at = now
+        if self.level + cost <= self.capacity + tolerance_seconds * self.rate:
+            self.level += cost
+            return 0.0
+        return (self.level + cost - self.capacity) / self.rate
+
+
+class FakeBotApi:
+    def __init__(self, config: FakeBotApiConfig | None = None, host: str = "127.0.0.1", port: int = 0, seed: int = 1):
+        self.config = config or FakeBotApiConfig()
+        self.stats = FakeBotApiStats()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._global = _LeakyBucket(self.config.global_per_second, self.config.global_per_second)
+        self._chat_second: dict[str, _LeakyBucket] = {}
+        self._chat_minute: dict[str, _LeakyBucket] = {}
+        self._file_counter = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeBotApi":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = FakeBotApiStats()
+
+    def __enter__(self) -> "FakeBotApi":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def handle(self, method: str, fields: dict[str, str]) -> tuple[int, dict]:
+        # Limits are judged on arrival, then the response is held back for
+        # the simulated latency.
+        status, payload, delay = self._decide(method, fields)
+        time.sleep(delay)
+        return status, payload
+
+    def _decide(self, method: str, fields: dict[str, str]) -> tuple[int, dict, float]:
+        config = self.config
+        chat_id = fields.get("chat_id", "")
+        media = json.loads(fields["media"]) if method == "sendMediaGroup" and fields.get("media") else []
+        cost = max(len(media), 1)
+
+        with self._lock:
+            delay = max(config.latency_seconds + self._random.uniform(-1, 1) * config.latency_jitter_seconds, 0.0)
+            stats = self.stats
+            now = time.monotonic()
+            stats.requests[method] = stats.requests.get(method, 0) + 1
+            stats.first_request_at = stats.first_request_at or now
+            stats.last_request_at = now
+
+            if method not in ("sendMediaGroup", "sendPhoto", "sendMessage"):
+                return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}, delay
+            if not chat_id:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: chat_id is empty"}, delay
+            if method == "sendMediaGroup" and not 2 <= len(media) <= 10:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: wrong media group size"}, delay
+
+            if self._random.random() < config.rate_429:
+                stats.injected_429 += 1
+                return 429, self._too_many_requests(config.retry_after_seconds), delay
+            if self._random.random() < config.failure_rate:
+                stats.failures += 1
+                return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}, delay
+
+            wait_seconds = self._check_flood(chat_id, cost)
+            if wait_seconds > 0:
+                stats.flood_429 += 1
+                return 429, self._too_many_requests(max(int(wait_seconds + 0.999), 1)), delay
+
+            stats.ok += 1
+            stats.messages += cost
+            if method == "sendPhoto":
+                return 200, {"ok": True, "result": self._message(chat_id, "photo")}, delay
+            if method == "sendMessage":
+                return 200, {"ok": True, "result": self._message(chat_id, "text")}, delay
+            return 200, {"ok": True, "result": [self._message(chat_id, item.get("type", "photo")) for item in media]}, delay
+
+    def _check_flood(self, chat_id: str, cost: int) -> float:
+        config = self.config
+        per_second = self._chat_second.setdefault(chat_id, _LeakyBucket(config.chat_per_second, 1.0))
+        per_minute = self._chat_minute.setdefault(
+            chat_id, _LeakyBucket(config.chat_per_minute / 60.0, config.chat_per_minute)
+        )
+        # Check all buckets before charging any, so a rejected request costs nothing.
+        snapshot = [(bucket, bucket.level, bucket.updated_at) for bucket in (self._global, per_second, per_minute)]
+        waits = [
+            self._global.try_add(cost, config.flood_tolerance_seconds),
+            per_second.try_add(1, config.flood_tolerance_seconds),
+            per_minute.try_add(cost, config.flood_tolerance_seconds),
+        ]
+        if any(waits):
+            for bucket, level, updated_at in snapshot:
+                bucket.level, bucket.updated_at = level, updated_at
+        return max(waits)
+
+    def _message(self, chat_id: str, media_type: str) -> dict:
+        self._file_counter += 1
+        file_id = f"fake-{media_type}-{self._file_counter}"
+        message: dict = {"message_id": self._file_counter, "chat": {"id": chat_id}, "date": int(time.time())}
+        if media_type == "video":
+            message["video"] = {"file_id": file_id, "file_unique_id": file_id}
+        elif media_type == "text":
+            message["text"] = "caption"
+        else:
+            message["photo"] = [
+                {"file_id": f"{file_id}-s", "file_unique_id": f"{file_id}-s", "width": 90, "height": 51},
+                {"file_id": file_id, "file_unique_id": file_id, "width": 460, "height": 215},
+            ]
+        return message
+
+    @staticmethod
+    def _too_many_requests(retry_after: int) -> dict:
+        return {
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        }
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                api.logger.debug(format, *args)
+
+            def do_POST(self):
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length", "0") or 0)
+                body = self.rfile.read(length)
+                status, payload = api.handle(method, _parse_fields(self.headers.get("Content-Type", ""), body))
+                raw = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+        return Handler
+
+
+def _parse_fields(content_type: str, body: bytes) -> dict[str, str]:
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=default_policy).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+        )
+        fields: dict[str, str] = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name and part.get_filename() is None:
+                fields[name] = part.get_content()
+        return fields
+    return {key: values[-1] for key, values in parse_qs(body.decode("utf-8"), keep_blank_values=True).items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Telegram Bot API (sendMediaGroup/sendPhoto/sendMessage).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--global-per-second", type=float, default=30.0)
+    parser.add_argument("--chat-per-second", type=float, default=1.0)
+    parser.add_argument("--chat-per-minute", type=float, default=20.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    api = FakeBotApi(
+        FakeBotApiConfig(
+            latency_seconds=args.latency,
+            latency_jitter_seconds=args.jitter,
+            rate_429=args.rate_429,
+            retry_after_seconds=args.retry_after,
+            failure_rate=args.failure_rate,
+            global_per_second=args.global_per_second,
+            chat_per_second=args.chat_per_second,
+            chat_per_minute=args.chat_per_minute,
+        ),
+        host=args.host,
+        port=args.port,
+    )
+    logging.getLogger("fake_bot_api").info("Fake Bot API listening on %s (TELEGRAM_API_BASE_URL)", api.base_url)
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
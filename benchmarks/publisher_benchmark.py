@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import threading
+import time
+from dataclasses import asdict
+
+from app.outbox_worker import OutboxPublisher
+from app.publish_queue import TelegramPublishQueue
+from app.rate_limit import TelegramRateLimiter
+from app.repository import OutboxPost
+from app.service import DiscountWatcherService
+from app.steam import Deal, DealMedia
+from app.telegram_client import TelegramChannel, TelegramPublisher
+from benchmarks.fake_bot_api import FakeBotApi, FakeBotApiConfig
+
+
+class InstrumentedRateLimiter(TelegramRateLimiter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waited_seconds = 0.0
+        self.penalties = 0
+        self._stats_lock = threading.Lock()
+
+    def acquire(self, chat_id: str, cost: int = 1) -> float:
+        delay = super().acquire(chat_id, cost)
+        with self._stats_lock:
+            self.waited_seconds += delay
+        return delay
+
+    def penalize(self, chat_id: str, retry_after: float) -> None:
+        with self._stats_lock:
+            self.penalties += 1
+        super().penalize(chat_id, retry_after)
+
+
+class InMemoryRepository:
+    # Just enough of StateRepository for DiscountWatcherService and
+    # OutboxPublisher, so the benchmark needs no Postgres.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.posted: set[tuple[int, int, int]] = set()
+        self.outbox: dict[int, dict] = {}
+        self.file_ids: dict[str, tuple[str, str]] = {}
+
+    def cleanup_expired_records(self) -> tuple[int, int, int, int, int]:
+        return 0, 0, 0, 0, 0
+
+    def get_blocked_appids(self) -> set[int]:
+        return set()
+
+    def upsert_blocked_appids(self, appids: set[int], source: str = "curator") -> int:
+        return 0
+
+    def was_posted(self, appid: int, discount_expiration: int, final_price: int) -> bool:
+        return (appid, discount_expiration, final_price) in self.posted
+
+    def mark_posted(self, appid: int, discount_expiration: int, final_price: int) -> None:
+        self.posted.add((appid, discount_expiration, final_price))
+
+    def enqueue_post(self, deal: Deal, chat_ids: list[str]) -> int:
+        with self._lock:
+            queued = 0
+            for chat_id in chat_ids:
+                key = (deal.appid, deal.discount_expiration, deal.final_price, chat_id)
+                if any(row["key"] == key for row in self.outbox.values()):
+                    continue
+                self.outbox[len(self.outbox) + 1] = {
+                    "key": key,
+                    "deal": asdict(deal),
+                    "chat_id": chat_id,
+                    "status": "pending",
+                    "attempts": 0,
+                    "next_attempt_at": 0.0,
+                }
+                queued += 1
+            return queued
+
+    def claim_outbox_posts(
+        self, limit: int, lease_seconds: int, exclude_chat_ids=None, exclude_ids=None, chat_ids=None
+    ) -> list[OutboxPost]:
+        now = time.monotonic()
+        with self._lock:
+            posts = []
+            for post_id, row in self.outbox.items():
+                if len(posts) >= limit:
+                    break
+                if row["status"] != "pending" or row["next_attempt_at"] > now:
+                    continue
+                if row["chat_id"] in (exclude_chat_ids or []) or post_id in (exclude_ids or []):
+                    continue
+                if chat_ids is not None and row["chat_id"] not in chat_ids:
+                    continue
+                row["status"] = "sending"
+                row["attempts"] += 1
+                posts.append(OutboxPost(post_id, row["chat_id"], Deal(**row["deal"]), row["attempts"]))
+            return posts
+
+    def renew_outbox_leases(self, post_ids: list[int], lease_seconds: int) -> None:
+        pass
+
+    def complete_outbox_post(self, post: OutboxPost) -> None:
+        with self._lock:
+            self.outbox[post.id]["status"] = "sent"
+            deal = post.deal
+            self.posted.add((deal.appid, deal.discount_expiration, deal.final_price))
+
+    def fail_outbox_post(self, post: OutboxPost, error: str, retry_in_seconds: float) -> None:
+        with self._lock:
+            row = self.outbox[post.id]
+            row["status"] = "pending"
+            row["next_attempt_at"] = time.monotonic() + retry_in_seconds
+
+    def drop_outbox_post(self, post: OutboxPost, reason: str) -> None:
+        with self._lock:
+            self.outbox[post.id]["status"] = "dropped"
+
+    def pending_outbox(self) -> int:
+        with self._lock:
+            return sum(1 for row in self.outbox.values() if row["status"] in ("pending", "sending"))
+
+    def get_telegram_file_ids(self, source_urls: list[str]) -> dict[str, str]:
+        with self._lock:
+            return {url: self.file_ids[url][1] for url in source_urls if url in self.file_ids}
+
+    def save_telegram_file_ids(self, file_ids: dict[str, tuple[str, str]]) -> None:
+        with self._lock:
+            self.file_ids.update(file_ids)
+
+    def delete_telegram_file_ids(self, source_urls: list[str]) -> None:
+        with self._lock:
+            for url in source_urls:
+                self.file_ids.pop(url, None)
+
+
+class FakeSteam:
+    def __init__(self, deals: int, media_latency_seconds: float):
+        self.deals = deals
+        self.media_latency_seconds = media_latency_seconds
+
+    def fetch_special_deals(self) -> list[Deal]:
+        return [
+            Deal(
+                appid=1000 + idx,
+                name=f"Benchmark Game {idx}",
+                header_image=f"https://cdn.example/apps/{1000 + idx}/header.jpg",
+                original_price=1999,
+                final_price=499,
+                currency="USD",
+                discount_percent=75,
+                discount_expiration=int(time.time()) + 86400,
+            )
+            for idx in range(self.deals)
+        ]
+
+    def fetch_deal_media(self, appid: int) -> DealMedia:
+        time.sleep(self.media_latency_seconds)
+        trailer = f"https://cdn.example/apps/{appid}/movie480.mp4"
+        return DealMedia(
+            trailer_url=trailer,
+            trailer_urls=[trailer],
+            image_urls=[f"https://cdn.example/apps/{appid}/ss_{n}.jpg" for n in range(4)],
+        )
+
+
+def ideal_seconds(posts_per_chat: int, chats: int, cost: int, args) -> float:
+    # Lower bound from the limits alone (GCRA: full burst, then the rate).
+    messages = posts_per_chat * cost
+    per_minute = max(messages - args.chat_per_minute, 0) / (args.chat_per_minute / 60.0)
+    per_second = max(posts_per_chat - 1, 0) / args.chat_per_second
+    overall = max(messages * chats - args.global_per_second, 0) / args.global_per_second
+    return max(per_minute, per_second, overall)
+
+
+def build_publisher(api: FakeBotApi, args, repository: InMemoryRepository) -> TelegramPublisher:
+    return TelegramPublisher(
+        bot_token="benchmark",
+        channels=[TelegramChannel(chat_id=f"-100{idx}") for idx in range(args.chats)],
+        api_base_url=api.base_url,
+        max_retries=args.max_retries,
+        extra_images_count=2,
+        rate_limiter=InstrumentedRateLimiter(
+            global_per_second=args.global_per_second,
+            chat_per_second=args.chat_per_second,
+            chat_per_minute=args.chat_per_minute,
+        ),
+        file_id_store=repository,
+    )
+
+
+def report(title: str, api: FakeBotApi, limiter: InstrumentedRateLimiter, posts: int, elapsed: float, ideal: float) -> None:
+    stats = api.stats
+    requests_total = sum(stats.requests.values())
+    print(f"\n== {title}")
+    print(f"posts delivered        : {posts} in {elapsed:.2f}s -> {posts / elapsed if elapsed else 0:.2f} posts/s")
+    print(f"limit-bound ideal      : {ideal:.2f}s (efficiency {ideal / elapsed if elapsed else 0:.0%})")
+    print(f"requests               : {requests_total} {stats.requests}")
+    print(f"retry overhead         : {requests_total - stats.ok} extra requests ({(requests_total - stats.ok) / max(stats.ok, 1):.1%})")
+    print(f"429 injected / flood   : {stats.injected_429} / {stats.flood_429}")
+    print(f"5xx injected           : {stats.failures}")
+    # Injected errors cost their own waits on top of the limit-bound ideal.
+    print(f"injected back-off      : ~{stats.injected_429 * api.config.retry_after_seconds + stats.failures * 2}s")
+    print(f"limiter wait (summed)  : {limiter.waited_seconds:.2f}s, 429 penalties {limiter.penalties}")
+    if stats.flood_429:
+        print("WARNING: the publisher tripped flood control")
+
+
+def bench_publish_queue(args) -> None:
+    repository = InMemoryRepository()
+    steam = FakeSteam(args.deals, media_latency_seconds=0.0)
+    with FakeBotApi(_api_config(args)) as api:
+        publisher = build_publisher(api, args, repository)
+        queue = TelegramPublishQueue(publisher, prefetch_workers=args.prefetch_workers)
+        deals = steam.fetch_special_deals()
+        media = {deal.appid: steam.fetch_deal_media(deal.appid) for deal in deals}
+        started = time.monotonic()
+        futures = [queue.submit(deal, lambda deal=deal: media[deal.appid]) for deal in deals]
+        delivered = 0
+        for future in futures:
+            try:
+                results = future.result()
+            except Exception:
+                continue
+            delivered += sum(1 for error in results.values() if error is None)
+        elapsed = time.monotonic() - started
+        queue.close()
+        report(
+            "publish queue (per-chat lanes, no outbox)",
+            api,
+            publisher.rate_limiter,
+            delivered,
+            elapsed,
+            ideal_seconds(args.deals, args.chats, 4, args),
+        )
+
+
+def bench_service_loop(args) -> None:
+    repository = InMemoryRepository()
+    steam = FakeSteam(args.deals, media_latency_seconds=args.media_latency)
+    with FakeBotApi(_api_config(args)) as api:
+        publisher = build_publisher(api, args, repository)
+        queue = TelegramPublishQueue(publisher, prefetch_workers=args.prefetch_workers)
+        service = DiscountWatcherService(
+            steam=steam,
+            repository=repository,
+            telegram=publisher,
+            min_discount_percent=10,
+            max_posts_per_run=args.deals,
+        )
+        worker = OutboxPublisher(
+            repository=repository,
+            steam=steam,
+            telegram=publisher,
+            publish_queue=queue,
+            batch_size=args.batch_size,
+            poll_seconds=0.05,
+            backoff_base_seconds=1.0,
+            backoff_max_seconds=2.0,
+        )
+
+        started = time.monotonic()
+        service.run_once()
+        run_once_elapsed = time.monotonic() - started
+        while repository.pending_outbox():
+            if not worker.drain_once():
+                time.sleep(0.05)
+        worker.flush()
+        elapsed = time.monotonic() - started
+        queue.close()
+
+        sent = sum(1 for row in repository.outbox.values() if row["status"] == "sent")
+        print(f"\nrun_once (poll + enqueue) took {run_once_elapsed * 1000:.1f}ms")
+        report(
+            "service loop (run_once + outbox publisher)",
+            api,
+            publisher.rate_limiter,
+            sent,
+            elapsed,
+            ideal_seconds(args.deals, args.chats, 4, args),
+        )
+
+
+def _api_config(args) -> FakeBotApiConfig:
+    return FakeBotApiConfig(
+        latency_seconds=args.latency,
+        latency_jitter_seconds=args.jitter,
+        rate_429=args.rate_429,
+        retry_after_seconds=args.retry_after,
+        failure_rate=args.failure_rate,
+        global_per_second=args.global_per_second,
+        chat_per_second=args.chat_per_second,
+        chat_per_minute=args.chat_per_minute,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="TelegramPublisher throughput against a local fake Bot API.")
+    parser.add_argument("--deals", type=int, default=30)
+    parser.add_argument("--chats", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.08)
+    parser.add_argument("--jitter", type=float, default=0.03)
+    parser.add_argument("--media-latency", type=float, default=0.15)
+    parser.add_argument("--rate-429", type=float, default=0.03)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--prefetch-workers", type=int, default=2)
+    # Limits are scaled up from the real 30/s, 1/s, 20/min so a run takes
+    # seconds; the fake server enforces the same values.
+    parser.add_argument("--global-per-second", type=float, default=30.0)
+    parser.add_argument("--chat-per-second", type=float, default=10.0)
+    parser.add_argument("--chat-per-minute", type=float, default=1200.0)
+    parser.add_argument("--scenario", choices=("all", "publish", "service"), default="all")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    if args.scenario in ("all", "publish"):
+        bench_publish_queue(args)
+    if args.scenario in ("all", "service"):
+        bench_service_loop(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import time
+
+from app.service import AsyncDiscountWatcherService, DiscountWatcherService
+from app.steam import Deal
+from app.telegram_client import TelegramChannel
+from benchmarks.publisher_benchmark import FakeSteam, InMemoryRepository
+
+
+class SlowRepository(InMemoryRepository):
+    # Every call costs one simulated Postgres round trip (each
+    # StateRepository method opens its own connection).
+    def __init__(self, latency_seconds: float):
+        super().__init__()
+        self.latency_seconds = latency_seconds
+
+    def _round_trip(self) -> None:
+        time.sleep(self.latency_seconds)
+
+    def cleanup_expired_records(self) -> tuple[int, int, int, int, int]:
+        self._round_trip()
+        return super().cleanup_expired_records()
+
+    def get_blocked_appids(self) -> set[int]:
+        self._round_trip()
+        return super().get_blocked_appids()
+
+    def upsert_blocked_appids(self, appids: set[int], source: str = "curator") -> int:
+        self._round_trip()
+        return super().upsert_blocked_appids(appids, source)
+
+    def was_posted(self, appid: int, discount_expiration: int, final_price: int) -> bool:
+        self._round_trip()
+        return super().was_posted(appid, discount_expiration, final_price)
+
+    def enqueue_post(self, deal: Deal, chat_ids: list[str]) -> int:
+        self._round_trip()
+        return super().enqueue_post(deal, chat_ids)
+
+    def enqueue_video_job(self, job_date: str, deals: list[Deal]) -> bool:
+        self._round_trip()
+        return True
+
+
+class SlowSteam(FakeSteam):
+    def __init__(self, deals: int, featured_latency_seconds: float):
+        super().__init__(deals, media_latency_seconds=0.0)
+        self.featured_latency_seconds = featured_latency_seconds
+        # Fixed once, so the expirations match across runs.
+        self.featured = super().fetch_special_deals()
+
+    def fetch_special_deals(self) -> list[Deal]:
+        time.sleep(self.featured_latency_seconds)
+        return list(self.featured)
+
+
+class SlowCuratorBlocklist:
+    # Stands in for CuratorBlocklistGroup waiting on a due refresh.
+    def __init__(self, latency_seconds: float, appids: set[int]):
+        self.latency_seconds = latency_seconds
+        self.appids = appids
+
+    def get_attributed_appids(self) -> dict[int, str]:
+        time.sleep(self.latency_seconds)
+        return {appid: "benchmark" for appid in self.appids}
+
+
+class FakeTelegram:
+    def __init__(self, chats: int):
+        self.channels = [TelegramChannel(chat_id=f"-100{idx}") for idx in range(chats)]
+
+
+def build_service(service_class, args, steam: SlowSteam, repository: InMemoryRepository):
+    return service_class(
+        steam=steam,
+        repository=repository,
+        telegram=FakeTelegram(args.chats),
+        min_discount_percent=10,
+        max_posts_per_run=args.max_posts,
+        shorts_enabled=True,
+        curator_blocklist=SlowCuratorBlocklist(args.curator_latency, {1000 + idx for idx in range(0, args.deals, 7)}),
+    )
+
+
+def measure(service_class, args, warm: bool) -> tuple[list[float], int]:
+    # warm: every deal is already posted, so a run is mostly was_posted
+    # lookups (the common case between sales); cold: everything is queued.
+    timings = []
+    queued = 0
+    for _ in range(args.runs):
+        steam = SlowSteam(args.deals, args.steam_latency)
+        repository = SlowRepository(args.db_latency)
+        if warm:
+            for deal in steam.featured:
+                repository.mark_posted(deal.appid, deal.discount_expiration, deal.final_price)
+        service = build_service(service_class, args, steam, repository)
+        started = time.monotonic()
+        queued = service.run_once()
+        timings.append(time.monotonic() - started)
+    return timings, queued
+
+
+def report(title: str, timings: list[float], queued: int, baseline: list[float] | None = None) -> None:
+    mean = statistics.mean(timings)
+    print(f"\n== {title}")
+    print(f"queued per run         : {queued}")
+    print(
+        f"run_once latency       : mean {mean * 1000:.0f}ms, p50 {statistics.median(timings) * 1000:.0f}ms, "
+        f"max {max(timings) * 1000:.0f}ms over {len(timings)} runs"
+    )
+    if baseline:
+        print(f"speedup vs sequential  : {statistics.mean(baseline) / mean:.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="End-to-end run_once latency of DiscountWatcherService against AsyncDiscountWatcherService."
+    )
+    parser.add_argument("--deals", type=int, default=60)
+    parser.add_argument("--max-posts", type=int, default=10)
+    parser.add_argument("--chats", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--db-latency", type=float, default=0.01, help="seconds per repository call")
+    parser.add_argument("--steam-latency", type=float, default=0.4, help="featured categories request")
+    parser.add_argument("--curator-latency", type=float, default=0.3, help="curator blocklist refresh wait")
+    parser.add_argument("--scenario", choices=("all", "cold", "warm"), default="all")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    for warm in (False, True):
+        name = "warm" if warm else "cold"
+        if args.scenario not in ("all", name):
+            continue
+        sequential, queued = measure(DiscountWatcherService, args, warm)
+        report(f"{name}: DiscountWatcherService (sequential)", sequential, queued)
+        overlapped, queued = measure(AsyncDiscountWatcherService, args, warm)
+        report(f"{name}: AsyncDiscountWatcherService (overlapped)", overlapped, queued, sequential)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,21 @@
 import logging
+import sys
+import threading
 import time
 
 from app.config import load_settings
-from app.curator_blocklist import SteamCuratorBlocklist
+from app.curator_blocklist import CuratorBlocklistGroup
+from app.media_preflight import MediaPreflight
+from app.outbox_worker import OutboxPublisher
 from app.pipelines.tiktok import TikTokPipeline
+from app.pipelines.trailer_cache import TrailerTranscoder
+from app.publish_queue import TelegramPublishQueue
+from app.rate_limit import TelegramRateLimiter
 from app.repository import StateRepository
-from app.service import DiscountWatcherService
+from app.service import AsyncDiscountWatcherService, DiscountWatcherService
 from app.steam import SteamClient
-from app.telegram_client import TelegramPublisher
+from app.telegram_client import TelegramChannel, TelegramPublisher, parse_channels
+from app.video_worker import VideoWorker
 
 
 def configure_logging(level: str) -> None:
@@ -17,59 +25,149 @@ def configure_logging(level: str) -> None:
     )
 
 
+ROLES = ("all", "watcher", "publisher", "video")
+
+
 def main() -> None:
+    role = sys.argv[1] if len(sys.argv) > 1 else "all"
+    if role not in ROLES:
+        raise SystemExit(f"Unknown role {role!r}, expected one of: {', '.join(ROLES)}")
+
     settings = load_settings()
     configure_logging(settings.log_level)
 
-    if not settings.dry_run and (not settings.telegram_bot_token or not settings.telegram_chat_id):
-        raise RuntimeError("TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID are required when DRY_RUN=false")
+    channels = parse_channels(settings.telegram_channels)
+    if settings.telegram_chat_id and all(channel.chat_id != settings.telegram_chat_id for channel in channels):
+        channels.insert(0, TelegramChannel(chat_id=settings.telegram_chat_id))
+    if not settings.dry_run and (not settings.telegram_bot_token or not channels):
+        raise RuntimeError("TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID or TELEGRAM_CHANNELS are required when DRY_RUN=false")
 
     steam = SteamClient(country=settings.steam_country, language=settings.steam_language)
     repository = StateRepository(
         database_url=settings.database_url,
         retention_days=settings.retention_days,
     )
-    curator_blocklist = SteamCuratorBlocklist(
-        curator_url=settings.curator_blocklist_url,
+    curator_blocklist = CuratorBlocklistGroup(
+        curator_urls=list(settings.curator_blocklist_urls),
         refresh_seconds=settings.curator_blocklist_refresh_seconds,
         max_pages=settings.curator_blocklist_max_pages,
+        wait_seconds=settings.curator_blocklist_wait_seconds,
+    )
+    trailer_transcoder = (
+        TrailerTranscoder(
+            cache_dir=settings.trailer_cache_dir,
+            max_seconds=settings.trailer_max_seconds,
+            max_workers=settings.trailer_transcode_workers,
+            retry_seconds=settings.trailer_transcode_retry_seconds,
+        )
+        if settings.trailer_transcode_enabled
+        else None
     )
     telegram = TelegramPublisher(
         bot_token=settings.telegram_bot_token,
-        chat_id=settings.telegram_chat_id,
+        channels=channels,
         parse_mode=settings.telegram_parse_mode,
+        api_base_url=settings.telegram_api_base_url,
         usd_to_uah_rate=settings.usd_to_uah_rate,
         include_trailer=settings.telegram_include_trailer,
         extra_images_count=settings.telegram_extra_images_count,
         max_retries=settings.telegram_max_retries,
+        rate_limiter=TelegramRateLimiter(
+            global_per_second=settings.telegram_global_messages_per_second,
+            chat_per_second=settings.telegram_chat_messages_per_second,
+            chat_per_minute=settings.telegram_chat_messages_per_minute,
+        ),
+        file_id_store=repository,
+        media_preflight=(
+            MediaPreflight(ttl_seconds=settings.telegram_media_preflight_ttl_seconds)
+            if settings.telegram_media_preflight
+            else None
+        ),
+        trailer_transcoder=trailer_transcoder,
     )
-    shorts_pipeline = TikTokPipeline(
-        output_dir=settings.shorts_output_dir,
-        telegram_url=settings.shorts_cta_telegram_url,
-        per_game_seconds=settings.shorts_per_game_seconds,
-        intro_seconds=settings.shorts_intro_seconds,
-        outro_seconds=settings.shorts_outro_seconds,
-        trailer_fallback_start_seconds=settings.shorts_trailer_fallback_start_seconds,
-        timezone_name=settings.shorts_timezone,
-        font_path=settings.shorts_font_path,
-    )
+    publish_queue = TelegramPublishQueue(telegram, prefetch_workers=settings.telegram_prefetch_workers)
+    video_worker = None
+    # Draft renders are previews, so they also run with DRY_RUN=true.
+    render_videos = settings.shorts_enabled and (not settings.dry_run or settings.shorts_draft != "off")
+    if render_videos and role in ("all", "video"):
+        shorts_pipeline = TikTokPipeline(
+            output_dir=settings.shorts_output_dir,
+            telegram_url=settings.shorts_cta_telegram_url,
+            per_game_seconds=settings.shorts_per_game_seconds,
+            intro_seconds=settings.shorts_intro_seconds,
+            outro_seconds=settings.shorts_outro_seconds,
+            trailer_fallback_start_seconds=settings.shorts_trailer_fallback_start_seconds,
+            timezone_name=settings.shorts_timezone,
+            font_path=settings.shorts_font_path,
+            trailer_transcoder=trailer_transcoder,
+            render_workers=settings.shorts_render_workers,
+            ffmpeg_threads=settings.shorts_ffmpeg_threads,
+            segment_cache_mb=settings.shorts_segment_cache_mb,
+            segment_encoding=settings.shorts_segment_encoding,
+            overlay_raster=settings.shorts_overlay_raster,
+            intro_prerender_days=settings.shorts_intro_prerender_days,
+            formats=list(settings.shorts_formats),
+            build_budget_seconds=settings.shorts_build_budget_seconds,
+            max_video_seconds=settings.shorts_max_video_seconds,
+            draft=settings.shorts_draft,
+        )
+        video_worker = VideoWorker(
+            repository=repository,
+            steam=steam,
+            pipeline=shorts_pipeline,
+            poll_seconds=settings.video_worker_poll_seconds,
+            lease_seconds=settings.video_job_lease_seconds,
+            max_attempts=settings.video_job_max_attempts,
+            retry_seconds=settings.video_job_retry_seconds,
+            nice=settings.video_worker_nice,
+        )
 
-    service = DiscountWatcherService(
+    service_class = AsyncDiscountWatcherService if settings.watcher_async else DiscountWatcherService
+    service = service_class(
         steam=steam,
         repository=repository,
         telegram=telegram,
         min_discount_percent=settings.min_discount_percent,
         max_posts_per_run=settings.max_posts_per_run,
-        post_delay_seconds=settings.post_delay_seconds,
-        shorts_pipeline=shorts_pipeline,
         shorts_enabled=settings.shorts_enabled,
+        shorts_timezone=settings.shorts_timezone,
+        shorts_draft=settings.shorts_draft != "off",
         curator_blocklist=curator_blocklist,
         manual_blocklist_appids=settings.manual_blocklist_appids,
         dry_run=settings.dry_run,
     )
+    outbox_publisher = OutboxPublisher(
+        repository=repository,
+        steam=steam,
+        telegram=telegram,
+        publish_queue=publish_queue,
+        batch_size=settings.outbox_batch_size,
+        poll_seconds=settings.outbox_poll_seconds,
+        lease_seconds=settings.outbox_lease_seconds,
+        max_attempts=settings.outbox_max_attempts,
+        backoff_base_seconds=settings.outbox_backoff_base_seconds,
+        backoff_max_seconds=settings.outbox_backoff_max_seconds,
+        breaker_failure_threshold=settings.outbox_breaker_failures,
+        breaker_reset_seconds=settings.outbox_breaker_reset_seconds,
+    )
 
     logger = logging.getLogger("main")
-    logger.info("steam_watcher started. poll_interval=%ss", settings.poll_interval_seconds)
+    if role == "publisher":
+        logger.info("steam_watcher outbox publisher started")
+        outbox_publisher.run_forever()
+        return
+    if role == "video":
+        if video_worker is None:
+            raise SystemExit("The video role needs SHORTS_ENABLED=true and DRY_RUN=false or SHORTS_DRAFT")
+        logger.info("steam_watcher video worker started")
+        video_worker.run_forever()
+        return
+    if role == "all" and not settings.dry_run:
+        threading.Thread(target=outbox_publisher.run_forever, name="outbox-publisher", daemon=True).start()
+    if role == "all" and video_worker is not None:
+        threading.Thread(target=video_worker.run_forever, name="video-worker", daemon=True).start()
+
+    logger.info("steam_watcher started. role=%s poll_interval=%ss", role, settings.poll_interval_seconds)
 
     while True:
         try: